@@ -0,0 +1,238 @@
+"""
+Admission control for the analysis endpoints
+
+An analysis can run for minutes and spends LLM and upstream API quota, so
+the API bounds how many run at once instead of letting a burst time out
+together:
+
+- a concurrency gate: at most ADMISSION_MAX_CONCURRENT analyses run; the
+  next ones wait in a FIFO queue and learn their position
+- a bounded queue: beyond ADMISSION_QUEUE_SIZE waiting requests (or
+  ADMISSION_QUEUE_PER_CLIENT from one client) new ones are rejected at once
+  with 503/429, and a request waiting longer than ADMISSION_QUEUE_TIMEOUT
+  gives up with 503
+- a token bucket per client: RATE_LIMIT_PER_MINUTE sustained with bursts of
+  RATE_LIMIT_BURST; over the limit the answer is 429 with Retry-After
+
+Clients are told apart by IP address (the first X-Forwarded-For hop when
+ADMISSION_TRUST_PROXY=true). Limits apply per API worker process.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict
+
+from agent.instrumentation import metrics
+
+metrics.describe("admission_rejected_total", "counter", "Analysis requests rejected by admission control")
+metrics.describe("admission_wait_seconds", "histogram", "Time spent in the admission queue")
+
+
+class AdmissionRejected(Exception):
+    """Request refused; status_code and retry_after map to the HTTP response"""
+
+    def __init__(self, status_code: int, reason: str, message: str, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `burst` stored"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume a token; returns 0 on success, else seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Ticket:
+    """A request's place in the admission queue"""
+
+    def __init__(self, client: str, granted: asyncio.Future):
+        self.client = client
+        self.granted = granted
+        self.enqueued = time.monotonic()
+        self.position = 0
+        self.waited = 0.0
+
+
+class AdmissionController:
+    """
+    Concurrency gate with FIFO queue and per-client token buckets
+    """
+
+    def __init__(self):
+        self.max_concurrent = max(1, int(os.getenv("ADMISSION_MAX_CONCURRENT", "4")))
+        self.max_queue = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+        self.per_client_queue = int(os.getenv("ADMISSION_QUEUE_PER_CLIENT", "4"))
+        self.queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+        self.rate = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20")) / 60.0
+        self.burst = float(os.getenv("RATE_LIMIT_BURST", "5"))
+        self.trust_proxy = os.getenv("ADMISSION_TRUST_PROXY", "false").lower() == "true"
+
+        self.active = 0
+        self._queue: Deque[Ticket] = deque()
+        self._queued_by_client: Dict[str, int] = {}
+        # Idle buckets are full again; keep only the most recent clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._max_buckets = 10000
+
+        self.admitted = 0
+        self.rejected = 0
+        self._avg_run = 30.0  # seconds, smoothed; sizes Retry-After under load
+
+    def client_id(self, request) -> str:
+        if self.trust_proxy:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "unknown"
+
+    def _reject(self, status_code: int, reason: str, message: str, retry_after: float):
+        self.rejected += 1
+        metrics.inc("admission_rejected_total", labels={"reason": reason})
+        raise AdmissionRejected(status_code, reason, message, retry_after)
+
+    def check_rate(self, client: str) -> None:
+        """Charge one request to the client's bucket (429 when empty)"""
+        if self.rate <= 0:
+            return
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self._max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        wait = bucket.take()
+        if wait > 0:
+            self._reject(429, "rate_limit", "Troppe richieste: limite per client superato", wait)
+
+    def _queue_eta(self, position: int) -> float:
+        return position * self._avg_run / self.max_concurrent
+
+    def _check_capacity(self, client: str) -> None:
+        if self.active < self.max_concurrent and not self._queue:
+            return
+        if len(self._queue) >= self.max_queue:
+            self._reject(503, "queue_full", "Server occupato: coda piena", self._queue_eta(len(self._queue)))
+        if self._queued_by_client.get(client, 0) >= self.per_client_queue:
+            self._reject(429, "client_queue", "Troppe richieste in coda per questo client",
+                         self._queue_eta(len(self._queue)))
+
+    def precheck(self, client: str) -> None:
+        """Rate limit and queue capacity, checked before a streaming response starts"""
+        self.check_rate(client)
+        self._check_capacity(client)
+
+    def enqueue(self, client: str) -> Ticket:
+        """Take a slot now or a place in the queue; raises AdmissionRejected if neither"""
+        ticket = Ticket(client, asyncio.get_running_loop().create_future())
+        if self.active < self.max_concurrent and not self._queue:
+            self.active += 1
+            ticket.granted.set_result(True)
+            return ticket
+        self._check_capacity(client)
+        self._queue.append(ticket)
+        self._queued_by_client[client] = self._queued_by_client.get(client, 0) + 1
+        ticket.position = len(self._queue)
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the queue, 0 once admitted"""
+        if ticket.granted.done():
+            return 0
+        for index, queued in enumerate(self._queue, 1):
+            if queued is ticket:
+                return index
+        return 0
+
+    def _dequeue(self, ticket: Ticket) -> None:
+        try:
+            self._queue.remove(ticket)
+        except ValueError:
+            return
+        self._forget_client(ticket.client)
+
+    def _forget_client(self, client: str) -> None:
+        count = self._queued_by_client.get(client, 0) - 1
+        if count > 0:
+            self._queued_by_client[client] = count
+        else:
+            self._queued_by_client.pop(client, None)
+
+    async def wait(self, ticket: Ticket, timeout: float) -> bool:
+        """Wait up to timeout seconds for the ticket's turn; True once admitted"""
+        if not ticket.granted.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.granted), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return ticket.granted.done()
+
+    def leave(self, ticket: Ticket) -> None:
+        """Give back the slot (or the queue place) held by the ticket"""
+        if not ticket.granted.done():
+            self._dequeue(ticket)
+            ticket.granted.cancel()
+            return
+        if ticket.granted.cancelled():
+            return
+        run = time.monotonic() - ticket.enqueued - ticket.waited
+        self._avg_run = 0.9 * self._avg_run + 0.1 * run
+        # Hand the slot straight to the head of the queue (FIFO)
+        while self._queue:
+            head = self._queue.popleft()
+            self._forget_client(head.client)
+            if not head.granted.done():
+                head.granted.set_result(True)
+                return
+        self.active -= 1
+
+    def mark_admitted(self, ticket: Ticket) -> None:
+        """Record that the ticket's request starts running (wait time and stats)"""
+        ticket.waited = time.monotonic() - ticket.enqueued
+        self.admitted += 1
+        metrics.observe("admission_wait_seconds", ticket.waited)
+
+    def expire(self, ticket: Ticket) -> None:
+        """Give up a ticket that waited queue_timeout: frees its place and raises the 503"""
+        self.leave(ticket)
+        self._reject(503, "queue_timeout", "Server occupato: attesa in coda scaduta", self._avg_run)
+
+    async def wait_admitted(self, ticket: Ticket) -> None:
+        """Wait for the ticket's turn or reject with 503 after queue_timeout"""
+        if not await self.wait(ticket, self.queue_timeout):
+            self.expire(ticket)
+        self.mark_admitted(ticket)
+
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "queued": len(self._queue),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_run_seconds": round(self._avg_run, 2),
+            "rate_per_minute": round(self.rate * 60, 2),
+            "burst": self.burst,
+        }
+
+
+admission = AdmissionController()
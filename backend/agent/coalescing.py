@@ -0,0 +1,171 @@
+"""
+Coalescing of identical in-flight analysis requests
+
+When a market event hits, many users send the same question within seconds.
+Instead of one agent run each, the first request (leader) starts the run
+and identical requests arriving while it is in flight (followers) attach to
+it: every subscriber receives the same event sequence - replayed from the
+start for late joiners - and the same final report.
+
+A run only coalesces with requests of the same kind (/api/analyze or
+/api/analyze/stream), since the two publish different event sequences; it
+belongs to no single client, so it keeps going while anyone is listening
+and is cancelled when the last subscriber goes away.
+
+Configuration (environment variables):
+- COALESCE_ENABLED: "true" (default) / "false"
+- COALESCE_WINDOW: seconds after its start during which a run accepts new
+  followers (default 60; later requests start a fresh run)
+- COALESCE_NORMALIZATION: how queries are compared
+  - "exact": byte for byte
+  - "whitespace" (default): case- and whitespace-insensitive
+  - "semantic": canonical token set of the semantic answer cache, so
+    "BTC liquidazioni ora" and "liquidazioni btc adesso" share a run
+The endpoint kind and the context dict are always part of the key.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from agent.instrumentation import metrics
+
+metrics.describe("coalesce_requests_total", "counter", "Analysis requests by coalescing role (leader runs, follower attaches)")
+
+NORMALIZATIONS = ("exact", "whitespace", "semantic")
+
+
+def normalize_query(query: str, mode: str) -> str:
+    if mode == "exact":
+        return query
+    if mode == "semantic":
+        # Imported here: pulls in the crypto tool's alias tables
+        from agent.semantic_cache import normalize_query as tokens
+        return " ".join(sorted(set(tokens(query))))
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+class Flight:
+    """One in-flight run and the events it has published so far"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.started = time.monotonic()
+        self.events: List[Dict] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.followers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event: Dict) -> None:
+        async with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Dict]:
+        """All events from the start of the run, then live ones until it ends"""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                async with self._changed:
+                    await self._changed.wait_for(lambda: index < len(self.events) or self.done)
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self.task is not None:
+                # Nobody is listening any more: stop the agent
+                self.task.cancel()
+
+
+class RequestCoalescer:
+    """
+    Registry of in-flight runs keyed on kind + normalized query + context
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+        self.window = float(os.getenv("COALESCE_WINDOW", "60"))
+        self.normalization = os.getenv("COALESCE_NORMALIZATION", "whitespace").lower()
+        if self.normalization not in NORMALIZATIONS:
+            print(f"Warning: unknown COALESCE_NORMALIZATION '{self.normalization}', using 'whitespace'")
+            self.normalization = "whitespace"
+
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def key(self, kind: str, query: str, context: Optional[Dict] = None) -> str:
+        """kind names the event shape of the run (e.g. "analyze", "stream")"""
+        context_key = json.dumps(context, sort_keys=True, default=str) if context else ""
+        return kind + "\x00" + normalize_query(query, self.normalization) + "\x00" + context_key
+
+    def join(self, key: str) -> Optional[Flight]:
+        """The in-flight run for key if it still accepts followers"""
+        if not self.enabled:
+            return None
+        flight = self._flights.get(key)
+        if flight is None or flight.done or time.monotonic() - flight.started > self.window:
+            return None
+        flight.followers += 1
+        self.followers += 1
+        metrics.inc("coalesce_requests_total", labels={"role": "follower"})
+        return flight
+
+    def start(self, key: str, source: Callable[[], AsyncIterator[Dict]]) -> Flight:
+        """Run source() in the background and publish its events to a new Flight"""
+        flight = Flight(key)
+        if self.enabled:
+            # A newer run replaces one that is past its window
+            self._flights[key] = flight
+        self.leaders += 1
+        metrics.inc("coalesce_requests_total", labels={"role": "leader"})
+        flight.task = asyncio.create_task(self._run(flight, source))
+        return flight
+
+    async def _run(self, flight: Flight, source: Callable[[], AsyncIterator[Dict]]) -> None:
+        events = source()
+        error: Optional[BaseException] = None
+        try:
+            async for event in events:
+                await flight.publish(event)
+        except asyncio.CancelledError:
+            # Last subscriber gone or shutdown; a late joiner must not inherit the cancel
+            error = RuntimeError("Analisi annullata")
+        except Exception as e:
+            error = e
+        finally:
+            await events.aclose()
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            await flight.finish(error)
+
+    def stats(self) -> Dict:
+        total = self.leaders + self.followers
+        return {
+            "enabled": self.enabled,
+            "window": self.window,
+            "normalization": self.normalization,
+            "in_flight": len(self._flights),
+            "runs": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_rate": round(self.followers / total, 4) if total else 0.0,
+        }
+
+
+coalescer = RequestCoalescer()
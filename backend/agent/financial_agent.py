@@ -2,19 +2,33 @@
 Financial Agent using LangChain for multi-source analysis
 """
 import os
+import time
+import asyncio
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from langchain.agents import AgentExecutor, create_tool_calling_agent
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import Tool
 from langchain_core.messages import HumanMessage, AIMessage
 
 from tools.pdf_reader import PDFReaderTool
 from tools.news_scraper import NewsScraperTool
-from tools.crypto_data import CryptoDataTool
+from tools.crypto_data import CryptoDataTool, extract_symbols
 from tools.economic_calendar import EconomicCalendarTool
-from tools.database import DatabaseTool
+from tools.database import AnalysisWriter, DatabaseTool
+from tools.indicators import IndicatorTool
+from tools.pdf_workers import load_pdf_libraries, pdf_pool
+
+from agent.instrumentation import RequestInstrumentation
+from agent.intent_router import IntentRouter, Route
+from agent.llm_cache import LLMResponseCache
+from agent.semantic_cache import SemanticCache
+from agent.tool_runtime import StepTimingHandler, bounded_tool, request_tool_limit
+
+# AgentExecutor output when max_iterations / max_execution_time cut the run short
+AGENT_STOPPED_PREFIX = "Agent stopped"
+# Tools report failures as text starting with this (e.g. "Errore nel recuperare ...")
+TOOL_ERROR_PREFIX = "Errore"
 
 class FinancialAgent:
     """
@@ -25,6 +39,9 @@ class FinancialAgent:
         # Support multiple LLM providers
         llm_provider = os.getenv("LLM_PROVIDER", "openai").lower()
         
+        # Repeated agent states (same prompt, same tool observations) skip the provider call
+        self.llm_cache = LLMResponseCache() if os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true" else None
+        
         if llm_provider == "gemini":
             # Google Gemini (FREE tier available)
             from langchain_google_genai import ChatGoogleGenerativeAI
@@ -34,7 +51,8 @@ class FinancialAgent:
             self.llm = ChatGoogleGenerativeAI(
                 model="gemini-pro",
                 temperature=0.3,
-                google_api_key=api_key
+                google_api_key=api_key,
+                cache=self.llm_cache
             )
         elif llm_provider == "groq":
             # Groq (FREE tier, very fast)
@@ -46,27 +64,52 @@ class FinancialAgent:
                 model="llama-3.1-8b-instant",  # Faster and more reliable for function calling
                 temperature=0.3,
                 groq_api_key=api_key,
-                max_tokens=4096  # Increase token limit for better responses
+                max_tokens=4096,  # Increase token limit for better responses
+                cache=self.llm_cache
             )
         else:
             # Default: OpenAI
+            from langchain_openai import ChatOpenAI
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise ValueError("OPENAI_API_KEY non trovata nelle variabili ambiente")
             self.llm = ChatOpenAI(
                 model="gpt-3.5-turbo",  # More affordable than gpt-4-turbo
                 temperature=0.3,
-                api_key=api_key
+                api_key=api_key,
+                cache=self.llm_cache
             )
         
+        # Step-by-step AgentExecutor output on stdout (timings are always collected)
+        self.verbose = os.getenv("AGENT_VERBOSE", "false").lower() == "true"
+        
         # Initialize tools
-        self.tools = [
+        self.database = DatabaseTool()
+        news = NewsScraperTool()
+        crypto_data = CryptoDataTool()
+        calendar = EconomicCalendarTool()
+        # Tools from one LLM turn run concurrently, bounded per request
+        self.tools = [bounded_tool(tool) for tool in [
             PDFReaderTool().get_tool(),
-            NewsScraperTool().get_tool(),
-            CryptoDataTool().get_tool(),
-            EconomicCalendarTool().get_tool(),
-            DatabaseTool().get_tool(),
-        ]
+            news.get_tool(),
+            crypto_data.get_tool(),
+            calendar.get_tool(),
+            self.database.get_tool(),
+            IndicatorTool(self.database.timeseries).get_tool(),
+        ]]
+        
+        # Structured queries ("funding BTC", "calendario oggi") skip the LLM
+        self.router = IntentRouter({
+            crypto_data.name: crypto_data.aget_crypto_data,
+            calendar.name: calendar.aget_calendar,
+            news.name: news.ascrape_news,
+        })
+        
+        # Completed analyses are persisted off the request path
+        self.writer = AnalysisWriter(self.database.pool)
+        
+        # Near-duplicate queries are answered from recent reports
+        self.answer_cache = SemanticCache() if os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true" else None
         
         # Create agent prompt (simplified for Groq compatibility)
         if llm_provider == "groq":
@@ -110,11 +153,14 @@ Sii preciso, obiettivo e basati sempre sui dati raccolti."""
             self.agent_executor = AgentExecutor(
                 agent=self.agent,
                 tools=self.tools,
-                verbose=True,
+                verbose=self.verbose,
                 max_iterations=10 if llm_provider == "groq" else 15,  # Fewer iterations for Groq
                 handle_parsing_errors="Check your output and make sure it conforms!",
-                return_intermediate_steps=False,
-                max_execution_time=300  # 5 minutes timeout
+                return_intermediate_steps=True,  # tool names become the report sources
+                max_execution_time=300,  # 5 minutes timeout
+                # Plan through ainvoke so the LLM cache is consulted; tokens still
+                # stream through callbacks on a miss
+                stream_runnable=self.llm_cache is None
             )
         except Exception as e:
             # Fallback for older LangChain versions
@@ -124,7 +170,7 @@ Sii preciso, obiettivo e basati sempre sui dati raccolti."""
                     tools=self.tools,
                     llm=self.llm,
                     agent=AgentType.OPENAI_FUNCTIONS,
-                    verbose=True,
+                    verbose=self.verbose,
                     max_iterations=15,
                     handle_parsing_errors=True
                 )
@@ -133,10 +179,97 @@ Sii preciso, obiettivo e basati sempre sui dati raccolti."""
                 print(f"Warning: Could not create agent, using fallback. Error: {e2}")
                 self.agent_executor = None
     
-    async def analyze(self, query: str, context: Optional[Dict] = None) -> Dict:
+    def _persist(self, query: str, report: str, sources: List[str], started: float):
+        """Hand a completed analysis to the background writer"""
+        symbols = extract_symbols(query)
+        self.writer.enqueue(
+            symbols[0] if symbols else "",
+            query,
+            report,
+            sources,
+            int((time.perf_counter() - started) * 1000)
+        )
+    
+    def close(self):
+        """Flush pending writes (called on application shutdown)"""
+        self.writer.stop()
+    
+    async def warm_up(self, ping: bool = False) -> Dict[str, float]:
+        """
+        Pay the one-off costs before the first user does: lazily imported
+        parsers, PDF worker processes and, with ping=True, one tiny LLM call
+        that opens the provider connection. Returns seconds per phase.
+        """
+        timings = {}
+        
+        def load_parsers():
+            load_pdf_libraries()
+            import bs4  # noqa: F401
+        
+        phase = time.perf_counter()
+        await asyncio.to_thread(load_parsers)
+        timings["parsers"] = round(time.perf_counter() - phase, 3)
+        
+        phase = time.perf_counter()
+        await asyncio.to_thread(pdf_pool.warm)
+        timings["pdf_workers"] = round(time.perf_counter() - phase, 3)
+        
+        if ping:
+            phase = time.perf_counter()
+            # Unique text so the LLM cache cannot answer it
+            await self.llm.ainvoke([HumanMessage(content=f"Rispondi solo 'ok' ({time.time():.0f})")])
+            timings["llm_ping"] = round(time.perf_counter() - phase, 3)
+        return timings
+    
+    def _cacheable(self, report: Optional[str], tool_outputs: List) -> bool:
+        """
+        Whether an agent answer may be reused for similar queries: the run
+        finished on its own and at least one tool returned data
+        """
+        if not report or report.startswith(AGENT_STOPPED_PREFIX):
+            return False
+        return any(output is not None and not str(output).startswith(TOOL_ERROR_PREFIX) for output in tool_outputs)
+    
+    async def _fast_path(self, route, query: str, instrumentation: RequestInstrumentation,
+                         started: float, on_tool=None) -> Dict:
+        """Run a routed query without the agent (see agent.intent_router)"""
+        def record(name: str, tool_input: str, output: str, seconds: float, ok: bool):
+            instrumentation.record_tool(name, seconds, ok)
+            if on_tool is not None:
+                on_tool(name, tool_input, output, seconds, ok)
+        
+        result = await self.router.run(route, on_tool=record)
+        self._persist(query, result["report"], result["sources"], started)
+        return {
+            **result,
+            "timestamp": datetime.now().isoformat(),
+            "cache": "MISS",
+            "route": {"path": "fast", "intents": route.intents, "confidence": route.confidence},
+            "timings": instrumentation.finish(answer_cache="FAST"),
+        }
+    
+    def route(self, query: str, context: Optional[Dict] = None) -> Route:
+        """Intent router decision for a query, counted in router_decisions_total"""
+        route = self.router.route(query, context)
+        self.router.record(route)
+        return route
+    
+    async def analyze(self, query: str, context: Optional[Dict] = None, route: Optional[Route] = None) -> Dict:
         """
         Main analysis method
+        Structured queries are answered by the intent router, the rest by the agent;
+        pass route when the caller already routed the query (see route())
         """
+        started = time.perf_counter()
+        instrumentation = RequestInstrumentation()
+        route = route or self.route(query, context)
+        if route.fast:
+            return await self._fast_path(route, query, instrumentation, started)
+        if self.answer_cache is not None:
+            cached = self.answer_cache.lookup(query, context)
+            if cached is not None:
+                return {**cached, "cache": "HIT", "timings": instrumentation.finish(answer_cache="HIT")}
+        
         try:
             if self.agent_executor is None:
                 return {
@@ -147,13 +280,16 @@ Sii preciso, obiettivo e basati sempre sui dati raccolti."""
             
             # Execute agent
             if hasattr(self.agent_executor, 'ainvoke'):
-                result = await self.agent_executor.ainvoke({
-                    "input": query,
-                    "chat_history": []
-                })
+                timing = StepTimingHandler()
+                with request_tool_limit():
+                    result = await self.agent_executor.ainvoke(
+                        {"input": query, "chat_history": []},
+                        config={"callbacks": [timing, instrumentation]}
+                    )
+                timing.close_step()
             elif hasattr(self.agent_executor, 'run'):
-                # Fallback for sync execution
-                result = self.agent_executor.run(query)
+                # Fallback for sync execution (off the event loop)
+                result = await asyncio.to_thread(self.agent_executor.run, query)
                 result = {"output": result}
             else:
                 return {
@@ -163,18 +299,142 @@ Sii preciso, obiettivo e basati sempre sui dati raccolti."""
                 }
             
             report = result.get("output", "Analisi completata.")
+            steps = result.get("intermediate_steps", [])
+            sources = result.get("sources") or sorted({action.tool for action, _ in steps})
+            self._persist(query, report, sources, started)
             
-            return {
+            response = {
                 "report": report,
-                "sources": result.get("sources", []),
+                "sources": sources,
                 "timestamp": datetime.now().isoformat()
             }
+            if self.answer_cache is not None and self._cacheable(result.get("output"), [output for _, output in steps]):
+                self.answer_cache.store(query, context, response)
+            return {**response, "cache": "MISS", "timings": instrumentation.finish()}
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
             return {
                 "report": f"Errore durante l'analisi: {str(e)}\n\nDettagli: {error_details}",
                 "sources": [],
+                "timestamp": datetime.now().isoformat(),
+                "timings": instrumentation.finish("error")
+            }
+    
+    async def astream(self, query: str, context: Optional[Dict] = None,
+                      route: Optional[Route] = None) -> AsyncIterator[Dict]:
+        """
+        Streaming analysis: yields tool progress events and LLM tokens as they are produced
+        
+        Event types: start, tool_start, tool_end, token, final, error.
+        Closing the generator (e.g. on client disconnect) cancels the remaining agent work.
+        """
+        started = time.perf_counter()
+        instrumentation = RequestInstrumentation()
+        yield {"type": "start", "timestamp": datetime.now().isoformat()}
+        
+        route = route or self.route(query, context)
+        if route.fast:
+            for name, tool_input in route.calls:
+                yield {"type": "tool_start", "tool": name, "input": tool_input}
+            
+            finished: asyncio.Queue = asyncio.Queue()
+            
+            def on_tool(name: str, tool_input: str, output: str, seconds: float, ok: bool):
+                finished.put_nowait({
+                    "type": "tool_end",
+                    "tool": name,
+                    "output": str(output)[:500],
+                    "seconds": round(seconds, 3),
+                    "ok": ok,
+                })
+            
+            task = asyncio.ensure_future(self._fast_path(route, query, instrumentation, started, on_tool=on_tool))
+            try:
+                # tool_end as each tool finishes, until the report is ready
+                while True:
+                    getter = asyncio.ensure_future(finished.get())
+                    await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        break
+                    yield getter.result()
+                while not finished.empty():
+                    yield finished.get_nowait()
+                result = task.result()
+            finally:
+                task.cancel()
+            yield {"type": "final", **result}
+            return
+        
+        if self.answer_cache is not None:
+            cached = self.answer_cache.lookup(query, context)
+            if cached is not None:
+                yield {"type": "final", **cached, "cache": "HIT", "timings": instrumentation.finish(answer_cache="HIT")}
+                return
+        
+        if self.agent_executor is None or not hasattr(self.agent_executor, "astream_events"):
+            result = await self.analyze(query, context)
+            yield {"type": "final", **result}
+            return
+        
+        try:
+            report = None
+            sources = []
+            tool_outputs = []
+            timing = StepTimingHandler()
+            with request_tool_limit():
+                events = self.agent_executor.astream_events(
+                    {"input": query, "chat_history": []},
+                    config={"callbacks": [timing, instrumentation]},
+                    version="v2"
+                )
+                async for event in events:
+                    kind = event["event"]
+                
+                    if kind == "on_chat_model_stream":
+                        content = event["data"]["chunk"].content
+                        if isinstance(content, str) and content:
+                            yield {"type": "token", "content": content}
+                    elif kind == "on_tool_end":
+                        output = event["data"].get("output")
+                        tool_outputs.append(output)
+                        yield {
+                            "type": "tool_end",
+                            "tool": event["name"],
+                            "output": str(output)[:500] if output is not None else "",
+                        }
+                    elif kind == "on_chain_stream" and not event.get("parent_ids"):
+                        # Top-level AgentExecutor chunks: planned actions and the final output
+                        chunk = event["data"].get("chunk") or {}
+                        for action in chunk.get("actions", []):
+                            if action.tool not in sources:
+                                sources.append(action.tool)
+                            yield {
+                                "type": "tool_start",
+                                "tool": action.tool,
+                                "input": action.tool_input,
+                            }
+                        if "output" in chunk:
+                            report = chunk["output"]
+            timing.close_step()
+            
+            # Only reached when the run was not closed or cancelled mid-stream
+            cacheable = self._cacheable(report, tool_outputs)
+            report = report or "Analisi completata."
+            self._persist(query, report, sorted(sources), started)
+            response = {
+                "report": report,
+                "sources": sorted(sources),
+                "timestamp": datetime.now().isoformat()
+            }
+            if self.answer_cache is not None and cacheable:
+                self.answer_cache.store(query, context, response)
+            yield {"type": "final", **response, "cache": "MISS", "timings": instrumentation.finish()}
+        except Exception as e:
+            instrumentation.finish("error")
+            yield {
+                "type": "error",
+                "message": f"Errore durante l'analisi: {str(e)}",
                 "timestamp": datetime.now().isoformat()
             }
-
@@ -0,0 +1,227 @@
+"""
+Per-request instrumentation of the agent pipeline
+
+RequestInstrumentation is a LangChain callback handler attached to every
+analysis run. It records each LLM iteration (latency, prompt/completion
+tokens, LLM cache hit) and each tool call (latency, outcome) and feeds the
+process-wide metrics registry, rendered in the Prometheus text format by
+the /metrics endpoint. The same data is returned per request as `timings`.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from tools.cache import cache_stats
+
+# Seconds; covers cache hits (ms) up to the 300 s agent timeout
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+class MetricsRegistry:
+    """
+    Minimal thread-safe counters and histograms with Prometheus text output
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # name -> labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            slots = series.get(key)
+            if slots is None:
+                slots = series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    slots[i] += 1
+            slots[-2] += value
+            slots[-1] += 1
+
+    def _header(self, lines: List[str], name: str, default_kind: str) -> None:
+        kind, help_text = self._help.get(name, (default_kind, ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for key, slots in sorted(series.items()):
+                    for bound, count in zip(self.buckets, slots):
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count:g}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {slots[-1]:g}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {slots[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {slots[-1]:g}")
+
+        # Cache counters are kept by the caches themselves; export them as gauges
+        gauges: Dict[str, List[str]] = {}
+        for cache_name, stats in cache_stats().items():
+            for field, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges.setdefault(f"cache_{field}", []).append(
+                        f"cache_{field}{_format_labels((('cache', cache_name),))} {value:g}"
+                    )
+        for name, samples in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("agent_requests_total", "counter", "Analysis requests by outcome and answer-cache result")
+metrics.describe("agent_request_seconds", "histogram", "Wall time of an analysis request")
+metrics.describe("agent_llm_calls_total", "counter", "LLM iterations, by LLM cache result")
+metrics.describe("agent_llm_call_seconds", "histogram", "Latency of one LLM iteration")
+metrics.describe("agent_llm_tokens_total", "counter", "Tokens sent to / received from the LLM provider")
+metrics.describe("agent_tool_calls_total", "counter", "Tool calls by tool and outcome")
+metrics.describe("agent_tool_seconds", "histogram", "Latency of one tool call")
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    """(prompt, completion) tokens reported by the provider, 0 if unknown"""
+    prompt = completion = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt += usage.get("input_tokens", 0)
+                completion += usage.get("output_tokens", 0)
+    if not (prompt or completion):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return prompt, completion
+
+
+def _is_cache_hit(response: LLMResult) -> bool:
+    return any(
+        (generation.generation_info or {}).get("cache_hit")
+        for generations in response.generations for generation in generations
+    )
+
+
+class RequestInstrumentation(AsyncCallbackHandler):
+    """
+    Callback collecting LLM and tool timings for one analysis request
+    """
+
+    def __init__(self, registry: MetricsRegistry = metrics):
+        self.registry = registry
+        self.started = time.perf_counter()
+        self.llm_calls: List[Dict] = []
+        self.tool_calls: List[Dict] = []
+        self._llm_started: Dict[UUID, float] = {}
+        self._tool_started: Dict[UUID, Tuple[str, float]] = {}
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._llm_started[run_id] = time.perf_counter()
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._llm_started[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._llm_started.pop(run_id, None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        prompt, completion = _token_usage(response)
+        cache_hit = _is_cache_hit(response)
+        self.llm_calls.append({
+            "iteration": len(self.llm_calls) + 1,
+            "seconds": round(seconds, 3),
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "cache_hit": cache_hit,
+        })
+        cache = {"cache": "hit" if cache_hit else "miss"}
+        self.registry.inc("agent_llm_calls_total", labels=cache)
+        self.registry.observe("agent_llm_call_seconds", seconds, labels=cache)
+        if not cache_hit:
+            self.registry.inc("agent_llm_tokens_total", prompt, labels={"kind": "prompt"})
+            self.registry.inc("agent_llm_tokens_total", completion, labels={"kind": "completion"})
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._llm_started.pop(run_id, None)
+        if started is not None:
+            self.registry.inc("agent_llm_calls_total", labels={"cache": "error"})
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._tool_started[run_id] = (serialized.get("name", "tool"), time.perf_counter())
+
+    async def _tool_done(self, run_id: UUID, ok: bool) -> None:
+        name, started = self._tool_started.pop(run_id, ("tool", None))
+        if started is not None:
+            self.record_tool(name, time.perf_counter() - started, ok)
+
+    def record_tool(self, name: str, seconds: float, ok: bool) -> None:
+        """Tool call made outside LangChain callbacks (e.g. the fast-path router)"""
+        self.tool_calls.append({"tool": name, "seconds": round(seconds, 3), "ok": ok})
+        self.registry.inc("agent_tool_calls_total", labels={"tool": name, "outcome": "ok" if ok else "error"})
+        self.registry.observe("agent_tool_seconds", seconds, labels={"tool": name})
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        await self._tool_done(run_id, True)
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        await self._tool_done(run_id, False)
+
+    def finish(self, outcome: str = "ok", answer_cache: str = "MISS") -> Dict:
+        """Record the request totals; returns the `timings` summary"""
+        total = time.perf_counter() - self.started
+        self.registry.inc("agent_requests_total", labels={"outcome": outcome, "cache": answer_cache.lower()})
+        self.registry.observe("agent_request_seconds", total, labels={"cache": answer_cache.lower()})
+        llm_seconds = sum(call["seconds"] for call in self.llm_calls)
+        return {
+            "total_seconds": round(total, 3),
+            "answer_cache": answer_cache,
+            "llm_seconds": round(llm_seconds, 3),
+            "llm_iterations": len(self.llm_calls),
+            "llm_cache_hits": sum(1 for call in self.llm_calls if call["cache_hit"]),
+            # Tokens actually billed: LLM cache hits are excluded
+            "prompt_tokens": sum(call["prompt_tokens"] for call in self.llm_calls if not call["cache_hit"]),
+            "completion_tokens": sum(call["completion_tokens"] for call in self.llm_calls if not call["cache_hit"]),
+            "tool_seconds": round(sum(call["seconds"] for call in self.tool_calls), 3),
+            "llm_calls": self.llm_calls,
+            "tools": self.tool_calls,
+        }
@@ -0,0 +1,270 @@
+"""
+Deterministic fast path for structured queries
+
+"funding BTC" or "calendario oggi" need exactly one tool and no reasoning,
+yet through the agent they cost two or more LLM round-trips. The router
+looks at the query before the agent does:
+
+1. rules extract what is asked - coins, metrics (funding, open interest,
+   liquidations, flows), calendar day, news - from the same canonical tokens
+   the semantic cache uses
+2. a small naive Bayes classifier, trained at import on the examples below,
+   estimates how likely the query needs the agent ("open": analysis,
+   opinions, explanations)
+3. coverage is the share of tokens the rules understood; anything they
+   cannot account for ("perché", "dovrei comprare") lowers it. Time
+   qualifiers only count when a calendar call uses them: "BTC oi trend last
+   week" asks for history a market snapshot cannot give, so it goes to the agent
+
+When rules found something to do and confidence = min(coverage, 1 - P(open))
+reaches ROUTER_MIN_CONFIDENCE, the tools are called directly and in parallel
+and the report is rendered from templates. Otherwise the full agent runs.
+
+Configuration (environment variables):
+- ROUTER_ENABLED: "true" (default) / "false"
+- ROUTER_MIN_CONFIDENCE: 0..1, default 0.7
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from agent.instrumentation import metrics
+from agent.semantic_cache import normalize_query
+from tools.crypto_data import DATA_TYPE_ALIASES, KNOWN_COINS, extract_symbols
+
+metrics.describe("router_decisions_total", "counter", "Queries answered by the fast path or sent to the agent")
+
+# Canonical query tokens (see semantic_cache.normalize_query) -> crypto_data type
+METRIC_TOKENS = {
+    "funding": "funding",
+    "open_interest": "open_interest",
+    "liquidation": "liquidation",
+    "flows": "flows",
+    "exchange_flows": "flows",
+    **DATA_TYPE_ALIASES,
+}
+CALENDAR_TOKENS = {"calendar", "economic", "economico", "macro"}
+DAY_TOKENS = {"today": "today", "now": "today", "tomorrow": "tomorrow", "week": "this_week"}
+# Periods and trends: only the calendar can answer them, market data and
+# news are current snapshots
+PERIOD_TOKENS = {
+    "month", "yesterday", "ieri", "giorni", "giorno", "days", "day", "ore", "hours", "trend", "trends",
+    "andamento", "storico", "history", "historical", "7d", "30d", "1w", "1m", "mensile", "settimanale",
+}
+# Qualifiers a snapshot already satisfies (liquidations and OI change are 24h figures)
+SNAPSHOT_QUALIFIERS = {"now", "today", "24h", "h24"}
+NEWS_TOKENS = {"news", "headline", "headlines", "titoli"}
+
+# Understood but carrying no request of their own
+FILLER_TOKENS = {
+    "rate", "rates", "dati", "data", "mostra", "show", "get", "quanto", "quant", "e", "ed", "questa",
+    "this", "ultime", "ultimi", "latest", "last", "crypto", "cripto", "o", "or",
+    "interest", "open", "usdt", "perp", "perps", "su", "sul", "sulla", "oggi", "c", "ce", "sono",
+    "there", "favore", "upcoming", "prossimi", "prossime", "next", "exchange", "tutti", "all",
+}
+
+# Words that always mean the question needs reasoning
+OPEN_TOKENS = {
+    "analysis", "perche", "why", "should", "dovrei", "consiglio", "conviene", "previsione",
+    "forecast", "strategia", "strategy", "spiega", "explain", "confronta", "compare", "sentiment",
+    "impatto", "impact", "rischio", "rischi", "risk", "happening", "outlook", "comprare", "vendere",
+    "buy", "sell", "report", "opinione", "pensi", "think",
+}
+
+TRAINING = [
+    ("market", "funding BTC"), ("market", "funding rate ETH"), ("market", "open interest SOL"),
+    ("market", "OI BTC"), ("market", "liquidazioni BTC"), ("market", "liquidazioni ETH ultime 24h"),
+    ("market", "BTC ETH funding oi"), ("market", "exchange flows BTC"), ("market", "liquidations BTC now"),
+    ("market", "dati funding e open interest bitcoin"), ("market", "funding SOL adesso"),
+    ("calendar", "calendario oggi"), ("calendar", "calendario economico domani"),
+    ("calendar", "eventi macro questa settimana"), ("calendar", "economic calendar today"),
+    ("calendar", "eventi di oggi"), ("calendar", "calendario 2024-05-01"),
+    ("news", "news bitcoin"), ("news", "notizie ETH"), ("news", "ultime news crypto"), ("news", "news fed"),
+    ("open", "analisi BTC oggi"), ("open", "cosa succede a bitcoin"), ("open", "dovrei comprare ETH"),
+    ("open", "perché BTC scende"), ("open", "report completo mercato crypto"),
+    ("open", "outlook macro e impatto su BTC"), ("open", "confronta BTC ed ETH"),
+    ("open", "sentiment di mercato"), ("open", "spiega il funding negativo"),
+    ("open", "previsione prezzo solana"), ("open", "cosa pensi del mercato"),
+    ("open", "strategia per la settimana"), ("open", "rischi macro per crypto"),
+]
+
+
+def _features(tokens: List[str]) -> List[str]:
+    return ["<coin>" if token.upper() in KNOWN_COINS else token for token in tokens]
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes with Laplace smoothing over canonical tokens"""
+
+    def __init__(self, examples: List[Tuple[str, str]]):
+        self.classes = sorted({label for label, _ in examples})
+        self.word_counts = {label: Counter() for label in self.classes}
+        self.doc_counts = Counter(label for label, _ in examples)
+        for label, text in examples:
+            self.word_counts[label].update(_features(normalize_query(text)))
+        self.vocabulary = set().union(*self.word_counts.values())
+        self.totals = {label: sum(counts.values()) for label, counts in self.word_counts.items()}
+
+    def predict(self, tokens: List[str]) -> Dict[str, float]:
+        """Posterior probability per class"""
+        features = _features(tokens)
+        scores = {}
+        for label in self.classes:
+            score = math.log(self.doc_counts[label] / sum(self.doc_counts.values()))
+            denominator = self.totals[label] + len(self.vocabulary) + 1
+            for feature in features:
+                score += math.log((self.word_counts[label][feature] + 1) / denominator)
+            scores[label] = score
+        top = max(scores.values())
+        exps = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
+
+
+class Route:
+    """What the router decided for one query"""
+
+    def __init__(self, calls: List[Tuple[str, str]], confidence: float, intents: List[str], reason: str):
+        self.calls = calls  # (tool name, tool input)
+        self.confidence = confidence
+        self.intents = intents
+        self.reason = reason
+
+    @property
+    def fast(self) -> bool:
+        return bool(self.calls)
+
+
+SECTION_TITLES = {
+    "crypto_data": "Dati di mercato",
+    "economic_calendar": "Calendario economico",
+    "news_scraper": "News",
+}
+
+
+class IntentRouter:
+    """
+    Rules + classifier in front of the agent; runs tools directly when confident
+    """
+
+    def __init__(self, tools: Dict[str, Callable[[str], Awaitable[str]]]):
+        # tool name -> async callable taking the tool's text input
+        self.tools = tools
+        self.enabled = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+        self.min_confidence = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.7"))
+        self.classifier = NaiveBayes(TRAINING)
+
+    def route(self, query: str, context: Optional[Dict] = None) -> Route:
+        if not self.enabled:
+            return Route([], 0.0, [], "disabled")
+        if context:
+            # Extra context may change what is asked: leave it to the agent
+            return Route([], 0.0, [], "context")
+
+        tokens = re.sub(r"\bopen interest\b", "open_interest", " ".join(normalize_query(query))).split()
+        if not tokens:
+            return Route([], 0.0, [], "empty")
+        if OPEN_TOKENS & set(tokens):
+            return Route([], 0.0, ["open"], "open_question")
+
+        coins = extract_symbols(query)
+        metrics_asked: List[str] = []
+        day = None
+        calendar = news = False
+        understood = 0
+        qualifiers: List[str] = []
+        for token in tokens:
+            if token.upper() in KNOWN_COINS:
+                understood += 1
+            elif token in METRIC_TOKENS:
+                if METRIC_TOKENS[token] not in metrics_asked:
+                    metrics_asked.append(METRIC_TOKENS[token])
+                understood += 1
+            elif token in CALENDAR_TOKENS:
+                calendar = True
+                understood += 1
+            elif token in DAY_TOKENS:
+                day = day or DAY_TOKENS[token]
+                qualifiers.append(token)
+            elif token in PERIOD_TOKENS or token in SNAPSHOT_QUALIFIERS or re.fullmatch(r"\d+[a-z]?", token):
+                qualifiers.append(token)
+            elif token in NEWS_TOKENS:
+                news = True
+                understood += 1
+            elif token in FILLER_TOKENS:
+                understood += 1
+        
+        if calendar:
+            # Day, week and date parts all feed the calendar period
+            understood += len(qualifiers)
+        elif any(q not in SNAPSHOT_QUALIFIERS for q in qualifiers):
+            return Route([], 0.0, [], "time_qualifier")
+        else:
+            understood += len(qualifiers)
+        coverage = understood / len(tokens)
+
+        calls: List[Tuple[str, str]] = []
+        intents: List[str] = []
+        if metrics_asked and coins:
+            intents.append("market")
+            if len(coins) == 1 and len(metrics_asked) == 1:
+                calls.append(("crypto_data", f"{coins[0]} {metrics_asked[0]}"))
+            else:
+                calls.append(("crypto_data", f"{','.join(coins)} {','.join(metrics_asked)}"))
+        if calendar:
+            intents.append("calendar")
+            date = re.search(r"\d{4}-\d{2}-\d{2}", query)
+            calls.append(("economic_calendar", date.group(0) if date else day or "today"))
+        if news and not metrics_asked and not calendar:
+            intents.append("news")
+            calls.append(("news_scraper", " ".join(coins) or query))
+        if not calls:
+            return Route([], coverage, intents, "no_structured_intent")
+
+        p_open = self.classifier.predict(tokens).get("open", 0.0)
+        confidence = round(min(coverage, 1.0 - p_open), 3)
+        if confidence < self.min_confidence:
+            return Route([], confidence, intents, "low_confidence")
+        return Route(calls, confidence, intents, "rules")
+
+    async def run(self, route: Route, on_tool: Optional[Callable[[str, str, str, float, bool], None]] = None) -> Dict:
+        """
+        Call the routed tools in parallel and render the template report
+        on_tool(name, input, output, seconds, ok) is called as each tool finishes
+        """
+
+        async def call(name: str, tool_input: str) -> Tuple[str, str]:
+            started = time.perf_counter()
+            ok = True
+            try:
+                output = await self.tools[name](tool_input)
+            except Exception as e:
+                ok = False
+                output = f"Errore in {name}: {str(e)}"
+            if on_tool is not None:
+                on_tool(name, tool_input, output, time.perf_counter() - started, ok)
+            return name, output
+
+        results = await asyncio.gather(*[call(name, tool_input) for name, tool_input in route.calls])
+        return {
+            "report": self.render(route, results),
+            "sources": sorted({name for name, _ in results}),
+        }
+
+    def render(self, route: Route, results: List[Tuple[str, str]]) -> str:
+        sections = [f"## {SECTION_TITLES.get(name, name)}\n\n{output.strip()}" for name, output in results]
+        footer = (
+            f"_Risposta rapida dai dati, senza LLM (intento: {', '.join(route.intents)}, "
+            f"confidenza {route.confidence:.2f}). Per un'analisi ragionata chiedi ad es. \"analisi ...\"._"
+        )
+        return "\n\n".join(sections + [footer])
+
+    def record(self, route: Route) -> None:
+        metrics.inc("router_decisions_total", labels={
+            "route": "fast_path" if route.fast else "agent",
+            "reason": route.reason,
+        })
@@ -0,0 +1,175 @@
+"""
+LLM response cache shared by every chat model call of the agent
+
+Plugged into the chat model as a LangChain cache: each call is keyed on
+the normalized message list plus the model parameters (model, temperature,
+bound tools), so an agent state that was already sent to the provider -
+same question, same tool observations - is answered locally. Normalization
+drops what changes between otherwise identical runs: message ids, response
+metadata and the random tool-call ids in the scratchpad.
+
+Entries live in an LRU memory tier backed by SQLite (tools.cache.TTLCache),
+so they survive restarts; with CACHE_BACKEND set they go to the store
+shared by all API workers instead.
+
+Configuration (environment variables):
+- LLM_CACHE_ENABLED: "true" (default) / "false"
+- LLM_CACHE_TTL: seconds an entry stays valid (default 3600)
+- LLM_CACHE_SIZE: entries in the memory tier (default 512)
+- LLM_CACHE_PATH: SQLite file for the persistent tier (default
+  data/llm_cache.db, empty = memory only)
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import warnings
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from tools.cache import TTLCache, register_cache, shared_backend
+
+# Message fields that differ between runs without changing the meaning
+VOLATILE_FIELDS = {"id", "response_metadata", "usage_metadata"}
+
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a serialized message list (see module docstring)"""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return _normalize_text(prompt)
+
+    call_ids: Dict[str, str] = {}
+
+    def call_id(value: str) -> str:
+        return call_ids.setdefault(value, f"call_{len(call_ids)}")
+
+    def walk(node: Any, parent: Optional[str] = None) -> Any:
+        if isinstance(node, dict):
+            result = {}
+            for key, value in node.items():
+                if key in VOLATILE_FIELDS and parent == "kwargs":
+                    continue
+                if key == "tool_call_id" and isinstance(value, str):
+                    result[key] = call_id(value)
+                elif key == "id" and parent == "tool_call" and isinstance(value, str):
+                    result[key] = call_id(value)
+                else:
+                    child = "tool_call" if key in ("tool_calls", "tool_call_chunks", "invalid_tool_calls") else key
+                    result[key] = walk(value, child)
+            return result
+        if isinstance(node, list):
+            return [walk(item, parent) for item in node]
+        if isinstance(node, str) and parent == "content":
+            return _normalize_text(node)
+        return node
+
+    return json.dumps(walk(messages), sort_keys=True, ensure_ascii=False)
+
+
+def _estimate_tokens(text: str) -> int:
+    """~4 characters per token, used when the provider reported no usage"""
+    return max(1, len(text) // 4)
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain cache with normalized keys, TTL, LRU memory tier and SQLite persistence
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_size: Optional[int] = None,
+                 path: Optional[str] = None):
+        self.ttl = ttl or float(os.getenv("LLM_CACHE_TTL", "3600"))
+        path = os.getenv("LLM_CACHE_PATH", "data/llm_cache.db") if path is None else path
+        self.store = TTLCache(
+            "llm_responses",
+            max_size=max_size or int(os.getenv("LLM_CACHE_SIZE", "512")),
+            default_ttl=self.ttl,
+            backend=shared_backend("llm", path),
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prompt_tokens_saved = 0
+        self.completion_tokens_saved = 0
+
+        register_cache("llm_responses", self)
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        normalized = normalize_prompt(prompt) + "\x00" + llm_string
+        return "llm:" + hashlib.sha256(normalized.encode()).hexdigest()
+
+    def _count_saved(self, prompt: str, generations: List[Generation]):
+        prompt_tokens = completion_tokens = 0
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None) or {}
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+            else:
+                prompt_tokens += _estimate_tokens(prompt)
+                completion_tokens += _estimate_tokens(generation.text or json.dumps(
+                    getattr(message, "tool_calls", None) or [], default=str))
+        with self._lock:
+            self.hits += 1
+            self.prompt_tokens_saved += prompt_tokens
+            self.completion_tokens_saved += completion_tokens
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[List[Generation]]:
+        stored = self.store.get(self._key(prompt, llm_string))
+        if stored is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with warnings.catch_warnings():
+                # loads() is flagged as beta in langchain-core
+                warnings.simplefilter("ignore")
+                generations = [loads(item) for item in stored]
+        except Exception as e:
+            print(f"Warning: unreadable LLM cache entry skipped: {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+        for generation in generations:
+            # Lets the request instrumentation tell hits from provider calls
+            generation.generation_info = {**(generation.generation_info or {}), "cache_hit": True}
+        self._count_saved(prompt, generations)
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        try:
+            serialized = [dumps(generation) for generation in return_val]
+        except Exception as e:
+            print(f"Warning: LLM response not cacheable: {e}")
+            return
+        self.store.set(self._key(prompt, llm_string), serialized)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self) -> Dict:
+        store = self.store.stats()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": store["size"],
+                "max_size": store["max_size"],
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "prompt_tokens_saved": self.prompt_tokens_saved,
+                "completion_tokens_saved": self.completion_tokens_saved,
+                "ttl": self.ttl,
+                "backend": store["backend"],
+            }
@@ -0,0 +1,221 @@
+"""
+Semantic answer cache for near-duplicate analysis queries
+
+"analisi BTC oggi", "BTC analysis today" and "cosa succede a bitcoin" all
+normalize to similar token sets; their embeddings are compared by cosine
+similarity and a close enough match returns the cached report instead of
+running the agent again.
+
+Embeddings come from a hashing vectorizer (no model download, stable across
+processes) or, if SEMANTIC_CACHE_EMBEDDER=sentence-transformers and the
+package is installed, from a local sentence-transformers model.
+
+A hit also requires the same coins and the same context, so "BTC oggi"
+never answers "ETH oggi". Entries expire with the freshest market data
+they depend on (see CACHE_TTLS in tools.crypto_data).
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from tools.cache import register_cache
+from tools.crypto_data import CACHE_TTLS, COIN_ALIASES, extract_symbols
+
+# Italian/English variants mapped to one canonical token
+SYNONYMS = {
+    "analisi": "analysis", "analizza": "analysis", "analyze": "analysis", "analyse": "analysis",
+    "oggi": "today", "odierno": "today", "odierna": "today",
+    "adesso": "now", "ora": "now", "attuale": "now", "attualmente": "now", "current": "now",
+    "domani": "tomorrow", "settimana": "week", "mese": "month",
+    "notizie": "news", "novita": "news",
+    "prezzo": "price", "prezzi": "price",
+    "liquidazioni": "liquidation", "liquidazione": "liquidation", "liquidations": "liquidation", "liq": "liquidation",
+    "oi": "open_interest", "interesse": "open_interest",
+    "calendario": "calendar", "eventi": "calendar", "events": "calendar",
+    "succede": "happening", "sta": "happening", "going": "happening",
+    "mercato": "market", "mercati": "market",
+}
+
+STOPWORDS = {
+    "a", "al", "alla", "allo", "ai", "il", "lo", "la", "i", "gli", "le", "di", "del", "della", "dei",
+    "delle", "da", "in", "su", "per", "con", "e", "ed", "che", "cosa", "come", "qual", "quale", "quali",
+    "un", "una", "uno", "mi", "ci", "puoi", "dammi", "fammi", "fai",
+    "the", "a", "an", "of", "on", "for", "to", "is", "are", "what", "whats", "how", "me", "give",
+    "please", "can", "you", "with", "and", "about",
+}
+
+# Which CACHE_TTLS entry a canonical token depends on
+METRIC_TOKENS = {
+    "funding": "funding",
+    "open_interest": "open_interest",
+    "liquidation": "liquidation",
+    "flows": "flows",
+}
+
+
+def normalize_query(query: str) -> List[str]:
+    """Lowercase, strip accents, canonicalize synonyms/tickers, drop stopwords"""
+    text = unicodedata.normalize("NFKD", query.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    tokens = []
+    for word in re.findall(r"[a-z0-9_]+", text):
+        upper = word.upper()
+        coin = COIN_ALIASES.get(upper)
+        if coin is None and upper.endswith(("USDT", "USD")):
+            coin = upper.replace("USDT", "").replace("USD", "")
+        word = coin.lower() if coin else SYNONYMS.get(word, word)
+        if word not in STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+
+class HashingEmbedder:
+    """Signed feature hashing of word uni/bigrams and character trigrams"""
+
+    def __init__(self, dim: int = 2048):
+        self.dim = dim
+
+    def _index(self, feature: str) -> Tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if (value >> 63) & 1 else -1.0
+
+    def embed(self, tokens: List[str]) -> Dict[int, float]:
+        features = [f"w:{t}" for t in tokens]
+        features += [f"b:{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+        for token in tokens:
+            padded = f"#{token}#"
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+
+        vector: Dict[int, float] = {}
+        for feature in features:
+            index, sign = self._index(feature)
+            vector[index] = vector.get(index, 0.0) + sign
+        return _l2_normalize(vector)
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model (optional dependency)"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def embed(self, tokens: List[str]) -> Dict[int, float]:
+        dense = self.model.encode(" ".join(tokens))
+        return _l2_normalize({i: float(v) for i, v in enumerate(dense)})
+
+
+def _l2_normalize(vector: Dict[int, float]) -> Dict[int, float]:
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {k: v / norm for k, v in vector.items()} if norm else vector
+
+
+def _cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+def _make_embedder():
+    if os.getenv("SEMANTIC_CACHE_EMBEDDER", "hashing").lower() == "sentence-transformers":
+        try:
+            return SentenceTransformerEmbedder(
+                os.getenv("SEMANTIC_CACHE_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+            )
+        except Exception as e:
+            print(f"Warning: sentence-transformers non disponibile, uso hashing ({e})")
+    return HashingEmbedder()
+
+
+class SemanticCache:
+    """
+    In-memory vector index of recent reports with similarity threshold and TTL
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_entries: Optional[int] = None,
+                 default_ttl: Optional[float] = None):
+        self.threshold = threshold or float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.82"))
+        self.max_entries = max_entries or int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+        self.default_ttl = default_ttl or float(os.getenv("SEMANTIC_CACHE_TTL", "300"))
+        self.embedder = _make_embedder()
+
+        # id -> (vector, symbols, context key, result, expires_at)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        register_cache("semantic_answers", self)
+
+    def freshness_ttl(self, tokens: List[str]) -> float:
+        """A report is only as fresh as the market data it quotes"""
+        ttls = [CACHE_TTLS[METRIC_TOKENS[t]] for t in tokens if t in METRIC_TOKENS]
+        return min([self.default_ttl] + ttls)
+
+    def _key(self, query: str, context: Optional[Dict]):
+        tokens = normalize_query(query)
+        symbols = frozenset(extract_symbols(query))
+        context_key = json.dumps(context, sort_keys=True, default=str) if context else ""
+        return tokens, symbols, context_key
+
+    def lookup(self, query: str, context: Optional[Dict] = None) -> Optional[Dict]:
+        """Cached result of the most similar fresh query, or None"""
+        tokens, symbols, context_key = self._key(query, context)
+        if not tokens:
+            return None
+        vector = self.embedder.embed(tokens)
+        now = time.time()
+
+        best_id, best_score = None, 0.0
+        with self._lock:
+            for entry_id, (entry_vector, entry_symbols, entry_context, _, expires_at) in list(self._entries.items()):
+                if expires_at <= now:
+                    del self._entries[entry_id]
+                    continue
+                if entry_symbols != symbols or entry_context != context_key:
+                    continue
+                score = _cosine(vector, entry_vector)
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_id)
+                self.hits += 1
+                return dict(self._entries[best_id][3], similarity=round(best_score, 3))
+            self.misses += 1
+            return None
+
+    def store(self, query: str, context: Optional[Dict], result: Dict):
+        tokens, symbols, context_key = self._key(query, context)
+        if not tokens:
+            return
+        vector = self.embedder.embed(tokens)
+        expires_at = time.time() + self.freshness_ttl(tokens)
+        with self._lock:
+            self._entries[self._next_id] = (vector, symbols, context_key, result, expires_at)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "threshold": self.threshold,
+                "embedder": type(self.embedder).__name__,
+            }
@@ -0,0 +1,110 @@
+"""
+Concurrent tool execution for the agent loop
+
+When the model requests several tools in one turn, AgentExecutor's async
+path runs them with asyncio.gather and merges the observations back in the
+order the model asked for them. This module bounds that fan-out per request
+(AGENT_TOOL_CONCURRENCY, default 4) and logs, for every step, the wall-clock
+time against the sum of the individual tool times.
+"""
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain.tools import Tool
+from langchain_core.callbacks import AsyncCallbackHandler
+
+# Set per request; tool tasks spawned by gather inherit it
+_tool_slots: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("tool_slots", default=None)
+
+
+def tool_concurrency() -> int:
+    return max(1, int(os.getenv("AGENT_TOOL_CONCURRENCY", "4")))
+
+
+@contextmanager
+def request_tool_limit(limit: Optional[int] = None) -> Iterator[None]:
+    """Bound concurrent tool calls for the request running in this context"""
+    token = _tool_slots.set(asyncio.Semaphore(limit or tool_concurrency()))
+    try:
+        yield
+    finally:
+        _tool_slots.reset(token)
+
+
+def bounded_tool(tool: Tool) -> Tool:
+    """Wrap a tool's coroutine so it waits for a free per-request slot"""
+    if tool.coroutine is None:
+        return tool
+    coroutine = tool.coroutine
+
+    async def run(*args, **kwargs):
+        slots = _tool_slots.get()
+        if slots is None:
+            return await coroutine(*args, **kwargs)
+        async with slots:
+            return await coroutine(*args, **kwargs)
+
+    return Tool(
+        name=tool.name,
+        description=tool.description,
+        func=tool.func,
+        coroutine=run
+    )
+
+
+class StepTimingHandler(AsyncCallbackHandler):
+    """
+    Per-request callback collecting tool timings for each agent step
+
+    A step is the batch of tool calls issued after one LLM turn; it closes
+    when the next LLM call starts or the run ends.
+    """
+
+    def __init__(self, label: str = "agent"):
+        self.label = label
+        self.steps: List[Dict] = []
+        self._started: Dict[UUID, tuple] = {}
+        self._current: List[Dict] = []
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = (serialized.get("name", "tool"), time.perf_counter())
+
+    async def _tool_done(self, run_id: UUID, ok: bool) -> None:
+        name, started = self._started.pop(run_id, ("tool", None))
+        if started is not None:
+            self._current.append({"tool": name, "start": started, "end": time.perf_counter(), "ok": ok})
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        await self._tool_done(run_id, True)
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        await self._tool_done(run_id, False)
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, **kwargs: Any) -> None:
+        self.close_step()
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self.close_step()
+
+    def close_step(self) -> None:
+        """Record and log the pending step, if it ran any tools"""
+        if not self._current:
+            return
+        calls, self._current = self._current, []
+        wall = max(c["end"] for c in calls) - min(c["start"] for c in calls)
+        total = sum(c["end"] - c["start"] for c in calls)
+        step = {
+            "step": len(self.steps) + 1,
+            "tools": [{"tool": c["tool"], "seconds": round(c["end"] - c["start"], 3), "ok": c["ok"]} for c in calls],
+            "wall_seconds": round(wall, 3),
+            "sequential_seconds": round(total, 3),
+        }
+        self.steps.append(step)
+        tools = ", ".join(f"{t['tool']} {t['seconds']:.2f}s" for t in step["tools"])
+        print(f"[{self.label}] step {step['step']}: {len(calls)} tool(s) in {wall:.2f}s "
+              f"(sequenziale {total:.2f}s) - {tools}")
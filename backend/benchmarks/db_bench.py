@@ -0,0 +1,93 @@
+"""
+Micro-benchmark for DatabaseTool storage
+
+Compares the old access pattern (sqlite3.connect + close per operation,
+rollback journal) with the pooled WAL connections used by DatabaseTool,
+for inserts, symbol lookups and text searches.
+
+Uso:
+    python benchmarks/db_bench.py --ops 2000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.database import DatabaseTool  # noqa: E402
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT"]
+
+
+def _report(i: int) -> str:
+    return f"Report {i}: funding rate stabile, open interest in crescita, sentiment neutrale. " * 10
+
+
+def bench_legacy(db_path: str, ops: int) -> dict:
+    """Connection per operation, default journal mode"""
+    DatabaseTool(db_path).pool.close_all()  # create schema
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+
+    start = time.perf_counter()
+    for i in range(ops):
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "INSERT INTO analyses (symbol, query, report, sources, timestamp) VALUES (?, ?, ?, ?, ?)",
+            (SYMBOLS[i % 4], f"query {i}", _report(i), json.dumps([]), datetime.now().isoformat())
+        )
+        conn.commit()
+        conn.close()
+    insert_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(ops):
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "SELECT query, report, timestamp FROM analyses WHERE symbol = ? ORDER BY created_at DESC LIMIT 5",
+            (SYMBOLS[i % 4],)
+        ).fetchall()
+        conn.close()
+    query_s = time.perf_counter() - start
+    return {"insert_ops_s": ops / insert_s, "query_ops_s": ops / query_s}
+
+
+def bench_pooled(db_path: str, ops: int) -> dict:
+    """DatabaseTool with the pooled WAL connection"""
+    tool = DatabaseTool(db_path)
+
+    start = time.perf_counter()
+    for i in range(ops):
+        tool._save_analysis(SYMBOLS[i % 4], f"query {i}", _report(i), [])
+    insert_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(ops):
+        tool._retrieve_analysis(SYMBOLS[i % 4], "all")
+    query_s = time.perf_counter() - start
+    tool.pool.close_all()
+    return {"insert_ops_s": ops / insert_s, "query_ops_s": ops / query_s}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DatabaseTool micro-benchmark")
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = bench_legacy(os.path.join(tmp, "legacy.db"), args.ops)
+        pooled = bench_pooled(os.path.join(tmp, "pooled.db"), args.ops)
+
+    print(f"{'':>10} {'insert/s':>12} {'query/s':>12}")
+    print(f"{'before':>10} {legacy['insert_ops_s']:>12.0f} {legacy['query_ops_s']:>12.0f}")
+    print(f"{'after':>10} {pooled['insert_ops_s']:>12.0f} {pooled['query_ops_s']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark for the indicator engine
+
+Fills a temporary time-series store with one year of minute samples for
+funding, open interest and liquidations of one symbol, then times the bulk
+load and the full indicator computation.
+
+Uso:
+    python benchmarks/indicators_bench.py --days 365
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.database import DatabaseTool  # noqa: E402
+from tools.indicators import IndicatorEngine  # noqa: E402
+from tools.timeseries import DAY, MINUTE  # noqa: E402
+
+
+def fill(db: DatabaseTool, symbol: str, days: int, now: int) -> int:
+    rng = np.random.default_rng(42)
+    ts = np.arange(now - days * DAY, now, MINUTE)
+    n = len(ts)
+    funding = 0.01 + np.cumsum(rng.normal(0, 1e-4, n))
+    oi = 1.5e10 * np.exp(np.cumsum(rng.normal(0, 1e-4, n)))
+    longs = rng.gamma(2.0, 2e5, n)
+    shorts = rng.gamma(2.0, 2e5, n)
+    spikes = rng.choice(n, size=20, replace=False)
+    longs[spikes] *= 50
+
+    rows = []
+    for i in range(n):
+        t = int(ts[i])
+        rows.append((symbol, "funding", t, float(funding[i]), None, None))
+        rows.append((symbol, "open_interest", t, float(oi[i]), None, None))
+        rows.append((symbol, "liquidation", t, float(longs[i] + shorts[i]), float(longs[i]), float(shorts[i])))
+    return db.timeseries.record_many(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indicator engine benchmark")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # Raw rows must survive until they are packed into daily blocks
+    os.environ["TS_RETENTION_RAW_DAYS"] = str(args.days + 1)
+    os.environ["TS_RETENTION_BLOCK_DAYS"] = str(args.days + 1)
+    now = int(time.time()) // MINUTE * MINUTE
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseTool(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        rows = fill(db, "BTC", args.days, now)
+        db.timeseries.maintain(now)
+        print(f"Inseriti e compattati {rows} campioni in {time.perf_counter() - start:.1f}s")
+
+        engine = IndicatorEngine(db.timeseries)
+        window = args.days * DAY
+
+        load_times, total_times = [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            engine.load("BTC", window, now)
+            load_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            result = engine.compute("BTC", window, now)
+            total_times.append(time.perf_counter() - start)
+
+        print(f"Risoluzione {result['resolution']}, serie: "
+              + ", ".join(f"{k} {v['samples']}" for k, v in result["metrics"].items()))
+        print(f"Bulk load: {min(load_times) * 1000:.0f} ms (best of {args.runs})")
+        print(f"Load + indicatori: {min(total_times) * 1000:.0f} ms (best of {args.runs})")
+        print(f"Cluster liquidazioni: {len(result.get('liquidation_clusters', []))}")
+        db.pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Load benchmark for /api/analyze
+
+Fires batches of concurrent requests at a running backend and reports
+throughput for each concurrency level. With async tools the requests/s
+should grow with concurrency instead of flatlining at ~1/latency.
+
+Uso:
+    uvicorn main:app --port 8000
+    python benchmarks/load_analyze.py --url http://localhost:8000 --levels 1,4,16
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_QUERY = "Qual è il funding rate attuale di BTCUSDT?"
+
+
+async def _one_request(client: httpx.AsyncClient, url: str, query: str) -> float:
+    """Send a single analysis request and return its latency in seconds"""
+    start = time.perf_counter()
+    response = await client.post(f"{url}/api/analyze", json={"query": query})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run_level(url: str, concurrency: int, rounds: int, query: str) -> dict:
+    """Run `rounds` batches of `concurrency` parallel requests"""
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300.0, limits=limits) as client:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            results = await asyncio.gather(
+                *[_one_request(client, url, query) for _ in range(concurrency)],
+                return_exceptions=True
+            )
+            for r in results:
+                if isinstance(r, Exception):
+                    errors += 1
+                else:
+                    latencies.append(r)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": statistics.median(latencies) if latencies else 0.0,
+        "max_s": max(latencies) if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Concurrent /api/analyze load benchmark")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Concurrency levels, comma separated")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--query", default=DEFAULT_QUERY)
+    args = parser.parse_args()
+
+    print(f"{'conc':>5} {'ok':>5} {'err':>4} {'req/s':>8} {'p50 s':>8} {'max s':>8}")
+    for level in [int(x) for x in args.levels.split(",") if x.strip()]:
+        stats = await run_level(args.url, level, args.rounds, args.query)
+        print(
+            f"{stats['concurrency']:>5} {stats['requests']:>5} {stats['errors']:>4} "
+            f"{stats['throughput_rps']:>8.2f} {stats['p50_s']:>8.2f} {stats['max_s']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+"""
+Load test for the multi-worker deployment
+
+Starts the API with uvicorn at each requested worker count (shared SQLite
+cache store; answer and LLM caches and the intent router off so every
+request runs the agent) against a local OpenAI-compatible endpoint, then
+drives it with a fixed number of concurrent clients and reports throughput
+and latency.
+
+The fake provider answers after --llm-latency seconds, so what is measured
+is the CPU cost of our request path; throughput should grow with the worker
+count up to the number of cores (the load generator runs on the same
+machine and takes its share).
+
+Uso:
+    python benchmarks/load_test.py --workers 1,2,4 --concurrency 32 --duration 15
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from startup_bench import BACKEND, FakeOpenAI  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api(workers: int, port: int, base_url: str, cwd: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_API_BASE": base_url,
+        "LLM_PROVIDER": "openai",
+        "WEB_CONCURRENCY": str(workers),
+        "CACHE_BACKEND": "sqlite",
+        "SEMANTIC_CACHE_ENABLED": "false",
+        "LLM_CACHE_ENABLED": "false",
+        "ROUTER_ENABLED": "false",
+        "AGENT_WARMUP": "true",
+        "PDF_WORKERS": "0",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND,
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_ready(url: str, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("API non pronta")
+
+
+async def drive(url: str, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    counter = 0
+    stop_at = time.monotonic() + duration
+
+    async def client_loop(client: httpx.AsyncClient):
+        nonlocal errors, counter
+        while time.monotonic() < stop_at:
+            counter += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/api/analyze", json={"query": f"funding BTC #{counter}"})
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[client_loop(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pick = (lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000) if latencies else (lambda q: 0.0)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker load test")
+    parser.add_argument("--workers", default="1,2,4", help="worker counts to compare")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated provider latency (s)")
+    args = parser.parse_args()
+
+    FakeOpenAI.latency = args.llm_latency
+    provider = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    threading.Thread(target=provider.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{provider.server_port}/v1"
+
+    print(f"CPU: {os.cpu_count()}, client concorrenti: {args.concurrency}, durata: {args.duration:.0f}s")
+    baseline = None
+    try:
+        for workers in [int(w) for w in args.workers.split(",")]:
+            port = free_port()
+            with tempfile.TemporaryDirectory() as tmp:
+                process = start_api(workers, port, base_url, tmp)
+                try:
+                    url = f"http://127.0.0.1:{port}"
+                    asyncio.run(wait_ready(url))
+                    # Warm every worker before measuring
+                    asyncio.run(drive(url, args.concurrency, 2.0))
+                    result = asyncio.run(drive(url, args.concurrency, args.duration))
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+            baseline = baseline or result["rps"]
+            print(f"workers={workers}: {result['rps']:.1f} req/s (x{result['rps'] / baseline:.2f}), "
+                  f"p50 {result['p50_ms']:.0f} ms, p95 {result['p95_ms']:.0f} ms, "
+                  f"{result['requests']} ok, {result['errors']} errori")
+    finally:
+        provider.shutdown()
+
+
+if __name__ == "__main__":
+    main()
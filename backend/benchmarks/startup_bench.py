@@ -0,0 +1,115 @@
+"""
+Startup benchmark: import time, warm-up and first-request latency
+
+Each scenario runs in a fresh interpreter inside an empty temporary
+directory (so caches and databases start cold) against a local
+OpenAI-compatible endpoint that answers instantly: the numbers measure
+our own startup path, not the provider. The intent router is off so the
+first requests go through the agent.
+
+Scenarios:
+- cold: lazy agent, built by the first /api/analyze call
+- warm: AGENT_WARMUP=true, agent and parsers prepared in the lifespan
+
+Uso:
+    python benchmarks/startup_bench.py --runs 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import median
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    client.post("/api/analyze", json={{"query": "ciao"}})
+    first = time.perf_counter()
+    client.post("/api/analyze", json={{"query": "funding ETH adesso"}})
+    second = time.perf_counter()
+print(json.dumps({{
+    "import": imported - started,
+    "startup": ready - imported,
+    "first_request": first - ready,
+    "second_request": second - first,
+    "ready_to_first_answer": first - started,
+}}))
+"""
+
+COMPLETION = {
+    "id": "bench", "object": "chat.completion", "created": 0, "model": "gpt-3.5-turbo",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+}
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    # Seconds of simulated provider latency (used by load_test.py)
+    latency = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_scenario(base_url: str, warm: bool) -> dict:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_API_BASE": base_url,
+        "LLM_PROVIDER": "openai",
+        "AGENT_WARMUP": "true" if warm else "false",
+        "PREFETCH_ENABLED": "false",
+        "ROUTER_ENABLED": "false",
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD.format(backend=BACKEND)],
+            cwd=tmp, env=env, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    try:
+        for name, warm in (("cold", False), ("warm", True)):
+            runs = [run_scenario(base_url, warm) for _ in range(args.runs)]
+            summary = ", ".join(f"{key} {median(r[key] for r in runs) * 1000:.0f} ms" for key in runs[0])
+            print(f"{name}: {summary} (mediana di {args.runs})")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
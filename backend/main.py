@@ -1,11 +1,17 @@
 """
 Main FastAPI application for Lab Trading AI Financial Analyst
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+from contextlib import asynccontextmanager
 import os
+import json
+import asyncio
+import time
+from contextlib import aclosing
 from dotenv import load_dotenv
 
 import sys
@@ -14,14 +20,61 @@ import os
 # Add current directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from agent.admission import AdmissionRejected, admission
+from agent.coalescing import coalescer
 from agent.financial_agent import FinancialAgent
+from agent.instrumentation import metrics
+from tools.cache import cache_stats
+from tools.db_pool import close_all_pools
+from tools.http_client import http_pool
+from tools.market_prefetcher import MarketPrefetcher
+from tools.pdf_workers import pdf_pool
 
 load_dotenv()
 
+async def warm_up():
+    """
+    Build the agent and pay its one-off costs before the first request
+    Enabled with AGENT_WARMUP=true; AGENT_WARMUP_PING=true also sends one
+    tiny LLM request to open the provider connection.
+    """
+    started = time.perf_counter()
+    try:
+        agent_instance = await asyncio.to_thread(get_agent)
+        timings = {"agent": round(time.perf_counter() - started, 3)}
+        timings.update(await agent_instance.warm_up(
+            ping=os.getenv("AGENT_WARMUP_PING", "false").lower() == "true"
+        ))
+    except Exception as e:
+        # The first request will report the error, as without warm-up
+        print(f"Warning: warm-up failed: {e}")
+        return
+    print(f"[startup] warm-up in {time.perf_counter() - started:.2f}s: {timings}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    http_pool.startup()
+    if os.getenv("AGENT_WARMUP", "false").lower() == "true":
+        await warm_up()
+    prefetcher = None
+    if os.getenv("PREFETCH_ENABLED", "false").lower() == "true":
+        prefetcher = MarketPrefetcher()
+        prefetcher.start()
+    yield
+    if prefetcher is not None:
+        await prefetcher.stop()
+    if agent is not None:
+        await asyncio.to_thread(agent.close)
+    await http_pool.shutdown()
+    pdf_pool.shutdown()
+    close_all_pools()
+
 app = FastAPI(
     title="Lab Trading API",
     description="AI Financial Analyst API for Crypto and Macro Analysis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware - Allow all origins (restrict in production if needed)
@@ -52,11 +105,13 @@ def get_agent():
 class AnalysisRequest(BaseModel):
     query: str
     context: Optional[dict] = None
+    include_timings: bool = False
 
 class AnalysisResponse(BaseModel):
     report: str
     sources: Optional[list] = None
     timestamp: Optional[str] = None
+    timings: Optional[dict] = None
 
 @app.get("/")
 async def root():
@@ -70,26 +125,194 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters of the in-process caches"""
+    return cache_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, LLM, tool and cache metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admission/stats")
+async def get_admission_stats():
+    """Running and queued analyses, admission limits, rejections and coalesced requests"""
+    return {**admission.stats(), "coalescing": coalescer.stats()}
+
+def rejection_response(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def analysis_source(client: str, agent_instance, query: str, context: Optional[dict], route):
+    """One /api/analyze run behind the admission queue, as a single final event"""
+    if route.fast:
+        # No LLM work: the concurrency gate does not apply (see start_or_join)
+        result = await agent_instance.analyze(query, context, route)
+        yield {"type": "final", **result}
+        return
+    ticket = admission.enqueue(client)
+    try:
+        await admission.wait_admitted(ticket)
+        result = await agent_instance.analyze(query, context, route)
+    finally:
+        admission.leave(ticket)
+    yield {"type": "final", **result, "queue": {"position": ticket.position, "wait": ticket.waited}}
+
+async def stream_source(client: str, agent_instance, query: str, context: Optional[dict], route):
+    """Agent events behind the admission queue, with queued events while waiting"""
+    if route.fast:
+        events = agent_instance.astream(query, context, route)
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+        return
+    try:
+        ticket = admission.enqueue(client)
+    except AdmissionRejected as e:
+        yield {"type": "error", "message": str(e), "retry_after": e.retry_after}
+        return
+    try:
+        deadline = time.monotonic() + admission.queue_timeout
+        while not ticket.granted.done():
+            if time.monotonic() >= deadline:
+                try:
+                    admission.expire(ticket)
+                except AdmissionRejected as e:
+                    yield {"type": "error", "message": str(e), "retry_after": e.retry_after}
+                return
+            yield {"type": "queued", "position": admission.position(ticket)}
+            await admission.wait(ticket, min(1.0, max(0.0, deadline - time.monotonic())))
+        admission.mark_admitted(ticket)
+        
+        events = agent_instance.astream(query, context, route)
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+    finally:
+        admission.leave(ticket)
+
+def start_or_join(kind: str, request: AnalysisRequest, client: str, source) -> tuple:
+    """
+    Attach to an identical in-flight run or start one (see agent.coalescing)
+    Followers and fast-path routes (intent router, no LLM) are only charged to
+    the rate limit: they add no agent work, so they skip the concurrency gate.
+    kind keeps /api/analyze and stream runs apart: their events differ.
+    Returns (flight, "leader" | "follower").
+    """
+    key = coalescer.key(kind, request.query, request.context)
+    flight = coalescer.join(key)
+    if flight is not None:
+        admission.check_rate(client)
+        return flight, "follower"
+    agent_instance = get_agent()
+    route = agent_instance.route(request.query, request.context)
+    if route.fast:
+        admission.check_rate(client)
+    else:
+        admission.precheck(client)
+    return coalescer.start(
+        key, lambda: source(client, agent_instance, request.query, request.context, route)
+    ), "leader"
+
 @app.post("/api/analyze", response_model=AnalysisResponse)
-async def analyze(request: AnalysisRequest):
+async def analyze(request: AnalysisRequest, response: Response, http_request: Request):
     """
     Main endpoint for financial analysis queries
+    X-Cache reports whether the semantic answer cache served the report;
+    include_timings=true adds the per-step LLM/tool breakdown to the response.
+    Admission control may queue the request (X-Queue-Position / X-Queue-Wait
+    report it) or reject it with 429/503 and Retry-After. Identical requests
+    in flight share one run (X-Coalesced: leader / follower). X-Route: fast
+    means the intent router answered without the LLM agent.
     """
+    result = None
     try:
-        agent_instance = get_agent()
-        result = await agent_instance.analyze(request.query, request.context)
-        return AnalysisResponse(
-            report=result.get("report", ""),
-            sources=result.get("sources", []),
-            timestamp=result.get("timestamp")
+        flight, role = start_or_join("analyze", request, admission.client_id(http_request), analysis_source)
+        async with aclosing(flight.subscribe()) as events:
+            async for event in events:
+                if event["type"] in ("final", "error"):
+                    result = event
+                    break
+    except AdmissionRejected as e:
+        raise rejection_response(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error during analysis: {str(e)}"
+        )
+    if result is None or result["type"] == "error":
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error during analysis: {result['message'] if result else 'nessun risultato'}"
         )
+    
+    queue = result.get("queue") or {}
+    response.headers["X-Cache"] = result.get("cache", "MISS")
+    response.headers["X-Coalesced"] = role
+    response.headers["X-Route"] = (result.get("route") or {}).get("path", "agent")
+    response.headers["X-Queue-Position"] = str(queue.get("position", 0))
+    response.headers["X-Queue-Wait"] = f"{queue.get('wait', 0.0):.3f}"
+    return AnalysisResponse(
+        report=result.get("report", ""),
+        sources=result.get("sources", []),
+        timestamp=result.get("timestamp"),
+        timings=result.get("timings") if request.include_timings else None
+    )
+
+@app.post("/api/analyze/stream")
+async def analyze_stream(request: AnalysisRequest, http_request: Request):
+    """
+    Streaming variant of /api/analyze (Server-Sent Events)
+    Emits queued (position updates while waiting for a slot), tool_start/tool_end
+    progress, LLM tokens and a final report event. A follower of an identical
+    in-flight run receives the events produced so far, then the live ones.
+    """
+    try:
+        # Reject with a real status code before the stream starts
+        flight, role = start_or_join("stream", request, admission.client_id(http_request), stream_source)
+    except AdmissionRejected as e:
+        raise rejection_response(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error during analysis: {str(e)}"
         )
 
+    def sse(event: dict) -> str:
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+    async def event_source():
+        # Leaving the subscription stops the agent once no other client listens
+        async with aclosing(flight.subscribe()) as events:
+            try:
+                async for event in events:
+                    if await http_request.is_disconnected():
+                        break
+                    yield sse(event)
+            except Exception as e:
+                yield sse({"type": "error", "message": f"Errore durante l'analisi: {str(e)}"})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Coalesced": role}
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # WEB_CONCURRENCY > 1 runs several worker processes; caches are then shared
+    # through CACHE_BACKEND (sqlite file or redis) instead of process memory
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
 
@@ -0,0 +1,433 @@
+"""
+In-process TTL cache with LRU eviction and request coalescing
+
+Used in front of upstream data fetchers: entries expire after a per-call
+TTL, the least recently used entry is evicted once max_size is reached and
+concurrent misses for the same key share a single upstream call
+(single-flight). An optional backend persists entries so a restart does
+not start cold; with several API worker processes it is also what the
+workers share (see shared_backend).
+
+Shared store (environment variables):
+- CACHE_BACKEND: "sqlite" (one file for every worker), "redis", "memory"
+  (process-local only); unset means "sqlite" when WEB_CONCURRENCY > 1,
+  otherwise each cache keeps its own setting
+- CACHE_SHARED_PATH: SQLite file for CACHE_BACKEND=sqlite (default data/shared_cache.db)
+- REDIS_URL: server for CACHE_BACKEND=redis (default redis://localhost:6379/0)
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Protocol, Tuple
+
+from tools.db_pool import get_pool
+
+_MISSING = object()
+
+# All named caches, for the monitoring endpoint
+_registry: Dict[str, "TTLCache"] = {}
+
+
+class CacheBackend(Protocol):
+    """What TTLCache needs from a persistent tier (values are JSON-serializable)"""
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]: ...
+
+    def set(self, key: str, value: Any, expires_at: float) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk cache backend (JSON values, absolute expiry timestamps)
+
+    Safe to share between processes: SQLite in WAL mode serializes writers.
+    namespace prefixes keys so several caches can use one file. Expired rows
+    are deleted by a writer at most every purge_interval seconds. Named
+    counters (add_counts/top_counts) live in the same file, for statistics
+    the workers aggregate together.
+    """
+
+    def __init__(self, path: str, namespace: str = "", purge_interval: float = 300.0):
+        self.path = path
+        self.prefix = f"{namespace}:" if namespace else ""
+        self.pool = get_pool(path)
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        with self.pool.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    expires_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_counters (
+                    name TEXT NOT NULL,
+                    item TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (name, item)
+                ) WITHOUT ROWID
+            """)
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        row = self.pool.connection().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (self.prefix + key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        now = time.time()
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (self.prefix + key, json.dumps(value), expires_at)
+            )
+            if now >= self._next_purge:
+                # Reads skip expired rows but nothing else removes them
+                self._next_purge = now + self.purge_interval
+                conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,))
+
+    def delete(self, key: str) -> None:
+        with self.pool.transaction() as conn:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (self.prefix + key,))
+
+    def clear(self) -> None:
+        """Delete every entry of this namespace (the whole table without one)"""
+        with self.pool.transaction() as conn:
+            if not self.prefix:
+                conn.execute("DELETE FROM cache_entries")
+            else:
+                # "ns:" <= key < "ns;" is the namespace as a primary-key range
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE key >= ? AND key < ?",
+                    (self.prefix, self.prefix[:-1] + ";")
+                )
+
+    def add_counts(self, name: str, counts: Dict[str, int]) -> None:
+        """Add to the shared counters of `name`"""
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO cache_counters (name, item, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, item) DO UPDATE SET count = count + excluded.count",
+                [(self.prefix + name, item, count) for item, count in counts.items()]
+            )
+
+    def top_counts(self, name: str, n: int) -> List[Tuple[str, int]]:
+        """The n largest counters of `name`, largest first"""
+        return self.pool.connection().execute(
+            "SELECT item, count FROM cache_counters WHERE name = ? ORDER BY count DESC, item LIMIT ?",
+            (self.prefix + name, n)
+        ).fetchall()
+
+
+class RedisCacheBackend:
+    """
+    Cache backend on a Redis-compatible server (redis-py client API)
+
+    Entries carry their own expiry so the server drops them too. Any object
+    with redis-py's get/set/delete/scan_iter can be passed as client (e.g. a
+    local stand-in in tests); counters also need zincrby/zrevrange.
+    """
+
+    def __init__(self, url: Optional[str] = None, namespace: str = "", client: Any = None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("CACHE_BACKEND=redis richiede il pacchetto redis: pip install redis")
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self.client = client
+        self.prefix = f"labtrading:{namespace}:" if namespace else "labtrading:"
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry["value"], entry["expires_at"]
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms <= 0:
+            return
+        self.client.set(self.prefix + key, json.dumps({"value": value, "expires_at": expires_at}), px=ttl_ms)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        """Delete every key of this namespace"""
+        pattern = re.sub(r"([*?\[\]\\])", r"\\\1", self.prefix) + "*"
+        batch = []
+        for key in self.client.scan_iter(match=pattern, count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+    def add_counts(self, name: str, counts: Dict[str, int]) -> None:
+        """Add to the shared counters of `name` (a sorted set)"""
+        for item, count in counts.items():
+            self.client.zincrby(self.prefix + "counters:" + name, count, item)
+
+    def top_counts(self, name: str, n: int) -> List[Tuple[str, int]]:
+        """The n largest counters of `name`, largest first"""
+        rows = self.client.zrevrange(self.prefix + "counters:" + name, 0, n - 1, withscores=True)
+        return [(item.decode() if isinstance(item, bytes) else item, int(score)) for item, score in rows]
+
+
+def shared_backend(namespace: str, default_path: Optional[str] = None):
+    """
+    Backend for a cache according to CACHE_BACKEND (see module docstring)
+
+    Without CACHE_BACKEND the cache keeps its own setting: SQLite at
+    default_path if given, otherwise memory only.
+    """
+    kind = os.getenv("CACHE_BACKEND", "").lower()
+    if not kind and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        kind = "sqlite"
+    if kind == "redis":
+        return RedisCacheBackend(os.getenv("REDIS_URL"), namespace)
+    if kind == "sqlite":
+        return SQLiteCacheBackend(os.getenv("CACHE_SHARED_PATH", "data/shared_cache.db"), namespace)
+    if kind == "memory":
+        return None
+    return SQLiteCacheBackend(default_path, namespace) if default_path else None
+
+
+class _Flight:
+    """Result slot shared by the sync callers waiting on one fetch"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry TTL and single-flight loading
+    """
+
+    def __init__(self, name: str, max_size: int = 1024, default_ttl: float = 60.0,
+                 backend: Optional[CacheBackend] = None):
+        self.name = name
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.backend = backend
+
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._async_inflight: Dict[str, asyncio.Future] = {}
+        self._sync_inflight: Dict[str, "_Flight"] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.backend_hits = 0
+
+        _registry[name] = self
+
+    def _lookup(self, key: str) -> Any:
+        """Return the fresh value for key or _MISSING (caller holds no lock)"""
+        value = self._lookup_memory(key)
+        return self._lookup_backend(key) if value is _MISSING else value
+
+    def _lookup_memory(self, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        return _MISSING
+
+    def _lookup_backend(self, key: str) -> Any:
+        """Second tier of _lookup; counts the miss when the backend has nothing fresh"""
+        now = time.time()
+        if self.backend is not None:
+            try:
+                stored = self.backend.get(key)
+            except Exception:
+                stored = None
+            if stored is not None and stored[1] > now:
+                with self._lock:
+                    self._store(key, stored[0], stored[1])
+                    self.hits += 1
+                    self.backend_hits += 1
+                return stored[0]
+
+        with self._lock:
+            self.misses += 1
+        return _MISSING
+
+    def _store(self, key: str, value: Any, expires_at: float) -> None:
+        """Insert into the memory tier (caller holds the lock)"""
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, expires_at)
+            except Exception as e:
+                print(f"Warning: cache {self.name} backend write failed: {e}")
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                print(f"Warning: cache {self.name} backend delete failed: {e}")
+
+    def clear(self) -> None:
+        """Drop every entry, in memory and in the backend namespace"""
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            try:
+                self.backend.clear()
+            except Exception as e:
+                print(f"Warning: cache {self.name} backend clear failed: {e}")
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Any], ttl: Optional[float] = None,
+                     cache_if: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Return the cached value or call fetch() once for all concurrent callers
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            flight = self._sync_inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._sync_inflight[key] = flight
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fetch()
+            if cache_if(flight.result):
+                self.set(key, flight.result, ttl)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._sync_inflight[key]
+            flight.done.set()
+
+    async def aget_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]], ttl: Optional[float] = None,
+                            cache_if: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Async variant of get_or_fetch: concurrent misses await one fetch()
+        Backend reads and writes run in a worker thread, off the event loop.
+        """
+        value = self._lookup_memory(key)
+        if value is _MISSING:
+            value = await self._off_loop(self._lookup_backend, key)
+        if value is not _MISSING:
+            return value
+
+        future = self._async_inflight.get(key)
+        if future is not None:
+            with self._lock:
+                self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not us: load it ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[key] = future
+        try:
+            result = await fetch()
+            if cache_if(result):
+                await self._off_loop(self.set, key, result, ttl)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody waited on is not logged
+            future.exception()
+            raise
+        finally:
+            if self._async_inflight.get(key) is future:
+                del self._async_inflight[key]
+
+    async def _off_loop(self, func: Callable[..., Any], *args: Any) -> Any:
+        """func(*args), in a worker thread when it may block on the backend"""
+        if self.backend is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "backend_hits": self.backend_hits,
+                "backend": type(self.backend).__name__ if self.backend else None,
+            }
+
+
+def register_cache(name: str, cache: Any) -> None:
+    """Expose another cache (anything with a stats() method) on the monitoring endpoint"""
+    _registry[name] = cache
+
+
+def cache_stats() -> Dict[str, Dict]:
+    """Stats of every named cache in the process"""
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -0,0 +1,405 @@
+"""
+Economic calendar ingestion: file parsers, providers and bulk importer
+
+Provider exports come as CSV, JSON or iCalendar (ICS); each parser turns
+them into normalized events (date, time, country code, event, impact
+1..3, forecast/previous/actual) ready for tools.calendar_store.EventStore.
+
+Providers (CALENDAR_PROVIDER):
+- "files": every export dropped in CALENDAR_IMPORT_DIR (default
+  data/calendar_imports, used automatically when it exists); a refresh
+  only re-reads files modified since the previous one
+- "http": CALENDAR_PROVIDER_URL, a template with {start}, {end} and
+  {since} (epoch seconds of the last sync, empty on the first one);
+  the format comes from CALENDAR_PROVIDER_FORMAT or the response
+- "fake" (default when neither is configured): a deterministic local
+  schedule of the usual macro releases, for development and tests; the
+  tool keeps it in a separate store and labels its output as sample data.
+  When the store already holds bulk-imported events (see below) and no
+  provider is configured, those are served instead ("imported": the store
+  is the only source, nothing is fetched)
+
+Uso (bulk import into the store):
+    python -m tools.calendar_import export.csv eventi.ics altri.json --source investing
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_IMPORT_DIR = "data/calendar_imports"
+
+COUNTRY_ALIASES = {
+    "UNITED STATES": "US", "USA": "US", "USD": "US", "STATI UNITI": "US",
+    "EURO AREA": "EU", "EUROZONE": "EU", "EUROZONA": "EU", "EUR": "EU", "EMU": "EU",
+    "UNITED KINGDOM": "UK", "GB": "UK", "GBP": "UK", "REGNO UNITO": "UK",
+    "JAPAN": "JP", "JPY": "JP", "GIAPPONE": "JP",
+    "CHINA": "CN", "CNY": "CN", "CINA": "CN",
+    "GERMANY": "DE", "GERMANIA": "DE", "ITALY": "IT", "ITALIA": "IT", "FRANCE": "FR", "FRANCIA": "FR",
+    "CANADA": "CA", "CAD": "CA", "SWITZERLAND": "CH", "CHF": "CH", "AUSTRALIA": "AU", "AUD": "AU",
+}
+
+IMPACT_ALIASES = {
+    "high": 3, "alta": 3, "alto": 3, "3": 3, "***": 3,
+    "medium": 2, "media": 2, "medio": 2, "moderate": 2, "2": 2, "**": 2,
+    "low": 1, "bassa": 1, "basso": 1, "1": 1, "*": 1,
+}
+
+# Column / key spellings found in provider exports -> normalized field
+FIELD_ALIASES = {
+    "id": "event_id", "uid": "event_id", "event_id": "event_id", "calendarid": "event_id",
+    "date": "date", "data": "date", "datetime": "date", "date_time": "date",
+    "time": "time", "ora": "time",
+    "country": "country", "paese": "country", "currency": "country", "region": "country",
+    "event": "event", "evento": "event", "title": "event", "name": "event", "summary": "event",
+    "impact": "impact", "impatto": "impact", "importance": "impact", "volatility": "impact",
+    "forecast": "forecast", "previsione": "forecast", "consensus": "forecast",
+    "previous": "previous", "precedente": "previous", "prior": "previous",
+    "actual": "actual", "attuale": "actual",
+}
+
+
+def normalize_country(value: str) -> str:
+    value = (value or "").strip().upper()
+    return COUNTRY_ALIASES.get(value, value[:3] or "N/A")
+
+
+def normalize_impact(value) -> int:
+    if isinstance(value, (int, float)):
+        return min(3, max(1, int(value)))
+    return IMPACT_ALIASES.get(str(value or "").strip().lower(), 1)
+
+
+def _split_datetime(raw_date: str, raw_time: str = "") -> tuple:
+    """(YYYY-MM-DD, HH:MM or '') from the date/time spellings providers use"""
+    raw_date = (raw_date or "").strip()
+    raw_time = (raw_time or "").strip()
+    match = re.match(r"(\d{4})-?(\d{2})-?(\d{2})(?:[T ](\d{2}):?(\d{2}))?", raw_date)
+    if match:
+        year, month, day, hour, minute = match.groups()
+    else:
+        match = re.match(r"(\d{1,2})[/.](\d{1,2})[/.](\d{4})", raw_date)
+        if not match:
+            raise ValueError(f"data non riconosciuta: {raw_date!r}")
+        day, month, year = match.groups()
+        hour = minute = None
+    event_date = date(int(year), int(month), int(day)).isoformat()
+    if hour is not None:
+        return event_date, f"{hour}:{minute}"
+    time_match = re.match(r"(\d{1,2}):(\d{2})", raw_time)
+    return event_date, f"{int(time_match.group(1)):02d}:{time_match.group(2)}" if time_match else ""
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def normalize_event(raw: Dict, source: str) -> Dict:
+    """Map a provider record onto the store's fields; raises ValueError if unusable"""
+    fields: Dict = {}
+    for key, value in raw.items():
+        name = FIELD_ALIASES.get(str(key).strip().lower().replace(" ", "_"))
+        if name and name not in fields:
+            fields[name] = value
+    if not fields.get("event") or not fields.get("date"):
+        raise ValueError("evento senza nome o data")
+
+    event_date, event_time = _split_datetime(str(fields["date"]), str(fields.get("time") or ""))
+    event = {
+        "source": source,
+        "date": event_date,
+        "time": event_time,
+        "country": normalize_country(str(fields.get("country") or "")),
+        "event": str(fields["event"]).strip(),
+        "impact": normalize_impact(fields.get("impact")),
+        "forecast": _text(fields.get("forecast")),
+        "previous": _text(fields.get("previous")),
+        "actual": _text(fields.get("actual")),
+    }
+    event_id = _text(fields.get("event_id"))
+    if event_id is None:
+        # Stable across re-imports of the same release
+        natural = f"{event['date']}|{event['time']}|{event['country']}|{event['event'].lower()}"
+        event_id = hashlib.sha1(natural.encode()).hexdigest()[:20]
+    event["event_id"] = f"{source}:{event_id}"
+    return event
+
+
+def _normalize_all(records: Iterable[Dict], source: str) -> List[Dict]:
+    events = []
+    skipped = 0
+    for record in records:
+        try:
+            events.append(normalize_event(record, source))
+        except ValueError:
+            skipped += 1
+    if skipped:
+        print(f"Warning: calendario {source}: {skipped} righe non valide ignorate")
+    return events
+
+
+def parse_csv(text: str, source: str) -> List[Dict]:
+    sample = text[:2048]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return _normalize_all(csv.DictReader(io.StringIO(text), dialect=dialect), source)
+
+
+def parse_json(text: str, source: str) -> List[Dict]:
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("events") or data.get("data") or data.get("result") or []
+    return _normalize_all((item for item in data if isinstance(item, dict)), source)
+
+
+def _ics_datetime(value: str, params: str) -> tuple:
+    """DTSTART value -> (date, time); UTC times ('Z') are kept in UTC"""
+    value = value.strip()
+    if "VALUE=DATE" in params.upper() or len(value) == 8:
+        return _split_datetime(value)
+    moment = datetime.strptime(value.rstrip("Z")[:15], "%Y%m%dT%H%M%S")
+    return moment.date().isoformat(), moment.strftime("%H:%M")
+
+
+def parse_ics(text: str, source: str) -> List[Dict]:
+    # Unfold continuation lines (RFC 5545 3.1)
+    lines = re.sub(r"\r?\n[ \t]", "", text).splitlines()
+    records: List[Dict] = []
+    current: Optional[Dict] = None
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            current = {}
+        elif line == "END:VEVENT" and current is not None:
+            records.append(current)
+            current = None
+        elif current is not None and ":" in line:
+            head, value = line.split(":", 1)
+            name, _, params = head.partition(";")
+            name = name.upper()
+            value = value.replace("\\n", "\n").replace("\\,", ",").replace("\\;", ";")
+            if name == "DTSTART":
+                current["date"], current["time"] = _ics_datetime(value, params)
+            elif name == "UID":
+                current["id"] = value
+            elif name == "SUMMARY":
+                current["event"] = value
+            elif name in ("X-COUNTRY", "LOCATION") and "country" not in current:
+                current["country"] = value
+            elif name in ("X-IMPACT", "PRIORITY"):
+                # iCalendar PRIORITY: 1-4 high, 5 medium, 6-9 low
+                current["impact"] = value if name == "X-IMPACT" else (
+                    3 if value.isdigit() and 0 < int(value) <= 4 else 2 if value == "5" else 1
+                )
+            elif name == "DESCRIPTION":
+                for key, figure in re.findall(r"(Forecast|Previous|Actual|Previsione|Precedente|Attuale)\s*:\s*([^\n]+)", value, re.I):
+                    current[key.lower()] = figure.strip()
+    return _normalize_all(records, source)
+
+
+PARSERS = {"csv": parse_csv, "json": parse_json, "ics": parse_ics}
+
+
+def detect_format(name: str, text: str) -> str:
+    extension = os.path.splitext(name)[1].lower().lstrip(".")
+    if extension in PARSERS:
+        return extension
+    stripped = text.lstrip()
+    if stripped.startswith("BEGIN:VCALENDAR"):
+        return "ics"
+    if stripped[:1] in "[{":
+        return "json"
+    return "csv"
+
+
+def parse_file(path: str, source: str) -> List[Dict]:
+    with open(path, encoding="utf-8-sig") as handle:
+        text = handle.read()
+    return PARSERS[detect_format(path, text)](text, source)
+
+
+class CalendarProvider(ABC):
+    """
+    Base class for an event source
+    ranged providers answer date-range requests; others deliver whatever changed
+    """
+
+    name = "provider"
+    ranged = True
+    # Days loaded around the requested range
+    margin_days = 14
+    sample = False
+
+    @abstractmethod
+    def fetch(self, start: date, end: date, since: Optional[float]) -> List[Dict]:
+        """Normalized events in [start, end], only changes after `since` when given"""
+
+
+class FileProvider(CalendarProvider):
+    """Provider exports dropped into a directory"""
+
+    ranged = False
+
+    def __init__(self, directory: str, name: str = "files"):
+        self.directory = directory
+        self.name = name
+
+    def fetch(self, start: date, end: date, since: Optional[float]) -> List[Dict]:
+        events: List[Dict] = []
+        if not os.path.isdir(self.directory):
+            return events
+        for entry in sorted(os.scandir(self.directory), key=lambda e: e.name):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            if since is not None and entry.stat().st_mtime <= since:
+                continue
+            try:
+                events += parse_file(entry.path, self.name)
+            except Exception as e:
+                print(f"Warning: calendario, file {entry.name} non importato: {e}")
+        return events
+
+
+class HTTPProvider(CalendarProvider):
+    """Remote export addressed by a URL template"""
+
+    def __init__(self, url_template: str, fmt: Optional[str] = None, name: str = "http"):
+        self.url_template = url_template
+        self.fmt = fmt
+        self.name = name
+
+    def fetch(self, start: date, end: date, since: Optional[float]) -> List[Dict]:
+        from tools.http_client import get_sync_client
+        url = self.url_template.format(
+            start=start.isoformat(), end=end.isoformat(), since=int(since) if since else ""
+        )
+        response = get_sync_client().get(url)
+        response.raise_for_status()
+        fmt = self.fmt
+        if fmt is None:
+            content_type = response.headers.get("content-type", "")
+            fmt = "json" if "json" in content_type else "ics" if "calendar" in content_type else detect_format(url.split("?")[0], response.text)
+        return PARSERS[fmt](response.text, self.name)
+
+
+class ImportedProvider(CalendarProvider):
+    """Events bulk-loaded with the importer CLI: the store is the only source"""
+
+    name = "imported"
+    ranged = False
+
+    def fetch(self, start: date, end: date, since: Optional[float]) -> List[Dict]:
+        return []
+
+
+class FakeCalendarProvider(CalendarProvider):
+    """
+    Deterministic schedule of recurring macro releases (development and tests)
+    Same range, same events: figures are derived from the date, not random.
+    """
+
+    name = "fake"
+    sample = True
+
+    def __init__(self):
+        self.calls = 0
+
+    @staticmethod
+    def _nth_weekday(day: date) -> int:
+        return (day.day - 1) // 7 + 1
+
+    def _events_on(self, day: date) -> List[Dict]:
+        weekday, nth = day.weekday(), self._nth_weekday(day)
+        last = (day + timedelta(days=7)).month != day.month
+        schedule = []
+        if weekday == 3:
+            schedule.append(("14:30", "US", "Initial Jobless Claims", 2, "K", 220))
+        if weekday == 4 and nth == 1:
+            schedule.append(("14:30", "US", "Non-Farm Payrolls", 3, "K", 180))
+        if weekday == 2 and nth == 2:
+            schedule.append(("14:30", "US", "CPI (Consumer Price Index)", 3, "%", 0.3))
+        if weekday == 3 and nth == 2:
+            schedule.append(("14:15", "EU", "ECB Interest Rate Decision", 3, "%", 4.0))
+        if weekday == 2 and nth == 3:
+            schedule.append(("20:00", "US", "Fed Interest Rate Decision", 3, "%", 5.25))
+        if weekday == 4 and last:
+            schedule.append(("14:30", "US", "Core PCE Price Index", 2, "%", 0.2))
+        if weekday == 1 and nth == 1:
+            schedule.append(("11:00", "EU", "CPI Flash Estimate", 2, "%", 2.4))
+        if weekday == 0 and nth == 2:
+            schedule.append(("03:30", "CN", "CPI YoY", 1, "%", 0.5))
+
+        events = []
+        for event_time, country, name, impact, unit, base in schedule:
+            # Small date-dependent wobble so consecutive releases differ
+            step = (day.toordinal() % 5 - 2) * (0.1 if unit == "%" else 10)
+            events.append(normalize_event({
+                "date": day.isoformat(), "time": event_time, "country": country, "event": name,
+                "impact": impact,
+                "forecast": f"{base + step:g}{unit}",
+                "previous": f"{base:g}{unit}",
+            }, self.name))
+        return events
+
+    def fetch(self, start: date, end: date, since: Optional[float]) -> List[Dict]:
+        self.calls += 1
+        events = []
+        day = start
+        while day <= end:
+            events += self._events_on(day)
+            day += timedelta(days=1)
+        return events
+
+
+def make_provider() -> CalendarProvider:
+    """Provider selected by CALENDAR_PROVIDER (see module docstring)"""
+    kind = os.getenv("CALENDAR_PROVIDER", "").lower()
+    directory = os.getenv("CALENDAR_IMPORT_DIR")
+    url = os.getenv("CALENDAR_PROVIDER_URL")
+    if kind == "files" or (not kind and (directory or os.path.isdir(DEFAULT_IMPORT_DIR))):
+        return FileProvider(directory or DEFAULT_IMPORT_DIR)
+    if kind == "http" or (not kind and url):
+        if not url:
+            raise ValueError("CALENDAR_PROVIDER_URL non impostata")
+        return HTTPProvider(url, os.getenv("CALENDAR_PROVIDER_FORMAT") or None)
+    if kind not in ("", "fake"):
+        print(f"Warning: CALENDAR_PROVIDER '{kind}' sconosciuto, uso dati di esempio")
+    return FakeCalendarProvider()
+
+
+def main():
+    from tools.calendar_store import EventStore
+    from tools.db_pool import get_pool
+
+    parser = argparse.ArgumentParser(
+        description="Importa eventi del calendario economico (CSV, JSON, ICS)",
+        epilog="Senza CALENDAR_PROVIDER il tool serve gli eventi importati in --db (lo stesso "
+               "CALENDAR_DB_PATH dell'API) al posto dei dati di esempio."
+    )
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--source", default="import", help="nome della fonte (prefisso degli id evento)")
+    parser.add_argument("--db", default=os.getenv("CALENDAR_DB_PATH", "data/calendar.db"))
+    args = parser.parse_args()
+
+    store = EventStore(get_pool(args.db))
+    total = 0
+    for path in args.files:
+        events = parse_file(path, args.source)
+        changed = store.upsert_many(events)
+        total += changed
+        print(f"{path}: {len(events)} eventi letti, {changed} nuovi o aggiornati")
+    print(f"Totale: {total} righe modificate; store: {store.stats()}")
+
+
+if __name__ == "__main__":
+    main()
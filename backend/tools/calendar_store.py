@@ -0,0 +1,191 @@
+"""
+Local store for economic calendar events
+
+Events from every provider land in one SQLite table keyed on a stable
+event id, so importing the same export twice (or a newer one with the
+actual figures filled in) updates rows instead of duplicating them. Dates
+are stored as YYYY-MM-DD text and impact as 1 (low) .. 3 (high); the
+indexes on (date, impact, country) and (country, date) answer any range
+plus country/impact filter with a single range scan.
+
+calendar_sync remembers, per source, which date range has been loaded and
+when: a request inside that range and younger than CALENDAR_REFRESH_SECONDS
+(default 3600) reads the store without contacting the provider; otherwise
+only the provider's changes since the last sync are pulled (see
+tools.calendar_import).
+"""
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tools.db_pool import SQLitePool
+
+IMPACT_LEVELS = {1: "Low", 2: "Medium", 3: "High"}
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS calendar_events (
+        event_id TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL DEFAULT '',
+        country TEXT NOT NULL,
+        event TEXT NOT NULL,
+        impact INTEGER NOT NULL,
+        forecast TEXT,
+        previous TEXT,
+        actual TEXT,
+        updated_at INTEGER NOT NULL
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_calendar_date ON calendar_events (date, impact, country)",
+    "CREATE INDEX IF NOT EXISTS idx_calendar_country_date ON calendar_events (country, date)",
+    """CREATE TABLE IF NOT EXISTS calendar_sync (
+        source TEXT PRIMARY KEY,
+        covered_start TEXT,
+        covered_end TEXT,
+        synced_at REAL NOT NULL
+    )""",
+]
+
+# Rows whose content did not change are left alone (updated_at stays put)
+UPSERT_EVENT_SQL = """
+    INSERT INTO calendar_events (event_id, source, date, time, country, event, impact, forecast, previous, actual, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (event_id) DO UPDATE SET
+        date = excluded.date, time = excluded.time, country = excluded.country, event = excluded.event,
+        impact = excluded.impact, forecast = excluded.forecast, previous = excluded.previous,
+        actual = excluded.actual, updated_at = excluded.updated_at
+    WHERE (calendar_events.date, calendar_events.time, calendar_events.country, calendar_events.event,
+           calendar_events.impact, calendar_events.forecast, calendar_events.previous, calendar_events.actual)
+        IS NOT (excluded.date, excluded.time, excluded.country, excluded.event,
+                excluded.impact, excluded.forecast, excluded.previous, excluded.actual)
+"""
+
+SELECT_SYNC_SQL = "SELECT covered_start, covered_end, synced_at FROM calendar_sync WHERE source = ?"
+
+UPSERT_SYNC_SQL = """
+    INSERT INTO calendar_sync (source, covered_start, covered_end, synced_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (source) DO UPDATE SET
+        covered_start = excluded.covered_start, covered_end = excluded.covered_end, synced_at = excluded.synced_at
+"""
+
+EVENT_COLUMNS = ("date", "time", "country", "event", "impact", "forecast", "previous", "actual", "source")
+
+
+class EventStore:
+    """
+    Indexed economic calendar events with per-source sync state
+    """
+
+    def __init__(self, pool: SQLitePool, refresh_interval: float = 3600.0):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self._refresh_lock = threading.Lock()
+        with self.pool.transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def upsert_many(self, events: Iterable[Dict]) -> int:
+        """Insert or update normalized events (see calendar_import.normalize_event); returns rows changed"""
+        now = int(time.time())
+        rows = [
+            (e["event_id"], e["source"], e["date"], e.get("time") or "", e["country"], e["event"],
+             e["impact"], e.get("forecast"), e.get("previous"), e.get("actual"), now)
+            for e in events
+        ]
+        with self.pool.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(UPSERT_EVENT_SQL, rows)
+            return conn.total_changes - before
+
+    def query(self, start: date, end: date, countries: Optional[List[str]] = None,
+              min_impact: int = 1, limit: int = 200) -> List[Dict]:
+        """Events with start <= date <= end, optionally filtered, in chronological order"""
+        sql = f"SELECT {', '.join(EVENT_COLUMNS)} FROM calendar_events WHERE date BETWEEN ? AND ?"
+        params: List = [start.isoformat(), end.isoformat()]
+        if min_impact > 1:
+            sql += " AND impact >= ?"
+            params.append(min_impact)
+        if countries:
+            sql += f" AND country IN ({', '.join('?' * len(countries))})"
+            params += countries
+        sql += " ORDER BY date, time, impact DESC LIMIT ?"
+        params.append(limit)
+        rows = self.pool.connection().execute(sql, params).fetchall()
+        return [dict(zip(EVENT_COLUMNS, row)) for row in rows]
+
+    def has_events(self, exclude_source: Optional[str] = None) -> bool:
+        """Whether any event is stored, optionally ignoring one source"""
+        row = self.pool.connection().execute(
+            "SELECT 1 FROM calendar_events WHERE source IS NOT ? LIMIT 1", (exclude_source,)
+        ).fetchone()
+        return row is not None
+
+    def delete_source(self, source: str) -> int:
+        """Drop every event and the sync state of a source; returns events removed"""
+        with self.pool.transaction() as conn:
+            removed = conn.execute("DELETE FROM calendar_events WHERE source = ?", (source,)).rowcount
+            conn.execute("DELETE FROM calendar_sync WHERE source = ?", (source,))
+        return removed
+
+    def sync_state(self, source: str) -> Optional[Tuple[Optional[str], Optional[str], float]]:
+        return self.pool.connection().execute(SELECT_SYNC_SQL, (source,)).fetchone()
+
+    def refresh(self, provider, start: date, end: date, force: bool = False) -> Optional[int]:
+        """
+        Make sure [start, end] is loaded and fresh for the provider
+        Returns rows changed, or None when the stored data was still valid
+        """
+        with self._refresh_lock:
+            state = self.sync_state(provider.name)
+            now = time.time()
+            covered = False
+            since = None
+            if state is not None:
+                covered_start, covered_end, synced_at = state
+                covered = not provider.ranged or (
+                    covered_start is not None and covered_start <= start.isoformat()
+                    and end.isoformat() <= covered_end
+                )
+                if covered and not force and now - synced_at < self.refresh_interval:
+                    return None
+                # Known range: only what changed since the last sync
+                since = synced_at if covered else None
+
+            if provider.ranged:
+                # Load a margin around the request so neighbouring queries hit the store
+                fetch_start = start - timedelta(days=provider.margin_days)
+                fetch_end = end + timedelta(days=provider.margin_days)
+                if covered:
+                    fetch_start, fetch_end = date.fromisoformat(state[0]), date.fromisoformat(state[1])
+            else:
+                fetch_start, fetch_end = start, end
+
+            changed = self.upsert_many(provider.fetch(fetch_start, fetch_end, since))
+
+            new_start, new_end = fetch_start.isoformat(), fetch_end.isoformat()
+            if state is not None and state[0] is not None and provider.ranged:
+                # Extend the covered range when the new one touches it
+                old_start, old_end = date.fromisoformat(state[0]), date.fromisoformat(state[1])
+                if fetch_start <= old_end + timedelta(days=1) and old_start <= fetch_end + timedelta(days=1):
+                    new_start = min(old_start, fetch_start).isoformat()
+                    new_end = max(old_end, fetch_end).isoformat()
+            with self.pool.transaction() as conn:
+                conn.execute(UPSERT_SYNC_SQL, (
+                    provider.name,
+                    new_start if provider.ranged else None,
+                    new_end if provider.ranged else None,
+                    now,
+                ))
+            return changed
+
+    def stats(self) -> Dict:
+        conn = self.pool.connection()
+        total, first, last = conn.execute("SELECT COUNT(*), MIN(date), MAX(date) FROM calendar_events").fetchone()
+        sources = {
+            source: {"covered": [start, end], "synced_at": synced_at}
+            for source, start, end, synced_at in conn.execute(
+                "SELECT source, covered_start, covered_end, synced_at FROM calendar_sync"
+            )
+        }
+        return {"events": total, "first_date": first, "last_date": last, "sources": sources}
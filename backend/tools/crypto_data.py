@@ -1,12 +1,124 @@
 """
 Crypto Data Tool for CoinGlass, CryptoQuant, Glassnode integration
 """
-import httpx
+import asyncio
 import os
-from typing import Dict, Optional
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from langchain.tools import Tool
 from datetime import datetime, timedelta
 
+from tools.cache import TTLCache, shared_backend
+from tools.http_client import get_async_client, get_sync_client
+
+COINGLASS_BASE_URL = "https://open-api.coinglass.com/public/v2"
+
+# Seconds each data type stays fresh: funding settles every few hours,
+# OI and liquidations move by the minute
+CACHE_TTLS = {
+    "funding": float(os.getenv("CACHE_TTL_FUNDING", "600")),
+    "open_interest": float(os.getenv("CACHE_TTL_OPEN_INTEREST", "60")),
+    "liquidation": float(os.getenv("CACHE_TTL_LIQUIDATION", "60")),
+    "flows": float(os.getenv("CACHE_TTL_FLOWS", "300")),
+}
+
+# Accepted spellings -> canonical data type
+DATA_TYPE_ALIASES = {
+    "funding": "funding",
+    "open_interest": "open_interest",
+    "oi": "open_interest",
+    "liquidation": "liquidation",
+    "liq": "liquidation",
+    "flows": "flows",
+    "exchange_flows": "flows",
+}
+
+# Shared by every CryptoDataTool instance; set MARKET_CACHE_PATH to persist across
+# restarts, or CACHE_BACKEND to share it between API worker processes
+market_cache = TTLCache(
+    "market_data",
+    max_size=int(os.getenv("MARKET_CACHE_SIZE", "512")),
+    backend=shared_backend("market", os.getenv("MARKET_CACHE_PATH"))
+)
+
+# Words joining list items in batch inputs ("BTC e ETH funding")
+BATCH_CONJUNCTIONS = {"e", "and"}
+
+# Common names -> ticker, for free-text queries ("cosa succede a bitcoin")
+COIN_ALIASES = {
+    "BITCOIN": "BTC",
+    "ETHEREUM": "ETH",
+    "ETHER": "ETH",
+    "SOLANA": "SOL",
+    "RIPPLE": "XRP",
+    "CARDANO": "ADA",
+    "DOGECOIN": "DOGE",
+    "BINANCE": "BNB",
+}
+KNOWN_COINS = {"BTC", "ETH", "SOL", "XRP", "ADA", "DOGE", "BNB", "AVAX", "DOT", "LINK", "MATIC", "LTC", "TRX", "TON", "ARB", "OP"}
+# Tickers that are also ordinary words: only matched when written in capitals
+AMBIGUOUS_COINS = {"DOT", "LINK", "TON", "OP", "ARB"}
+
+# Coins asked for by tool calls, for the prefetcher's top-N watchlist. With
+# CACHE_BACKEND (or WEB_CONCURRENCY > 1) every worker adds its counts to the
+# shared store, so the polling worker ranks the requests of all of them
+_request_counts: Counter = Counter()
+_unsynced_counts: Counter = Counter()
+_request_counts_lock = threading.Lock()
+request_counter = shared_backend("requests")
+
+def record_request(coins: List[str]):
+    with _request_counts_lock:
+        _request_counts.update(coin_of(c) for c in coins)
+        if request_counter is not None:
+            _unsynced_counts.update(coin_of(c) for c in coins)
+
+def sync_request_counts():
+    """Push this worker's counts since the last sync to the shared store (blocking I/O)"""
+    global _unsynced_counts
+    if request_counter is None:
+        return
+    with _request_counts_lock:
+        pending, _unsynced_counts = _unsynced_counts, Counter()
+    if not pending:
+        return
+    try:
+        request_counter.add_counts("crypto_data", dict(pending))
+    except Exception as e:
+        print(f"Warning: conteggio richieste condiviso non aggiornato: {e}")
+        with _request_counts_lock:
+            _unsynced_counts.update(pending)
+
+def top_requested(n: int) -> List[str]:
+    """Most requested coins across the workers sharing the store, most frequent first (blocking I/O)"""
+    if request_counter is not None:
+        sync_request_counts()
+        try:
+            return [coin for coin, _ in request_counter.top_counts("crypto_data", n)]
+        except Exception as e:
+            print(f"Warning: conteggio richieste condiviso non leggibile: {e}")
+    with _request_counts_lock:
+        return [coin for coin, _ in _request_counts.most_common(n)]
+
+def coin_of(symbol: str) -> str:
+    """BTCUSDT / BTCUSD / btc -> BTC"""
+    return symbol.upper().replace("USDT", "").replace("USD", "")
+
+def extract_symbols(text: str) -> List[str]:
+    """Coins mentioned in free text, in order of appearance"""
+    found = []
+    for raw in re.findall(r"[A-Za-z]+", text):
+        word = raw.upper()
+        coin = COIN_ALIASES.get(word) or coin_of(word)
+        if coin in AMBIGUOUS_COINS and not raw.isupper():
+            continue
+        if coin in KNOWN_COINS and coin not in found:
+            found.append(coin)
+    return found
+
 class CryptoDataTool:
     """
     Tool for fetching crypto data from various sources
@@ -18,91 +130,165 @@ class CryptoDataTool:
         
 Input: simbolo della coppia (es. "BTCUSDT") e tipo di dato richiesto
 Tipi disponibili: funding, open_interest, liquidation, on_chain, exchange_flows
-        
+
 Esempio: crypto_data("BTCUSDT funding")
          crypto_data("BTCUSDT open_interest")
          crypto_data("BTCUSDT liquidation")
+
+Più simboli e metriche in una sola chiamata (tabella compatta):
+         crypto_data("BTC,ETH,SOL funding,oi,liq")
+         crypto_data("BTC ETH all")
 """
-        
+
         # API keys (should be in environment variables)
         self.coinglass_api_key = os.getenv("COINGLASS_API_KEY", "")
         self.cryptoquant_api_key = os.getenv("CRYPTOQUANT_API_KEY", "")
         self.glassnode_api_key = os.getenv("GLASSNODE_API_KEY", "")
     
-    def _get_funding_rate(self, symbol: str) -> str:
-        """Get funding rate from CoinGlass"""
-        try:
-            # CoinGlass public API (no key needed for basic data)
-            url = "https://open-api.coinglass.com/public/v2/funding"
-            params = {
+    def _coinglass_request(self, endpoint: str, symbol: str) -> Dict:
+        """Build request arguments for a CoinGlass public endpoint"""
+        # CoinGlass public API (no key needed for basic data)
+        return {
+            "url": f"{COINGLASS_BASE_URL}/{endpoint}",
+            "params": {
                 "symbol": symbol.replace("USDT", "").replace("USD", "")
-            }
-            
-            response = httpx.get(url, params=params, timeout=10.0, headers={
+            },
+            "headers": {
                 "accept": "application/json"
-            })
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("data"):
-                    funding_data = data["data"][0] if data["data"] else {}
-                    return f"""Funding Rate per {symbol}:
+            },
+        }
+    
+    def _exchange_flows_request(self, symbol: str) -> Dict:
+        """Build request arguments for CryptoQuant exchange flows"""
+        return {
+            "url": "https://api.cryptoquant.com/v1/btc/exchange-flows",
+            "params": {
+                "exchange": "all",
+                "window": "24h"
+            },
+            "headers": {
+                "Authorization": f"Bearer {self.cryptoquant_api_key}"
+            },
+        }
+    
+    def _build_request(self, data_type: str, symbol: str) -> Dict:
+        """Request arguments for a canonical data type"""
+        if data_type == "flows":
+            return self._exchange_flows_request(symbol)
+        return self._coinglass_request(data_type, symbol)
+    
+    def _cache_key(self, data_type: str, symbol: str) -> str:
+        """BTC, BTCUSD and BTCUSDT share the same upstream data"""
+        return f"{symbol.replace('USDT', '').replace('USD', '')}:{data_type}"
+    
+    def _fetch_payload(self, data_type: str, symbol: str) -> Optional[Dict]:
+        """Fetch the raw JSON payload (None if unavailable) through the market cache"""
+        def fetch():
+            response = get_sync_client().get(**self._build_request(data_type, symbol))
+            return response.json() if response.status_code == 200 else None
+        
+        return market_cache.get_or_fetch(
+            self._cache_key(data_type, symbol), fetch,
+            ttl=CACHE_TTLS[data_type], cache_if=lambda payload: payload is not None
+        )
+    
+    async def afetch_upstream(self, data_type: str, symbol: str) -> Optional[Dict]:
+        """Fetch the raw JSON payload straight from the provider, bypassing the cache"""
+        response = await get_async_client().get(**self._build_request(data_type, symbol))
+        return response.json() if response.status_code == 200 else None
+    
+    def store_snapshot(self, data_type: str, symbol: str, payload: Dict):
+        """Seed the market cache with a payload fetched elsewhere (prefetcher)"""
+        market_cache.set(self._cache_key(data_type, symbol), payload, ttl=CACHE_TTLS[data_type])
+    
+    async def _afetch_payload(self, data_type: str, symbol: str) -> Optional[Dict]:
+        """Async variant of _fetch_payload"""
+        return await market_cache.aget_or_fetch(
+            self._cache_key(data_type, symbol), lambda: self.afetch_upstream(data_type, symbol),
+            ttl=CACHE_TTLS[data_type], cache_if=lambda payload: payload is not None
+        )
+    
+    def _format_funding_rate(self, symbol: str, data: Optional[Dict]) -> str:
+        """Format CoinGlass funding payload"""
+        if data and data.get("data"):
+            funding_data = data["data"][0] if data["data"] else {}
+            return f"""Funding Rate per {symbol}:
 - Funding Rate: {funding_data.get('uMarginList', [{}])[0].get('rate', 'N/A')}%
 - Exchange: {funding_data.get('exchangeName', 'N/A')}
 - Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M')}
 """
-            return f"Dati funding non disponibili per {symbol}"
+        return f"Dati funding non disponibili per {symbol}"
+    
+    def _format_open_interest(self, symbol: str, data: Optional[Dict]) -> str:
+        """Format CoinGlass open interest payload"""
+        if data and data.get("data"):
+            oi_data = data["data"][0] if data["data"] else {}
+            return f"""Open Interest per {symbol}:
+- Open Interest: ${oi_data.get('openInterest', 'N/A')}
+- Exchange: {oi_data.get('exchangeName', 'N/A')}
+- Change 24h: {oi_data.get('change24h', 'N/A')}%
+"""
+        return f"Dati open interest non disponibili per {symbol}"
+    
+    def _format_liquidations(self, symbol: str, data: Optional[Dict]) -> str:
+        """Format CoinGlass liquidation payload"""
+        if data and data.get("data"):
+            liq_data = data["data"][0] if data["data"] else {}
+            return f"""Liquidazioni per {symbol}:
+- Liquidazioni 24h: ${liq_data.get('liquidation24h', 'N/A')}
+- Long: ${liq_data.get('longLiquidation', 'N/A')}
+- Short: ${liq_data.get('shortLiquidation', 'N/A')}
+"""
+        return f"Dati liquidazioni non disponibili per {symbol}"
+    
+    def _format_exchange_flows(self, symbol: str, data: Optional[Dict]) -> str:
+        """Format CryptoQuant exchange flows payload"""
+        if data is not None:
+            coin = symbol.replace("USDT", "").replace("USD", "")
+            return f"""Exchange Flows per {coin}:
+{data}
+"""
+        return f"Dati exchange flows non disponibili"
+    
+    def _get_funding_rate(self, symbol: str) -> str:
+        """Get funding rate from CoinGlass"""
+        try:
+            return self._format_funding_rate(symbol, self._fetch_payload("funding", symbol))
+        except Exception as e:
+            return f"Errore nel recuperare funding rate: {str(e)}"
+    
+    async def _aget_funding_rate(self, symbol: str) -> str:
+        """Async variant of _get_funding_rate"""
+        try:
+            return self._format_funding_rate(symbol, await self._afetch_payload("funding", symbol))
         except Exception as e:
             return f"Errore nel recuperare funding rate: {str(e)}"
     
     def _get_open_interest(self, symbol: str) -> str:
         """Get open interest data"""
         try:
-            # Using CoinGlass for OI
-            url = "https://open-api.coinglass.com/public/v2/open_interest"
-            params = {
-                "symbol": symbol.replace("USDT", "").replace("USD", "")
-            }
-            
-            response = httpx.get(url, params=params, timeout=10.0, headers={
-                "accept": "application/json"
-            })
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("data"):
-                    oi_data = data["data"][0] if data["data"] else {}
-                    return f"""Open Interest per {symbol}:
-- Open Interest: ${oi_data.get('openInterest', 'N/A')}
-- Exchange: {oi_data.get('exchangeName', 'N/A')}
-- Change 24h: {oi_data.get('change24h', 'N/A')}%
-"""
-            return f"Dati open interest non disponibili per {symbol}"
+            return self._format_open_interest(symbol, self._fetch_payload("open_interest", symbol))
+        except Exception as e:
+            return f"Errore nel recuperare open interest: {str(e)}"
+    
+    async def _aget_open_interest(self, symbol: str) -> str:
+        """Async variant of _get_open_interest"""
+        try:
+            return self._format_open_interest(symbol, await self._afetch_payload("open_interest", symbol))
         except Exception as e:
             return f"Errore nel recuperare open interest: {str(e)}"
     
     def _get_liquidations(self, symbol: str) -> str:
         """Get liquidation data"""
         try:
-            url = "https://open-api.coinglass.com/public/v2/liquidation"
-            params = {
-                "symbol": symbol.replace("USDT", "").replace("USD", "")
-            }
-            
-            response = httpx.get(url, params=params, timeout=10.0, headers={
-                "accept": "application/json"
-            })
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("data"):
-                    liq_data = data["data"][0] if data["data"] else {}
-                    return f"""Liquidazioni per {symbol}:
-- Liquidazioni 24h: ${liq_data.get('liquidation24h', 'N/A')}
-- Long: ${liq_data.get('longLiquidation', 'N/A')}
-- Short: ${liq_data.get('shortLiquidation', 'N/A')}
-"""
-            return f"Dati liquidazioni non disponibili per {symbol}"
+            return self._format_liquidations(symbol, self._fetch_payload("liquidation", symbol))
+        except Exception as e:
+            return f"Errore nel recuperare liquidazioni: {str(e)}"
+    
+    async def _aget_liquidations(self, symbol: str) -> str:
+        """Async variant of _get_liquidations"""
+        try:
+            return self._format_liquidations(symbol, await self._afetch_payload("liquidation", symbol))
         except Exception as e:
             return f"Errore nel recuperare liquidazioni: {str(e)}"
     
@@ -113,50 +299,215 @@ Esempio: crypto_data("BTCUSDT funding")
             if not self.cryptoquant_api_key:
                 return "API key CryptoQuant non configurata"
             
-            coin = symbol.replace("USDT", "").replace("USD", "")
-            url = f"https://api.cryptoquant.com/v1/btc/exchange-flows"
-            params = {
-                "exchange": "all",
-                "window": "24h"
-            }
-            headers = {
-                "Authorization": f"Bearer {self.cryptoquant_api_key}"
-            }
-            
-            response = httpx.get(url, params=params, headers=headers, timeout=10.0)
+            return self._format_exchange_flows(symbol, self._fetch_payload("flows", symbol))
+        except Exception as e:
+            return f"Errore nel recuperare exchange flows: {str(e)}"
+    
+    async def _aget_exchange_flows(self, symbol: str) -> str:
+        """Async variant of _get_exchange_flows"""
+        try:
+            if not self.cryptoquant_api_key:
+                return "API key CryptoQuant non configurata"
             
-            if response.status_code == 200:
-                data = response.json()
-                return f"""Exchange Flows per {coin}:
-{data}
-"""
-            return f"Dati exchange flows non disponibili"
+            return self._format_exchange_flows(symbol, await self._afetch_payload("flows", symbol))
         except Exception as e:
             return f"Errore nel recuperare exchange flows: {str(e)}"
     
+    def _parse_input(self, input_str: str) -> Tuple[str, str]:
+        """
+        Parse "SYMBOL TYPE" into (symbol, canonical data type)
+        Raises ValueError with a user-facing message on bad input
+        """
+        parts = input_str.strip().upper().split()
+        if len(parts) < 2:
+            raise ValueError("Formato: SYMBOL TYPE (es. BTCUSDT funding)")
+        
+        symbol = parts[0]
+        data_type = parts[1].lower()
+        
+        if data_type in DATA_TYPE_ALIASES:
+            return symbol, DATA_TYPE_ALIASES[data_type]
+        raise ValueError(f"Tipo di dato non supportato: {data_type}. Tipi disponibili: funding, open_interest, liquidation, flows")
+    
+    def _batch_tokens(self, input_str: str) -> List[str]:
+        return [t for t in re.split(r"[\s,;]+", input_str.strip()) if t and t.lower() not in BATCH_CONJUNCTIONS]
+    
+    def _known_batch_token(self, token: str) -> bool:
+        name = token.lower()
+        return name == "all" or name in DATA_TYPE_ALIASES or coin_of(COIN_ALIASES.get(token.upper(), token)) in KNOWN_COINS
+    
+    def _is_batch(self, input_str: str) -> bool:
+        """
+        Explicit lists ("BTC,ETH funding", "BTC e ETH oi") or inputs made only of
+        known coins and data types ("BTC ETH SOL funding"); anything else is
+        "SYMBOL TYPE" with trailing words ignored
+        """
+        if re.search(r"[,;]", input_str) or BATCH_CONJUNCTIONS & set(input_str.lower().split()):
+            return True
+        tokens = self._batch_tokens(input_str)
+        return len(tokens) > 2 and all(self._known_batch_token(t) for t in tokens)
+    
+    def _parse_batch(self, input_str: str) -> Tuple[List[str], List[str]]:
+        """
+        Parse "BTC,ETH,SOL funding,oi,liq" (or space separated) into (coins, data types)
+        "all" selects every metric available with the configured keys. Tickers
+        outside KNOWN_COINS are only taken when written in capitals ("PEPE"),
+        other unknown words are ignored
+        """
+        symbols, data_types = [], []
+        for token in self._batch_tokens(input_str):
+            name = token.lower()
+            if name == "all":
+                selected = ["funding", "open_interest", "liquidation"]
+                selected += ["flows"] if self.cryptoquant_api_key else []
+            elif name in DATA_TYPE_ALIASES:
+                selected = [DATA_TYPE_ALIASES[name]]
+            else:
+                coin = coin_of(COIN_ALIASES.get(token.upper(), token))
+                if (coin in KNOWN_COINS or token.isupper()) and coin not in symbols:
+                    symbols.append(coin)
+                continue
+            data_types += [t for t in selected if t not in data_types]
+        
+        if not symbols:
+            raise ValueError("Formato: SYMBOL[,SYMBOL...] TYPE[,TYPE...] (es. BTC,ETH funding,oi)")
+        if not data_types:
+            raise ValueError("Nessun tipo di dato riconosciuto. Tipi disponibili: funding, open_interest, liquidation, flows, all")
+        return symbols, data_types
+    
+    def _batch_plan(self, symbols: List[str], data_types: List[str]) -> Dict[Tuple[str, str], Tuple]:
+        """
+        Map every (coin, data type) cell to its upstream request signature;
+        cells sharing a signature (same endpoint and params) are fetched once
+        """
+        plan = {}
+        for coin in symbols:
+            for data_type in data_types:
+                if data_type == "flows" and not self.cryptoquant_api_key:
+                    continue
+                request = self._build_request(data_type, coin)
+                plan[(coin, data_type)] = (request["url"], tuple(sorted(request.get("params", {}).items())))
+        return plan
+    
+    def _summarize(self, data_type: str, data: Optional[Dict]) -> str:
+        """One table cell for a payload"""
+        if data_type == "flows":
+            return str(data)[:40] if data is not None else "n/d"
+        if not data or not data.get("data"):
+            return "n/d"
+        item = data["data"][0] or {}
+        if data_type == "funding":
+            return f"{item.get('uMarginList', [{}])[0].get('rate', 'N/A')}%"
+        if data_type == "open_interest":
+            return f"${item.get('openInterest', 'N/A')} ({item.get('change24h', 'N/A')}%)"
+        return f"${item.get('liquidation24h', 'N/A')} (L ${item.get('longLiquidation', 'N/A')} / S ${item.get('shortLiquidation', 'N/A')})"
+    
+    def _format_table(self, symbols: List[str], data_types: List[str], cells: Dict[Tuple[str, str], str], requests: int) -> str:
+        """Compact markdown table: one row per coin, one column per metric"""
+        lines = [
+            f"Snapshot crypto ({len(symbols)} simboli x {len(data_types)} metriche, "
+            f"{requests} richieste upstream, {datetime.now().strftime('%Y-%m-%d %H:%M')}):",
+            "| Simbolo | " + " | ".join(data_types) + " |",
+            "|---" * (len(data_types) + 1) + "|",
+        ]
+        for coin in symbols:
+            row = [cells.get((coin, t), "API key mancante" if t == "flows" else "n/d") for t in data_types]
+            lines.append(f"| {coin} | " + " | ".join(row) + " |")
+        return "\n".join(lines) + "\n"
+    
+    def _fetch_cell(self, data_type: str, coin: str) -> Optional[Dict]:
+        try:
+            return self._fetch_payload(data_type, coin)
+        except Exception:
+            return None
+    
+    async def _afetch_cell(self, data_type: str, coin: str) -> Optional[Dict]:
+        try:
+            return await self._afetch_payload(data_type, coin)
+        except Exception:
+            return None
+    
+    def get_snapshot(self, input_str: str) -> str:
+        """Multi-symbol x multi-metric snapshot, upstream calls run in parallel"""
+        symbols, data_types = self._parse_batch(input_str)
+        record_request(symbols)
+        plan = self._batch_plan(symbols, data_types)
+        
+        # One representative cell per distinct upstream request
+        unique = {}
+        for cell, signature in plan.items():
+            unique.setdefault(signature, cell)
+        
+        payloads = {}
+        if unique:
+            with ThreadPoolExecutor(max_workers=min(len(unique), 16)) as executor:
+                futures = {
+                    signature: executor.submit(self._fetch_cell, data_type, coin)
+                    for signature, (coin, data_type) in unique.items()
+                }
+                payloads = {signature: future.result() for signature, future in futures.items()}
+        
+        cells = {cell: self._summarize(cell[1], payloads[signature]) for cell, signature in plan.items()}
+        return self._format_table(symbols, data_types, cells, len(unique))
+    
+    async def aget_snapshot(self, input_str: str) -> str:
+        """Async variant of get_snapshot"""
+        symbols, data_types = self._parse_batch(input_str)
+        record_request(symbols)
+        plan = self._batch_plan(symbols, data_types)
+        
+        unique = {}
+        for cell, signature in plan.items():
+            unique.setdefault(signature, cell)
+        
+        results = await asyncio.gather(*[
+            self._afetch_cell(data_type, coin) for coin, data_type in unique.values()
+        ])
+        payloads = dict(zip(unique.keys(), results))
+        
+        cells = {cell: self._summarize(cell[1], payloads[signature]) for cell, signature in plan.items()}
+        return self._format_table(symbols, data_types, cells, len(unique))
+    
     def get_crypto_data(self, input_str: str) -> str:
         """
         Main method to get crypto data
-        Format: "SYMBOL TYPE" (e.g., "BTCUSDT funding")
+        Format: "SYMBOL TYPE" (e.g., "BTCUSDT funding") or a batch ("BTC,ETH funding,oi")
         """
         try:
-            parts = input_str.strip().upper().split()
-            if len(parts) < 2:
-                return "Formato: SYMBOL TYPE (es. BTCUSDT funding)"
-            
-            symbol = parts[0]
-            data_type = parts[1].lower()
-            
-            if data_type == "funding":
-                return self._get_funding_rate(symbol)
-            elif data_type == "open_interest" or data_type == "oi":
-                return self._get_open_interest(symbol)
-            elif data_type == "liquidation" or data_type == "liq":
-                return self._get_liquidations(symbol)
-            elif data_type == "flows" or data_type == "exchange_flows":
-                return self._get_exchange_flows(symbol)
-            else:
-                return f"Tipo di dato non supportato: {data_type}. Tipi disponibili: funding, open_interest, liquidation, flows"
+            if self._is_batch(input_str):
+                return self.get_snapshot(input_str)
+            symbol, data_type = self._parse_input(input_str)
+            record_request([symbol])
+            fetchers = {
+                "funding": self._get_funding_rate,
+                "open_interest": self._get_open_interest,
+                "liquidation": self._get_liquidations,
+                "flows": self._get_exchange_flows,
+            }
+            return fetchers[data_type](symbol)
+        except ValueError as e:
+            return str(e)
+        except Exception as e:
+            return f"Errore nel recuperare dati crypto: {str(e)}"
+    
+    async def aget_crypto_data(self, input_str: str) -> str:
+        """
+        Async variant of get_crypto_data, used by the agent event loop
+        """
+        try:
+            if self._is_batch(input_str):
+                return await self.aget_snapshot(input_str)
+            symbol, data_type = self._parse_input(input_str)
+            record_request([symbol])
+            fetchers = {
+                "funding": self._aget_funding_rate,
+                "open_interest": self._aget_open_interest,
+                "liquidation": self._aget_liquidations,
+                "flows": self._aget_exchange_flows,
+            }
+            return await fetchers[data_type](symbol)
+        except ValueError as e:
+            return str(e)
         except Exception as e:
             return f"Errore nel recuperare dati crypto: {str(e)}"
     
@@ -165,6 +516,7 @@ Esempio: crypto_data("BTCUSDT funding")
         return Tool(
             name=self.name,
             description=self.description,
-            func=self.get_crypto_data
+            func=self.get_crypto_data,
+            coroutine=self.aget_crypto_data
         )
-
+        
\ No newline at end of file
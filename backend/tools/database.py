@@ -1,13 +1,103 @@
 """
 Database Tool for storing and retrieving historical data
 """
-import sqlite3
 import os
+import re
+import queue
+import sqlite3
+import threading
+import time
+import asyncio
 from typing import Dict, List, Optional
 from langchain.tools import Tool
 from datetime import datetime
 import json
 
+from tools.crypto_data import coin_of
+from tools.db_pool import SQLitePool, get_pool
+from tools.timeseries import BLOCK_SCHEMA, SCHEMA as TIMESERIES_SCHEMA, TimeSeriesStore, parse_window
+
+# Statements are kept as constants so each pooled connection compiles them once
+INSERT_ANALYSIS_SQL = """
+    INSERT INTO analyses (symbol, query, report, sources, timestamp, duration_ms)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+RETRIEVE_SINCE_SQL = """
+    SELECT query, report, timestamp FROM analyses
+    WHERE symbol = ? AND created_at >= datetime('now', ?)
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+
+RETRIEVE_LATEST_SQL = """
+    SELECT query, report, timestamp FROM analyses
+    WHERE symbol = ?
+    ORDER BY created_at DESC
+    LIMIT 5
+"""
+
+SEARCH_SQL = """
+    SELECT symbol, query, report, timestamp FROM analyses
+    WHERE query LIKE ? OR report LIKE ?
+    ORDER BY created_at DESC
+    LIMIT 10
+"""
+
+# Ranked full-text search: lower bm25() is a better match
+SEARCH_FTS_SQL = """
+    SELECT a.symbol, a.query, snippet(analyses_fts, -1, '[', ']', '…', 24), a.timestamp,
+           bm25(analyses_fts) AS score
+    FROM analyses_fts
+    JOIN analyses a ON a.id = analyses_fts.rowid
+    WHERE analyses_fts MATCH ?
+    ORDER BY score
+    LIMIT 10
+"""
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Every statement is idempotent so a partially applied step can be re-run.
+MIGRATIONS = [
+    # 1: indexes for retrieve (symbol + time window) and market data lookups
+    [
+        "CREATE INDEX IF NOT EXISTS idx_analyses_symbol_created ON analyses (symbol, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_market_data_symbol_type ON market_data (symbol, data_type, created_at)",
+    ],
+    # 2: FTS5 index over query/report, kept in sync by triggers
+    [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(
+            query, report,
+            content='analyses', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS analyses_fts_ai AFTER INSERT ON analyses BEGIN
+            INSERT INTO analyses_fts (rowid, query, report) VALUES (new.id, new.query, new.report);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS analyses_fts_ad AFTER DELETE ON analyses BEGIN
+            INSERT INTO analyses_fts (analyses_fts, rowid, query, report) VALUES ('delete', old.id, old.query, old.report);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS analyses_fts_au AFTER UPDATE ON analyses BEGIN
+            INSERT INTO analyses_fts (analyses_fts, rowid, query, report) VALUES ('delete', old.id, old.query, old.report);
+            INSERT INTO analyses_fts (rowid, query, report) VALUES (new.id, new.query, new.report);
+        END""",
+        "INSERT INTO analyses_fts (analyses_fts) VALUES ('rebuild')",
+    ],
+    # 3: analysis timing, filled by the background writer
+    [
+        "ALTER TABLE analyses ADD COLUMN duration_ms INTEGER",
+    ],
+    # 4: typed time-series tables for market samples and their rollups
+    TIMESERIES_SCHEMA,
+    # 5: per-day packed minute blocks for bulk history reads
+    BLOCK_SCHEMA,
+]
+
+def _fts_query(search_term: str) -> str:
+    """Turn free text into an FTS5 query of quoted terms (any term may match)"""
+    terms = re.findall(r"\w+", search_term, flags=re.UNICODE)
+    return " OR ".join(f'"{term}"' for term in terms)
+
 class DatabaseTool:
     """
     Tool for database operations (store/retrieve historical data)
@@ -21,61 +111,83 @@ Operazioni disponibili:
 - save: Salva un'analisi o dato
 - retrieve: Recupera dati storici
 - search: Cerca nelle analisi passate
+- stats: Statistiche storiche di una metrica (media, min/max, variazione) su una finestra
 
-Esempio: database("save BTCUSDT analysis 2024-01-15")
+Esempio: database("save BTCUSDT funding positivo, OI in crescita")
          database("retrieve BTCUSDT last_week")
          database("search funding rate BTC")
+         database("stats BTC funding 7d")
+         database("stats ETH oi 24h")
 """
         self.db_path = db_path
+        self.pool = get_pool(db_path)
         self._init_database()
+        self.timeseries = TimeSeriesStore(self.pool)
     
     def _init_database(self):
         """Initialize database tables"""
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS analyses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT,
-                query TEXT,
-                report TEXT,
-                sources TEXT,
-                timestamp TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Create tables
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    symbol TEXT,
+                    query TEXT,
+                    report TEXT,
+                    sources TEXT,
+                    timestamp TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS market_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    symbol TEXT,
+                    data_type TEXT,
+                    data_value TEXT,
+                    timestamp TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS market_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT,
-                data_type TEXT,
-                data_value TEXT,
-                timestamp TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        self._migrate()
+    
+    def _migrate(self):
+        """Apply pending schema migrations"""
+        conn = self.pool.connection()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS, 1):
+            if number <= version:
+                continue
+            try:
+                with conn:
+                    for statement in statements:
+                        try:
+                            conn.execute(statement)
+                        except sqlite3.OperationalError as e:
+                            # ADD COLUMN is not idempotent: tolerate a re-run
+                            if "duplicate column" not in str(e):
+                                raise
+            except sqlite3.OperationalError as e:
+                # SQLite built without FTS5: keep LIKE search, move on
+                if "fts5" not in str(e):
+                    raise
+                print(f"Warning: FTS5 non disponibile, ricerca senza indice full-text ({e})")
+            conn.execute(f"PRAGMA user_version = {number}")
         
-        conn.commit()
-        conn.close()
+        self.fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'analyses_fts'"
+        ).fetchone() is not None
     
     def _save_analysis(self, symbol: str, query: str, report: str, sources: List[str]) -> str:
         """Save analysis to database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO analyses (symbol, query, report, sources, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            """, (symbol, query, report, json.dumps(sources), datetime.now().isoformat()))
-            
-            conn.commit()
-            conn.close()
+            symbol = coin_of(symbol)
+            with self.pool.transaction() as conn:
+                conn.execute(INSERT_ANALYSIS_SQL, (symbol, query, report, json.dumps(sources), datetime.now().isoformat(), None))
             return f"Analisi salvata per {symbol}"
         except Exception as e:
             return f"Errore nel salvare analisi: {str(e)}"
@@ -83,33 +195,15 @@ Esempio: database("save BTCUSDT analysis 2024-01-15")
     def _retrieve_analysis(self, symbol: str, timeframe: str = "last_week") -> str:
         """Retrieve historical analysis"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            symbol = coin_of(symbol)
+            conn = self.pool.connection()
             
             if timeframe == "last_week":
-                cursor.execute("""
-                    SELECT query, report, timestamp FROM analyses
-                    WHERE symbol = ? AND created_at >= datetime('now', '-7 days')
-                    ORDER BY created_at DESC
-                    LIMIT 5
-                """, (symbol,))
+                results = conn.execute(RETRIEVE_SINCE_SQL, (symbol, "-7 days", 5)).fetchall()
             elif timeframe == "last_month":
-                cursor.execute("""
-                    SELECT query, report, timestamp FROM analyses
-                    WHERE symbol = ? AND created_at >= datetime('now', '-30 days')
-                    ORDER BY created_at DESC
-                    LIMIT 10
-                """, (symbol,))
+                results = conn.execute(RETRIEVE_SINCE_SQL, (symbol, "-30 days", 10)).fetchall()
             else:
-                cursor.execute("""
-                    SELECT query, report, timestamp FROM analyses
-                    WHERE symbol = ?
-                    ORDER BY created_at DESC
-                    LIMIT 5
-                """, (symbol,))
-            
-            results = cursor.fetchall()
-            conn.close()
+                results = conn.execute(RETRIEVE_LATEST_SQL, (symbol,)).fetchall()
             
             if not results:
                 return f"Nessuna analisi trovata per {symbol}"
@@ -125,34 +219,60 @@ Esempio: database("save BTCUSDT analysis 2024-01-15")
             return f"Errore nel recuperare analisi: {str(e)}"
     
     def _search_analyses(self, search_term: str) -> str:
-        """Search in historical analyses"""
+        """Search in historical analyses (ranked full-text search when available)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT symbol, query, report, timestamp FROM analyses
-                WHERE query LIKE ? OR report LIKE ?
-                ORDER BY created_at DESC
-                LIMIT 10
-            """, (f"%{search_term}%", f"%{search_term}%"))
+            conn = self.pool.connection()
             
-            results = cursor.fetchall()
-            conn.close()
+            if self.fts_enabled:
+                match = _fts_query(search_term)
+                if not match:
+                    return f"Nessun risultato trovato per: {search_term}"
+                results = [row[:4] for row in conn.execute(SEARCH_FTS_SQL, (match,)).fetchall()]
+            else:
+                results = [
+                    (symbol, query, report[:150] + "...", timestamp)
+                    for symbol, query, report, timestamp
+                    in conn.execute(SEARCH_SQL, (f"%{search_term}%", f"%{search_term}%")).fetchall()
+                ]
             
             if not results:
                 return f"Nessun risultato trovato per: {search_term}"
             
             output = f"Risultati ricerca per '{search_term}':\n\n"
-            for i, (symbol, query, report, timestamp) in enumerate(results, 1):
+            for i, (symbol, query, preview, timestamp) in enumerate(results, 1):
                 output += f"{i}. {symbol} - {query}\n"
                 output += f"   Data: {timestamp}\n"
-                output += f"   Preview: {report[:150]}...\n\n"
+                output += f"   Preview: {preview}\n\n"
             
             return output
         except Exception as e:
             return f"Errore nella ricerca: {str(e)}"
     
+    def _market_stats(self, symbol: str, data_type: str, window: str = "24h") -> str:
+        """Aggregates of a stored metric over a time window"""
+        try:
+            metrics = {"funding": "funding", "open_interest": "open_interest", "oi": "open_interest",
+                       "liquidation": "liquidation", "liq": "liquidation"}
+            if data_type.lower() not in metrics:
+                return "Metriche disponibili per stats: funding, open_interest, liquidation"
+            symbol = coin_of(symbol)
+            stats = self.timeseries.aggregate(symbol, metrics[data_type.lower()], parse_window(window))
+            if stats is None:
+                return f"Nessun dato storico {data_type} per {symbol} nelle ultime {window}"
+            
+            change_pct = f" ({stats['change_pct']:+.2f}%)" if stats["change_pct"] is not None else ""
+            return f"""Statistiche {stats['data_type']} {symbol} ultime {window} ({stats['count']} campioni, risoluzione {stats['resolution']}):
+- Media: {stats['mean']:.6g}
+- Min / Max: {stats['min']:.6g} / {stats['max']:.6g}
+- Primo / Ultimo: {stats['first']:.6g} / {stats['last']:.6g}
+- Variazione: {stats['change']:+.6g}{change_pct}
+- Periodo: {datetime.fromtimestamp(stats['from']).strftime('%Y-%m-%d %H:%M')} - {datetime.fromtimestamp(stats['to']).strftime('%Y-%m-%d %H:%M')}
+"""
+        except ValueError as e:
+            return str(e)
+        except Exception as e:
+            return f"Errore nel calcolare statistiche: {str(e)}"
+    
     def database_operation(self, input_str: str) -> str:
         """
         Main method for database operations
@@ -168,8 +288,11 @@ Esempio: database("save BTCUSDT analysis 2024-01-15")
             
             if operation == "save":
                 # Parse save operation
-                # Format: "save SYMBOL analysis [data]"
-                return "Operazione save: implementare parsing completo"
+                # Format: "save SYMBOL testo dell'analisi"
+                save_parts = params.split(maxsplit=1)
+                if len(save_parts) < 2:
+                    return "Formato: save SYMBOL testo dell'analisi"
+                return self._save_analysis(save_parts[0], "save", save_parts[1], [])
             elif operation == "retrieve":
                 # Parse retrieve operation
                 # Format: "retrieve SYMBOL [timeframe]"
@@ -182,16 +305,155 @@ Esempio: database("save BTCUSDT analysis 2024-01-15")
             elif operation == "search":
                 # Search operation
                 return self._search_analyses(params)
+            elif operation == "stats":
+                # Format: "stats SYMBOL METRIC [window]"
+                stats_parts = params.split()
+                if len(stats_parts) < 2:
+                    return "Formato: stats SYMBOL METRIC [finestra] (es. stats BTC funding 7d)"
+                return self._market_stats(*stats_parts[:3])
             else:
-                return f"Operazione non supportata: {operation}. Operazioni: save, retrieve, search"
+                return f"Operazione non supportata: {operation}. Operazioni: save, retrieve, search, stats"
         except Exception as e:
             return f"Errore nell'operazione database: {str(e)}"
     
+    async def adatabase_operation(self, input_str: str) -> str:
+        """
+        Async variant of database_operation
+        sqlite3 calls run in a worker thread so the event loop is never blocked
+        """
+        return await asyncio.to_thread(self.database_operation, input_str)
+    
     def get_tool(self) -> Tool:
         """Return LangChain Tool instance"""
         return Tool(
             name=self.name,
             description=self.description,
-            func=self.database_operation
+            func=self.database_operation,
+            coroutine=self.adatabase_operation
         )
 
+class AnalysisWriter:
+    """
+    Background writer for completed analyses
+    
+    enqueue() never blocks the request path; a worker thread drains the
+    queue and inserts each batch in a single transaction, flushing when
+    batch_size records are waiting or every flush_interval seconds. After
+    stop() the writer is closed: late analyses are written synchronously.
+    """
+    
+    def __init__(self, pool: SQLitePool, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_queue: Optional[int] = None):
+        self.pool = pool
+        self.batch_size = batch_size or int(os.getenv("ANALYSIS_WRITER_BATCH", "50"))
+        self.flush_interval = flush_interval or float(os.getenv("ANALYSIS_WRITER_INTERVAL", "1.0"))
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue or int(os.getenv("ANALYSIS_WRITER_QUEUE", "10000")))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._closed = False
+        
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+    
+    def start(self):
+        with self._lock:
+            self._start()
+    
+    def _start(self):
+        """Spawn the worker unless running or closed (caller holds the lock)"""
+        if not self._closed and (self._thread is None or not self._thread.is_alive()):
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="analysis-writer", daemon=True)
+            self._thread.start()
+    
+    def enqueue(self, symbol: str, query: str, report: str, sources: List[str],
+                duration_ms: Optional[int] = None) -> bool:
+        """Queue an analysis for persistence; False if the queue is full"""
+        row = (coin_of(symbol) if symbol else None, query, report, json.dumps(sources),
+               datetime.now().isoformat(), duration_ms)
+        with self._lock:
+            # Checked together with the put, so nothing lands after stop()'s drain
+            if not self._closed:
+                self._start()
+                try:
+                    self._queue.put_nowait(row)
+                    return True
+                except queue.Full:
+                    self.dropped += 1
+                    return False
+        # Closed by stop(): no worker drains the queue any more
+        self._flush([row])
+        return True
+    
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stopping.is_set():
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is None:
+                    break
+                batch.append(item)
+            except queue.Empty:
+                pass
+            
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+        
+        # Drain whatever is left on shutdown
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        self._flush(batch)
+    
+    def _flush(self, batch: List[tuple]):
+        if not batch:
+            return
+        try:
+            with self.pool.transaction() as conn:
+                conn.executemany(INSERT_ANALYSIS_SQL, batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Warning: salvataggio analisi fallito ({len(batch)} record): {e}")
+    
+    def stop(self, timeout: float = 10.0):
+        """Flush pending analyses and stop the worker thread"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._stopping.set()
+        try:
+            # Wakes the worker at once; with a full queue it sees _stopping after its current item
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+        if thread.is_alive():
+            print(f"Warning: salvataggio analisi non terminato entro {timeout}s, "
+                  f"{self._queue.qsize()} analisi in coda non salvate")
+            return
+        with self._lock:
+            self._thread = None
+    
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
@@ -1,130 +1,191 @@
 """
 Economic Calendar Tool for macro events
+
+Events are served from a local indexed store (tools.calendar_store) fed by
+the configured provider (tools.calendar_import); a request only reaches the
+provider when its range is not loaded yet or the last sync is older than
+CALENDAR_REFRESH_SECONDS. The store lives in CALENDAR_DB_PATH (default
+data/calendar.db); the sample schedule used when no provider is configured
+goes to its own file (CALENDAR_SAMPLE_DB_PATH, default
+data/calendar_sample.db) so it never mixes with real events. Without a
+configured provider, events bulk-loaded into CALENDAR_DB_PATH with
+`python -m tools.calendar_import` are served in place of the sample.
 """
-import httpx
-from typing import List, Dict
+import asyncio
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from langchain.tools import Tool
-from datetime import datetime, timedelta
+
+from tools.calendar_import import (
+    COUNTRY_ALIASES, CalendarProvider, FakeCalendarProvider, ImportedProvider, make_provider, normalize_country
+)
+from tools.calendar_store import IMPACT_LEVELS, EventStore
+from tools.db_pool import get_pool
+
+# Minimum impact keywords accepted in the tool input
+IMPACT_FILTERS = {"high": 3, "alta": 3, "alto": 3, "medium": 2, "media": 2, "medio": 2, "low": 1}
+COUNTRY_CODES = set(COUNTRY_ALIASES.values())
 
 class EconomicCalendarTool:
     """
     Tool for fetching economic calendar events
     """
-    
-    def __init__(self):
+
+    def __init__(self, store: Optional[EventStore] = None, provider: Optional[CalendarProvider] = None):
         self.name = "economic_calendar"
         self.description = """Usa questo tool per ottenere eventi del calendario economico.
-        
-Input: data (opzionale, formato YYYY-MM-DD) o "today", "tomorrow", "this_week"
+
+Input: periodo ("today", "tomorrow", "this_week", "next_week", una data YYYY-MM-DD
+o un intervallo YYYY-MM-DD..YYYY-MM-DD), seguito da filtri opzionali:
+paesi (US, EU, UK, JP, CN, ...) e impatto minimo (high, medium)
 Output: Lista di eventi macroeconomici
-        
+
 Esempio: economic_calendar("today")
          economic_calendar("2024-01-15")
-         economic_calendar("this_week")
+         economic_calendar("this_week US high")
+         economic_calendar("2024-01-01..2024-01-31 EU,US medium")
 """
-    
-    def _get_events_from_api(self, start_date: str, end_date: str) -> List[Dict]:
-        """Get events from free economic calendar API"""
+        self.provider = provider or make_provider()
+        if store is None:
+            refresh_interval = float(os.getenv("CALENDAR_REFRESH_SECONDS", "3600"))
+            db_path = os.getenv("CALENDAR_DB_PATH", "data/calendar.db")
+            if self.provider.sample:
+                imported = None
+                if provider is None and os.path.exists(db_path):
+                    imported = EventStore(get_pool(db_path), refresh_interval=refresh_interval)
+                if imported is not None and imported.has_events(exclude_source=FakeCalendarProvider.name):
+                    # Real events loaded with the importer CLI win over the sample schedule
+                    self.provider = ImportedProvider()
+                    store = imported
+                else:
+                    db_path = os.getenv("CALENDAR_SAMPLE_DB_PATH", "data/calendar_sample.db")
+            if store is None:
+                store = EventStore(get_pool(db_path), refresh_interval=refresh_interval)
+        self.store = store
+        if not self.provider.sample:
+            # Sample events must never be served as real ones
+            removed = self.store.delete_source(FakeCalendarProvider.name)
+            if removed:
+                print(f"Warning: rimossi {removed} eventi di esempio dal calendario economico")
+        self.max_events = int(os.getenv("CALENDAR_MAX_EVENTS", "100"))
+
+    def _parse_input(self, input_str: str, today: Optional[date] = None) -> Tuple[date, date, str, List[str], int]:
+        """
+        Period and filters from the tool input
+        Returns (start, end, title, countries, min_impact)
+        """
+        today = today or datetime.now().date()
+        start = end = None
+        title = ""
+        countries: List[str] = []
+        min_impact = 1
+
+        for token in re.split(r"[\s,;]+", input_str.strip()):
+            lower = token.lower()
+            if not token:
+                continue
+            period = self._parse_period(lower, today)
+            if period is not None and start is None:
+                start, end, title = period
+            elif lower in IMPACT_FILTERS:
+                min_impact = IMPACT_FILTERS[lower]
+            elif re.fullmatch(r"[a-zA-Z]{2,3}", token) and (token.isupper() or normalize_country(token) in COUNTRY_CODES):
+                country = normalize_country(token)
+                if country not in countries:
+                    countries.append(country)
+
+        if start is None:
+            start, end, title = today, today, today.isoformat()
+        return start, end, title, countries, min_impact
+
+    def _parse_period(self, token: str, today: date) -> Optional[Tuple[date, date, str]]:
+        if token == "today":
+            return today, today, today.isoformat()
+        if token == "tomorrow":
+            day = today + timedelta(days=1)
+            return day, day, day.isoformat()
+        if token in ("this_week", "next_week"):
+            start = today - timedelta(days=today.weekday())
+            if token == "next_week":
+                start += timedelta(days=7)
+            end = start + timedelta(days=6)
+            label = "Questa Settimana" if token == "this_week" else "Prossima Settimana"
+            return start, end, f"{label} ({start.isoformat()} - {end.isoformat()})"
+        match = re.fullmatch(r"(\d{4}-\d{2}-\d{2})(?:\.\.(\d{4}-\d{2}-\d{2}))?", token)
+        if match:
+            try:
+                start = date.fromisoformat(match.group(1))
+                end = date.fromisoformat(match.group(2)) if match.group(2) else start
+            except ValueError:
+                return None
+            if end < start:
+                start, end = end, start
+            if start == end:
+                return start, end, start.isoformat()
+            return start, end, f"{start.isoformat()} - {end.isoformat()}"
+        return None
+
+    def _refresh(self, start: date, end: date):
+        """Bring the store up to date for the range; on failure serve what is stored"""
         try:
-            # Using TradingEconomics API (free tier) or alternative
-            # For demo, we'll use a mock structure that can be replaced with real API
-            
-            # Alternative: Investing.com scraping or other free APIs
-            url = "https://api.tradingeconomics.com/calendar"
-            # Note: Requires API key for full access
-            
-            # Mock data structure for demonstration
-            # In production, replace with actual API call
-            return []
+            self.store.refresh(self.provider, start, end)
         except Exception as e:
-            return []
-    
-    def _get_mock_events(self, date_str: str) -> List[Dict]:
-        """Mock events for demonstration"""
-        events = [
-            {
-                "date": date_str,
-                "time": "14:30",
-                "country": "US",
-                "event": "CPI (Consumer Price Index)",
-                "impact": "High",
-                "forecast": "0.3%",
-                "previous": "0.2%"
-            },
-            {
-                "date": date_str,
-                "time": "16:00",
-                "country": "US",
-                "event": "Fed Interest Rate Decision",
-                "impact": "High",
-                "forecast": "5.25%",
-                "previous": "5.25%"
-            }
-        ]
-        return events
-    
+            print(f"Warning: aggiornamento calendario economico fallito ({self.provider.name}): {e}")
+
+    def _format_events(self, title: str, events: List[Dict], multi_day: bool,
+                       countries: List[str], min_impact: int) -> str:
+        filters = []
+        if countries:
+            filters.append(", ".join(countries))
+        if min_impact > 1:
+            filters.append(f"impatto >= {IMPACT_LEVELS[min_impact]}")
+        suffix = f" [{'; '.join(filters)}]" if filters else ""
+
+        note = "Nota: dati di esempio, nessun provider del calendario configurato (CALENDAR_PROVIDER).\n" if self.provider.sample else ""
+        if not events:
+            return f"Nessun evento economico trovato per {title}{suffix}\n{note}"
+
+        result = f"Calendario Economico - {title}{suffix}:\n\n"
+        for event in events:
+            when = f"{event['date']} {event['time']}" if multi_day else event["time"] or "n/d"
+            result += f"📅 {when.strip()} ({event['country']})\n"
+            result += f"   Evento: {event['event']}\n"
+            result += f"   Impatto: {IMPACT_LEVELS.get(event['impact'], event['impact'])}\n"
+            result += f"   Previsione: {event['forecast'] or 'n/d'}\n"
+            result += f"   Precedente: {event['previous'] or 'n/d'}\n"
+            if event["actual"]:
+                result += f"   Attuale: {event['actual']}\n"
+            result += "\n"
+
+        if len(events) >= self.max_events:
+            result += f"(mostrati i primi {self.max_events} eventi: restringi periodo o filtri)\n"
+        return result + note
+
     def get_calendar(self, input_str: str) -> str:
         """
         Main method to get economic calendar
         """
         try:
-            input_str = input_str.strip().lower()
-            
-            # Parse date input
-            if input_str == "today":
-                date = datetime.now()
-            elif input_str == "tomorrow":
-                date = datetime.now() + timedelta(days=1)
-            elif input_str == "this_week":
-                # Get events for the week
-                today = datetime.now()
-                start_date = today - timedelta(days=today.weekday())
-                end_date = start_date + timedelta(days=6)
-                
-                result = f"Calendario Economico - Questa Settimana ({start_date.strftime('%Y-%m-%d')} - {end_date.strftime('%Y-%m-%d')}):\n\n"
-                
-                # For demo, return mock events
-                events = self._get_mock_events(today.strftime("%Y-%m-%d"))
-                for event in events:
-                    result += f"📅 {event['date']} {event['time']} ({event['country']})\n"
-                    result += f"   Evento: {event['event']}\n"
-                    result += f"   Impatto: {event['impact']}\n"
-                    result += f"   Previsione: {event['forecast']}\n"
-                    result += f"   Precedente: {event['previous']}\n\n"
-                
-                return result
-            else:
-                # Try to parse as date
-                try:
-                    date = datetime.strptime(input_str, "%Y-%m-%d")
-                except:
-                    date = datetime.now()
-            
-            date_str = date.strftime("%Y-%m-%d")
-            
-            # Get events (mock for now, replace with real API)
-            events = self._get_mock_events(date_str)
-            
-            if not events:
-                return f"Nessun evento economico trovato per {date_str}"
-            
-            result = f"Calendario Economico - {date_str}:\n\n"
-            for event in events:
-                result += f"📅 {event['time']} ({event['country']})\n"
-                result += f"   Evento: {event['event']}\n"
-                result += f"   Impatto: {event['impact']}\n"
-                result += f"   Previsione: {event['forecast']}\n"
-                result += f"   Precedente: {event['previous']}\n\n"
-            
-            return result
+            start, end, title, countries, min_impact = self._parse_input(input_str)
+            self._refresh(start, end)
+            events = self.store.query(start, end, countries, min_impact, limit=self.max_events)
+            return self._format_events(title, events, start != end, countries, min_impact)
         except Exception as e:
             return f"Errore nel recuperare calendario economico: {str(e)}"
-    
+
+    async def aget_calendar(self, input_str: str) -> str:
+        """
+        Async variant of get_calendar (store reads and provider refreshes run off the event loop)
+        """
+        return await asyncio.to_thread(self.get_calendar, input_str)
+
     def get_tool(self) -> Tool:
         """Return LangChain Tool instance"""
         return Tool(
             name=self.name,
             description=self.description,
-            func=self.get_calendar
+            func=self.get_calendar,
+            coroutine=self.aget_calendar
         )
-
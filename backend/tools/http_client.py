@@ -0,0 +1,220 @@
+"""
+Shared HTTP client pool for all outbound data sources
+
+A single process-wide httpx.AsyncClient (plus a sync twin for CLI use) is
+created on FastAPI startup and closed on shutdown, so every tool reuses
+keep-alive connections instead of paying DNS + TCP + TLS per request.
+
+Configuration (environment variables):
+- HTTP_MAX_CONNECTIONS: total connections in the pool (default 100)
+- HTTP_MAX_KEEPALIVE: idle keep-alive connections kept open (default 20)
+- HTTP_KEEPALIVE_EXPIRY: seconds an idle connection is kept (default 30)
+- HTTP_PER_HOST_CONNECTIONS: concurrent requests per host (default 10)
+- HTTP_TIMEOUT: default read/write/pool timeout in seconds (default 10)
+- HTTP_CONNECT_TIMEOUT: connect timeout in seconds (default 5)
+- HTTP2_ENABLED: "true" to negotiate HTTP/2 (requires the h2 package)
+"""
+import asyncio
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+import httpx
+
+
+class _ReleasingAsyncStream(httpx.AsyncByteStream):
+    """Response body wrapper that frees the host slot once the body is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class _ReleasingSyncStream(httpx.SyncByteStream):
+    """Sync counterpart of _ReleasingAsyncStream"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class _HostLimitedAsyncTransport(httpx.AsyncBaseTransport):
+    """Caps in-flight requests per host on top of the global pool limits"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, per_host: int):
+        self._transport = transport
+        self._per_host = per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        semaphore = self._semaphores.setdefault(request.url.host, asyncio.Semaphore(self._per_host))
+        await semaphore.acquire()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingAsyncStream(response.stream, semaphore.release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class _HostLimitedTransport(httpx.BaseTransport):
+    """Sync counterpart of _HostLimitedAsyncTransport"""
+
+    def __init__(self, transport: httpx.BaseTransport, per_host: int):
+        self._transport = transport
+        self._per_host = per_host
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            semaphore = self._semaphores.setdefault(
+                request.url.host, threading.BoundedSemaphore(self._per_host)
+            )
+        semaphore.acquire()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingSyncStream(response.stream, semaphore.release),
+            extensions=response.extensions,
+        )
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class HTTPClientPool:
+    """
+    Lifecycle-managed pair of shared httpx clients
+    """
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.per_host_limit = int(os.getenv("HTTP_PER_HOST_CONNECTIONS", "10"))
+        self.timeout = float(os.getenv("HTTP_TIMEOUT", "10"))
+        self.connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+        self.http2 = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("Warning: HTTP2_ENABLED richiede il pacchetto h2 (pip install httpx[http2]), uso HTTP/1.1")
+                self.http2 = False
+
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        """Return the shared async client, creating it on first use"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        # Connections are bound to the loop that opened them; a client
+        # created under another (now closed) loop cannot be reused
+        if self._async_client is None or self._async_client.is_closed or (
+            loop is not None and self._async_loop is not None and loop is not self._async_loop
+        ):
+            transport = httpx.AsyncHTTPTransport(limits=self._limits(), http2=self.http2)
+            self._async_client = httpx.AsyncClient(
+                transport=_HostLimitedAsyncTransport(transport, self.per_host_limit),
+                timeout=self._timeout(),
+                follow_redirects=True,
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    def get_sync_client(self) -> httpx.Client:
+        """Return the shared sync client, creating it on first use"""
+        with self._lock:
+            if self._sync_client is None or self._sync_client.is_closed:
+                transport = httpx.HTTPTransport(limits=self._limits(), http2=self.http2)
+                self._sync_client = httpx.Client(
+                    transport=_HostLimitedTransport(transport, self.per_host_limit),
+                    timeout=self._timeout(),
+                    follow_redirects=True,
+                )
+            return self._sync_client
+
+    def startup(self) -> None:
+        """Open the async client eagerly (called from the FastAPI lifespan)"""
+        self.get_async_client()
+
+    async def shutdown(self) -> None:
+        """Close both clients and release pooled connections"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
+        with self._lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
+
+
+# Process-wide pool shared by all tools
+http_pool = HTTPClientPool()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared async client for tool coroutines"""
+    return http_pool.get_async_client()
+
+
+def get_sync_client() -> httpx.Client:
+    """Shared sync client for CLI / sync tool paths"""
+    return http_pool.get_sync_client()
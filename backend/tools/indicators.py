@@ -0,0 +1,328 @@
+"""
+Indicator Tool: vectorized analytics over stored market history
+
+Loads every funding / open interest / liquidation sample of a symbol in
+one bulk read from the time-series store and computes, with NumPy:
+- rolling means and z-score of the latest value (1h and 24h windows)
+- percent change over 1h / 24h / 7d
+- funding-OI divergence: rolling z-scores moving in opposite directions
+- liquidation clusters: runs of abnormally large liquidation samples
+
+Minute history comes from the packed daily blocks plus today's raw
+samples; windows beyond block retention use the hourly/daily rollups.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.tools import Tool
+
+from tools.crypto_data import coin_of
+from tools.timeseries import DAY, HOUR, MINUTE, TimeSeriesStore, parse_window
+
+# The IN list lets SQLite seek one primary-key range per metric
+LOAD_RAW_SQL = """
+    SELECT data_type, ts, value, long_value, short_value FROM market_samples
+    WHERE symbol = ? AND data_type IN ('funding', 'open_interest', 'liquidation') AND ts >= ?
+    ORDER BY data_type, ts
+"""
+
+LOAD_ROLLUP_SQL = """
+    SELECT data_type, bucket, sum / count, NULL, NULL FROM {table}
+    WHERE symbol = ? AND bucket >= ? ORDER BY data_type, bucket
+"""
+
+STEPS = {"1m": MINUTE, "1h": HOUR, "1d": DAY}
+
+
+def _window_sums(ts: np.ndarray, values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sum, sum of squares and count over the samples in (ts - window, ts], via cumulative sums"""
+    # Windows are in seconds: gaps in the history do not stretch them
+    idx = np.arange(1, len(values) + 1)
+    lo = np.searchsorted(ts, ts - window, side="right")
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    csq = np.concatenate(([0.0], np.cumsum(values * values)))
+    return csum[idx] - csum[lo], csq[idx] - csq[lo], idx - lo
+
+
+def rolling_mean(ts: np.ndarray, values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over the last `window` seconds (shorter at the start)"""
+    # Centering keeps the cumulative sums well conditioned for large values (OI)
+    offset = values.mean()
+    total, _, n = _window_sums(ts, values - offset, window)
+    return total / n + offset
+
+
+def rolling_zscore(ts: np.ndarray, values: np.ndarray, window: int) -> np.ndarray:
+    """Z-score of each sample against its trailing `window` seconds"""
+    centered = values - values.mean()
+    total, squares, n = _window_sums(ts, centered, window)
+    mean = total / n
+    std = np.sqrt(np.maximum(squares / n - mean * mean, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(std > 0, (centered - mean) / std, 0.0)
+
+
+def pct_change(ts: np.ndarray, values: np.ndarray, horizon: int) -> Optional[float]:
+    """Percent change of the latest value against the value `horizon` seconds earlier"""
+    if len(values) < 2:
+        return None
+    i = np.searchsorted(ts, ts[-1] - horizon, side="left")
+    if i >= len(values) - 1 or ts[i] > ts[-1] - horizon + horizon // 2:
+        return None
+    base = values[i]
+    return float((values[-1] - base) / abs(base) * 100) if base else None
+
+
+def align(ts_a: np.ndarray, ts_b: np.ndarray, values_b: np.ndarray) -> np.ndarray:
+    """Values of series b carried forward onto the timestamps of series a"""
+    idx = np.searchsorted(ts_b, ts_a, side="right") - 1
+    out = np.full(len(ts_a), np.nan)
+    valid = idx >= 0
+    out[valid] = values_b[idx[valid]]
+    return out
+
+
+def clusters(ts: np.ndarray, mask: np.ndarray, max_gap: int) -> List[Tuple[int, int]]:
+    """(start index, end index) of runs of flagged samples closer than max_gap seconds"""
+    hits = np.flatnonzero(mask)
+    if len(hits) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ts[hits]) > max_gap)
+    starts = np.concatenate(([hits[0]], hits[breaks + 1]))
+    ends = np.concatenate((hits[breaks], [hits[-1]]))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _zscore_window(step: int) -> int:
+    """24h in seconds, widened to two samples at daily resolution"""
+    return max(DAY, 2 * step)
+
+
+class IndicatorEngine:
+    """
+    Bulk-loads a symbol's history and computes indicators on NumPy arrays
+    """
+
+    def __init__(self, store: TimeSeriesStore, zscore_threshold: float = 2.0, cluster_threshold: float = 3.0):
+        self.store = store
+        self.zscore_threshold = zscore_threshold
+        self.cluster_threshold = cluster_threshold
+
+    def _split(self, rows: List[Tuple]) -> Dict[str, Dict[str, np.ndarray]]:
+        """(data_type, ts, value, long, short) rows ordered by data_type -> per-metric arrays"""
+        series = {}
+        if not rows:
+            return series
+        types = np.array([r[0] for r in rows])
+        data = np.array([r[1:] for r in rows], dtype=float)
+        # Rows are ordered by data_type: split at the boundaries
+        bounds = np.flatnonzero(types[1:] != types[:-1]) + 1
+        for lo, hi in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(rows)]))):
+            block = data[lo:hi]
+            series[str(types[lo])] = {
+                "ts": block[:, 0].astype(np.int64),
+                "value": block[:, 1],
+                "long": block[:, 2],
+                "short": block[:, 3],
+            }
+        return series
+
+    def _load_minutes(self, symbol: str, start: int) -> Dict[str, Dict[str, np.ndarray]]:
+        """Packed daily blocks for closed days plus raw samples for the rest"""
+        parts: Dict[str, Dict[str, List[np.ndarray]]] = {}
+        block_end: Dict[str, int] = {}
+        for data_type, day, minutes, value, longs, shorts in self.store.load_blocks(symbol, start // DAY * DAY):
+            count = len(value) // 8
+            nan = np.full(count, np.nan)
+            p = parts.setdefault(data_type, {"ts": [], "value": [], "long": [], "short": []})
+            p["ts"].append(day + np.frombuffer(minutes, dtype=np.uint16).astype(np.int64) * MINUTE)
+            p["value"].append(np.frombuffer(value, dtype=np.float64))
+            p["long"].append(np.frombuffer(longs, dtype=np.float64) if longs else nan)
+            p["short"].append(np.frombuffer(shorts, dtype=np.float64) if shorts else nan)
+            block_end[data_type] = day + DAY
+
+        raw_start = max(start, min(block_end.values())) if block_end else start
+        raw = self._split(self.store.pool.connection().execute(LOAD_RAW_SQL, (symbol, raw_start)).fetchall())
+        for data_type, s in raw.items():
+            newer = s["ts"] >= block_end.get(data_type, start)
+            p = parts.setdefault(data_type, {"ts": [], "value": [], "long": [], "short": []})
+            for key in p:
+                p[key].append(s[key][newer])
+
+        series = {}
+        for data_type, p in parts.items():
+            merged = {key: np.concatenate(chunks) for key, chunks in p.items()}
+            inside = merged["ts"] >= start
+            if inside.any():
+                series[data_type] = {key: arr[inside] for key, arr in merged.items()}
+        return series
+
+    def load(self, symbol: str, window: int, now: Optional[int] = None) -> Tuple[str, Dict[str, Dict[str, np.ndarray]]]:
+        """Bulk read of every metric of the symbol -> resolution, {metric: {ts, value, long, short}}"""
+        now = int(now or time.time())
+        start = now - window
+        if start >= now - max(self.store.block_retention, self.store.raw_retention):
+            return "1m", self._load_minutes(symbol, start)
+
+        resolution = self.store.resolution_for(start, now)
+        table = "market_rollup_1h" if resolution == "1h" else "market_rollup_1d"
+        rows = self.store.pool.connection().execute(LOAD_ROLLUP_SQL.format(table=table), (symbol, start)).fetchall()
+        return resolution, self._split(rows)
+
+    def _metric_summary(self, s: Dict[str, np.ndarray], step: int) -> Dict:
+        ts, values = s["ts"], s["value"]
+        short_w, long_w = max(HOUR, step), _zscore_window(step)
+        # Only the latest point is reported: evaluate the rolling windows on the tail
+        tail = np.searchsorted(ts, ts[-1] - long_w, side="right")
+        tail_ts, tail_values = ts[tail:], values[tail:]
+        return {
+            "samples": int(len(values)),
+            "last": float(values[-1]),
+            "mean_1h": float(rolling_mean(tail_ts, tail_values, short_w)[-1]),
+            "mean_24h": float(rolling_mean(tail_ts, tail_values, long_w)[-1]),
+            "zscore_24h": float(rolling_zscore(tail_ts, tail_values, long_w)[-1]),
+            "change_1h": pct_change(ts, values, HOUR),
+            "change_24h": pct_change(ts, values, DAY),
+            "change_7d": pct_change(ts, values, 7 * DAY),
+        }
+
+    def _divergence(self, funding: Dict[str, np.ndarray], oi: Dict[str, np.ndarray], step: int) -> Optional[Dict]:
+        """Funding and OI z-scores pulling in opposite directions"""
+        oi_on_funding = align(funding["ts"], oi["ts"], oi["value"])
+        valid = ~np.isnan(oi_on_funding)
+        if valid.sum() < 3:
+            return None
+        ts = funding["ts"][valid]
+        window = _zscore_window(step)
+        z_funding = rolling_zscore(ts, funding["value"][valid], window)
+        z_oi = rolling_zscore(ts, oi_on_funding[valid], window)
+        spread = z_funding - z_oi
+        diverging = (np.sign(z_funding) != np.sign(z_oi)) & (np.abs(spread) >= 2 * self.zscore_threshold)
+        return {
+            "spread": float(spread[-1]),
+            "diverging_now": bool(diverging[-1]),
+            "episodes": len(clusters(ts, diverging, 4 * step)),
+            "correlation": float(np.corrcoef(z_funding, z_oi)[0, 1]) if len(ts) > 2 and z_funding.std() and z_oi.std() else None,
+        }
+
+    def _liquidation_clusters(self, liq: Dict[str, np.ndarray], step: int, limit: int = 3) -> List[Dict]:
+        """Largest runs of liquidation samples above cluster_threshold sigma"""
+        ts, values = liq["ts"], liq["value"]
+        if len(values) < 3:
+            return []
+        flagged = rolling_zscore(ts, values, _zscore_window(step)) >= self.cluster_threshold
+        runs = clusters(ts, flagged, max(15 * MINUTE, 2 * step))
+        if not runs:
+            return []
+        # Everything flagged between two run starts belongs to the first run
+        peaks = np.maximum.reduceat(np.where(flagged, values, -np.inf), [lo for lo, _ in runs])
+        found = []
+        for i in np.argsort(peaks)[::-1][:limit]:
+            lo, hi = runs[i]
+            longs = np.nansum(liq["long"][lo:hi + 1])
+            shorts = np.nansum(liq["short"][lo:hi + 1])
+            found.append({
+                "start": int(ts[lo]),
+                "end": int(ts[hi]),
+                "samples": hi - lo + 1,
+                "peak": float(peaks[i]),
+                "side": "long" if longs > shorts else "short" if shorts > longs else "n/d",
+            })
+        return found
+
+    def compute(self, symbol: str, window: int, now: Optional[int] = None) -> Dict:
+        resolution, series = self.load(symbol, window, now)
+        step = STEPS[resolution]
+        result = {"symbol": symbol, "resolution": resolution, "metrics": {}}
+        for metric, s in series.items():
+            result["metrics"][metric] = self._metric_summary(s, step)
+        if "funding" in series and "open_interest" in series:
+            result["divergence"] = self._divergence(series["funding"], series["open_interest"], step)
+        if "liquidation" in series:
+            result["liquidation_clusters"] = self._liquidation_clusters(series["liquidation"], step)
+        return result
+
+
+def _pct(value: Optional[float]) -> str:
+    return f"{value:+.2f}%" if value is not None else "n/d"
+
+
+class IndicatorTool:
+    """
+    Tool exposing IndicatorEngine to the agent
+    """
+
+    def __init__(self, store: TimeSeriesStore):
+        self.name = "indicators"
+        self.description = """Usa questo tool per indicatori statistici sullo storico di mercato salvato.
+
+Input: simbolo e finestra opzionale (default 7d)
+Output: medie mobili, z-score, variazioni %, divergenza funding-OI, cluster di liquidazioni
+
+Esempio: indicators("BTC 7d")
+         indicators("ETHUSDT 30d")
+"""
+        self.engine = IndicatorEngine(store)
+
+    def _format(self, result: Dict, window: str) -> str:
+        if not result["metrics"]:
+            return f"Nessuno storico disponibile per {result['symbol']} ({window})"
+
+        output = f"Indicatori {result['symbol']} ultime {window} (risoluzione {result['resolution']}):\n"
+        for metric, m in result["metrics"].items():
+            output += (
+                f"- {metric}: ultimo {m['last']:.6g}, media 1h {m['mean_1h']:.6g}, media 24h {m['mean_24h']:.6g}, "
+                f"z-score 24h {m['zscore_24h']:+.2f}, var 1h {_pct(m['change_1h'])}, "
+                f"24h {_pct(m['change_24h'])}, 7d {_pct(m['change_7d'])} ({m['samples']} campioni)\n"
+            )
+
+        divergence = result.get("divergence")
+        if divergence:
+            state = "IN DIVERGENZA" if divergence["diverging_now"] else "allineati"
+            corr = f"{divergence['correlation']:+.2f}" if divergence["correlation"] is not None else "n/d"
+            output += (f"- Funding vs OI: {state} (spread z {divergence['spread']:+.2f}, "
+                       f"correlazione {corr}, {divergence['episodes']} episodi di divergenza)\n")
+
+        clusters_found = result.get("liquidation_clusters")
+        if clusters_found:
+            output += "- Cluster liquidazioni:\n"
+            for c in clusters_found:
+                start = datetime.fromtimestamp(c["start"]).strftime("%Y-%m-%d %H:%M")
+                end = datetime.fromtimestamp(c["end"]).strftime("%H:%M")
+                output += f"  {start}-{end}: picco ${c['peak']:.6g}, {c['samples']} campioni, prevalenza {c['side']}\n"
+        elif "liquidation" in result["metrics"]:
+            output += "- Nessun cluster di liquidazioni anomalo\n"
+        return output
+
+    def get_indicators(self, input_str: str) -> str:
+        """
+        Main method
+        Format: "SYMBOL [window]" (e.g., "BTC 7d")
+        """
+        try:
+            parts = input_str.strip().split()
+            if not parts:
+                return "Formato: SYMBOL [finestra] (es. BTC 7d)"
+            window = parts[1] if len(parts) > 1 else "7d"
+            result = self.engine.compute(coin_of(parts[0]), parse_window(window))
+            return self._format(result, window)
+        except ValueError as e:
+            return str(e)
+        except Exception as e:
+            return f"Errore nel calcolare indicatori: {str(e)}"
+
+    async def aget_indicators(self, input_str: str) -> str:
+        """Async variant: the bulk read and NumPy work run in a worker thread"""
+        return await asyncio.to_thread(self.get_indicators, input_str)
+
+    def get_tool(self) -> Tool:
+        """Return LangChain Tool instance"""
+        return Tool(
+            name=self.name,
+            description=self.description,
+            func=self.get_indicators,
+            coroutine=self.aget_indicators
+        )
@@ -0,0 +1,205 @@
+"""
+Background market-data prefetcher
+
+Keeps hot symbols warm so tool calls for them are served from the market
+cache instead of hitting CoinGlass/CryptoQuant at request time. Each metric
+is polled on its own interval, a bit shorter than its cache TTL, and every
+numeric sample is also recorded in the time-series store (tools.timeseries),
+whose rollups and retention are maintained from the same loop.
+
+The watchlist is PREFETCH_WATCHLIST (default BTC,ETH) plus the
+PREFETCH_TOP_N coins most requested through crypto_data, refreshed every
+PREFETCH_TOP_REFRESH seconds (default 60). With a shared cache store the
+counts of every worker are used: standby workers push theirs while they wait.
+
+With several API worker processes only one of them polls: the first to
+take an exclusive lock on PREFETCH_LOCK_PATH; the others stay on standby
+and take over if it exits.
+
+Configuration (environment variables):
+- PREFETCH_ENABLED: start the prefetcher with the API (default false)
+- PREFETCH_WATCHLIST: comma-separated coins always kept warm
+- PREFETCH_TOP_N: extra coins taken from request frequency (default 5)
+- PREFETCH_TOP_REFRESH: seconds between re-rankings of the requested coins (default 60)
+- PREFETCH_INTERVAL_<METRIC>: seconds between polls of a metric
+  (FUNDING, OPEN_INTEREST, LIQUIDATION, FLOWS; default 80% of its cache TTL)
+- TS_MAINTENANCE_INTERVAL: seconds between rollup/retention passes (default 300)
+- PREFETCH_LOCK_PATH: lock file electing the polling worker (default data/prefetch.lock)
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+from tools.cache import register_cache
+from tools.crypto_data import CACHE_TTLS, CryptoDataTool, coin_of, sync_request_counts, top_requested
+from tools.database import DatabaseTool
+from tools.timeseries import sample_values
+
+
+class MarketPrefetcher:
+    """
+    Polls the watchlist on per-metric intervals from an asyncio task
+    """
+
+    def __init__(self, crypto_tool: Optional[CryptoDataTool] = None, database: Optional[DatabaseTool] = None):
+        self.crypto_tool = crypto_tool or CryptoDataTool()
+        self.database = database or DatabaseTool()
+
+        self.watchlist = [
+            coin_of(c.strip()) for c in os.getenv("PREFETCH_WATCHLIST", "BTC,ETH").split(",") if c.strip()
+        ]
+        self.top_n = int(os.getenv("PREFETCH_TOP_N", "5"))
+        self.top_refresh = float(os.getenv("PREFETCH_TOP_REFRESH", "60"))
+        self._top: List[str] = []
+        self._next_top = 0.0
+
+        metrics = ["funding", "open_interest", "liquidation"]
+        if self.crypto_tool.cryptoquant_api_key:
+            metrics.append("flows")
+        self.intervals = {
+            metric: float(os.getenv(f"PREFETCH_INTERVAL_{metric.upper()}", str(CACHE_TTLS[metric] * 0.8)))
+            for metric in metrics
+        }
+
+        self.maintenance_interval = float(os.getenv("TS_MAINTENANCE_INTERVAL", "300"))
+        self._next_maintenance = 0.0
+        
+        # (coin, metric) -> monotonic time of the next poll
+        self._due: Dict[Tuple[str, str], float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.lock_path = os.getenv("PREFETCH_LOCK_PATH", "data/prefetch.lock")
+        self._lock_file = None
+
+        self.polls = 0
+        self.failures = 0
+        self.last_poll: Optional[str] = None
+
+        register_cache("market_prefetch", self)
+
+    def symbols(self) -> List[str]:
+        """Static watchlist followed by the most requested coins"""
+        symbols = list(self.watchlist)
+        for coin in self._top:
+            if coin not in symbols:
+                symbols.append(coin)
+        return symbols
+
+    def _due_now(self) -> List[Tuple[str, str]]:
+        now = time.monotonic()
+        due = []
+        for coin in self.symbols():
+            for metric, interval in self.intervals.items():
+                if self._due.get((coin, metric), 0.0) <= now:
+                    self._due[(coin, metric)] = now + interval
+                    due.append((coin, metric))
+        return due
+
+    async def _poll(self, coin: str, metric: str) -> Optional[Dict]:
+        try:
+            return await self.crypto_tool.afetch_upstream(metric, coin)
+        except Exception:
+            return None
+
+    async def run_once(self) -> int:
+        """Poll every due (coin, metric) concurrently; returns samples stored"""
+        due = self._due_now()
+        if not due:
+            return 0
+
+        payloads = await asyncio.gather(*[self._poll(coin, metric) for coin, metric in due])
+        ts = int(time.time())
+        rows = []
+        for (coin, metric), payload in zip(due, payloads):
+            self.polls += 1
+            if payload is None:
+                self.failures += 1
+                continue
+            self.crypto_tool.store_snapshot(metric, coin, payload)
+            values = sample_values(metric, payload)
+            if values is not None:
+                rows.append((coin, metric, ts, *values))
+
+        if rows:
+            await asyncio.to_thread(self.database.timeseries.record_many, rows)
+        self.last_poll = datetime.fromtimestamp(ts).isoformat()
+        return len(rows)
+
+    async def _refresh_top(self):
+        if time.monotonic() >= self._next_top:
+            self._next_top = time.monotonic() + self.top_refresh
+            self._top = await asyncio.to_thread(top_requested, self.top_n)
+
+    async def _maintain(self):
+        if time.monotonic() >= self._next_maintenance:
+            self._next_maintenance = time.monotonic() + self.maintenance_interval
+            await asyncio.to_thread(self.database.timeseries.maintain)
+
+    async def _run(self):
+        if not self._acquire_leadership():
+            print(f"[prefetch] standby (pid {os.getpid()}): un altro worker detiene {self.lock_path}")
+            while not self._acquire_leadership():
+                await asyncio.sleep(30.0)
+                # The leader ranks coins from the shared counts
+                await asyncio.to_thread(sync_request_counts)
+        while True:
+            try:
+                await self._refresh_top()
+                await self.run_once()
+                await self._maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: prefetch market data fallito: {e}")
+            await asyncio.sleep(1.0)
+
+    def _acquire_leadership(self) -> bool:
+        """Exclusive, non-blocking lock held for the life of the process"""
+        if fcntl is None:
+            return True
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self):
+        """Start polling on the running event loop (after winning the worker lock)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock_file is not None:
+            # Closing releases the lock for a restarted worker
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._task is not None,
+            "leader": fcntl is None or self._lock_file is not None,
+            "symbols": self.symbols(),
+            "intervals": self.intervals,
+            "polls": self.polls,
+            "failures": self.failures,
+            "last_poll": self.last_poll,
+        }
@@ -1,118 +1,271 @@
 """
 News Scraper Tool for financial and crypto news
 """
-import httpx
-from bs4 import BeautifulSoup
-from typing import List, Dict
+import asyncio
+import os
+import re
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import quote_plus, urljoin, urlsplit
 from langchain.tools import Tool
 from datetime import datetime, timedelta
 
+import httpx
+
+from tools.cache import TTLCache, shared_backend
+from tools.http_client import get_async_client, get_sync_client
+
+BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+# Merged results per query; shared by the API workers when CACHE_BACKEND is set
+news_cache = TTLCache(
+    "news",
+    max_size=int(os.getenv("NEWS_CACHE_SIZE", "256")),
+    default_ttl=float(os.getenv("NEWS_CACHE_TTL", "300")),
+    backend=shared_backend("news")
+)
+
+
+def _cache_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _has_news(result: Dict) -> bool:
+    # An empty result usually means every source failed: retry next time
+    return bool(result["news"])
+
+class NewsSource(ABC):
+    """
+    Base class for a pluggable news source
+    Subclasses describe the request and parse the response; fetching is shared
+    """
+    
+    name = "source"
+    
+    @abstractmethod
+    def build_request(self, query: str) -> Dict:
+        """Request arguments (url, params, headers) for the shared client"""
+    
+    @abstractmethod
+    def parse(self, response: httpx.Response) -> List[Dict]:
+        """Convert the upstream response into news items"""
+    
+    def fetch(self, query: str) -> List[Dict]:
+        response = get_sync_client().get(**self.build_request(query))
+        return self.parse(response)
+    
+    async def afetch(self, query: str) -> List[Dict]:
+        response = await get_async_client().get(**self.build_request(query))
+        return self.parse(response)
+
+class CryptoCompareSource(NewsSource):
+    """News from CryptoCompare API (free tier)"""
+    
+    name = "cryptocompare"
+    
+    def build_request(self, query: str) -> Dict:
+        return {
+            "url": "https://min-api.cryptocompare.com/data/v2/news/",
+            "params": {
+                "lang": "EN",
+                "categories": "BTC,ETH" if "bitcoin" in query.lower() or "btc" in query.lower() else None
+            },
+        }
+    
+    def parse(self, response: httpx.Response) -> List[Dict]:
+        data = response.json()
+        news = []
+        if data.get("Data"):
+            for item in data["Data"][:5]:
+                news.append({
+                    "title": item.get("title", ""),
+                    "url": item.get("url", ""),
+                    "date": datetime.fromtimestamp(item.get("published_on", 0)).strftime("%Y-%m-%d %H:%M"),
+                    "source": item.get("source", "CryptoCompare")
+                })
+        return news
+
+class HTMLSearchSource(NewsSource):
+    """Scrapes <article> entries from a site's search results page"""
+    
+    def __init__(self, name: str, url_template: str, label: Optional[str] = None):
+        self.name = name
+        self.url_template = url_template
+        self.label = label or name.capitalize()
+    
+    def build_request(self, query: str) -> Dict:
+        return {
+            "url": self.url_template.format(query=quote_plus(query)),
+            "headers": BROWSER_HEADERS,
+        }
+    
+    def parse(self, response: httpx.Response) -> List[Dict]:
+        from bs4 import BeautifulSoup  # imported on first scrape, not at startup
+        soup = BeautifulSoup(response.text, 'html.parser')
+        
+        news = []
+        articles = soup.find_all('article', limit=5)
+        for article in articles:
+            title_elem = article.find('h3') or article.find('h2')
+            link_elem = article.find('a')
+            date_elem = article.find('time')
+            
+            if title_elem:
+                news.append({
+                    "title": title_elem.get_text(strip=True),
+                    "url": urljoin(str(response.url), link_elem.get('href', '')) if link_elem else '',
+                    "date": date_elem.get_text(strip=True) if date_elem else '',
+                    "source": self.label
+                })
+        return news
+
+def _normalize_url(url: str) -> str:
+    """Scheme-, www-, query- and trailing-slash-insensitive URL key"""
+    parts = urlsplit(url.strip().lower())
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    return f"{host}{parts.path.rstrip('/')}"
+
+def _normalize_title(title: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", title.lower()).strip()
+
 class NewsScraperTool:
     """
     Tool for scraping financial and crypto news
     """
     
-    def __init__(self):
+    def __init__(self, extra_sources: Optional[List[NewsSource]] = None):
         self.name = "news_scraper"
         self.description = """Usa questo tool per raccogliere news finanziarie e crypto.
         
 Input: query di ricerca (es. "bitcoin", "macro economy", "fed rate")
 Output: Lista di news recenti con titolo, fonte e data
-        
+
 Esempio: news_scraper("bitcoin funding rate")
 """
-        
+
         # News sources
         self.sources = {
             "coindesk": "https://www.coindesk.com/search/?s={query}",
             "cointelegraph": "https://cointelegraph.com/search?q={query}",
             "reuters": "https://www.reuters.com/search/news?blob={query}",
         }
+        labels = {"coindesk": "CoinDesk", "cointelegraph": "Cointelegraph", "reuters": "Reuters"}
+        
+        # All sources are fetched concurrently, so adding one costs no wall-clock time
+        self.news_sources: List[NewsSource] = [CryptoCompareSource()]
+        self.news_sources += [
+            HTMLSearchSource(name, template, labels.get(name))
+            for name, template in self.sources.items()
+        ]
+        self.news_sources += extra_sources or []
+        
+        # Global deadline for the whole fan-out (seconds)
+        self.deadline = float(os.getenv("NEWS_DEADLINE", "8"))
     
-    def _scrape_coindesk(self, query: str) -> List[Dict]:
-        """Scrape CoinDesk news"""
-        try:
-            url = f"https://www.coindesk.com/search/?s={query}"
-            response = httpx.get(url, timeout=10.0, headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            })
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            news = []
-            articles = soup.find_all('article', limit=5)
-            for article in articles:
-                title_elem = article.find('h3') or article.find('h2')
-                link_elem = article.find('a')
-                date_elem = article.find('time')
-                
-                if title_elem:
-                    news.append({
-                        "title": title_elem.get_text(strip=True),
-                        "url": link_elem.get('href', '') if link_elem else '',
-                        "date": date_elem.get_text(strip=True) if date_elem else '',
-                        "source": "CoinDesk"
-                    })
-            return news
-        except Exception as e:
-            return [{"error": f"Errore scraping CoinDesk: {str(e)}"}]
+    def register_source(self, source: NewsSource):
+        """Add a news source to the fan-out"""
+        self.news_sources.append(source)
     
-    def _get_crypto_news_api(self, query: str) -> List[Dict]:
-        """Get news from CryptoCompare API (free tier)"""
-        try:
-            # Using CryptoCompare free API
-            url = "https://min-api.cryptocompare.com/data/v2/news/"
-            params = {
-                "lang": "EN",
-                "categories": "BTC,ETH" if "bitcoin" in query.lower() or "btc" in query.lower() else None
-            }
-            
-            response = httpx.get(url, params=params, timeout=10.0)
-            data = response.json()
-            
-            news = []
-            if data.get("Data"):
-                for item in data["Data"][:5]:
-                    news.append({
-                        "title": item.get("title", ""),
-                        "url": item.get("url", ""),
-                        "date": datetime.fromtimestamp(item.get("published_on", 0)).strftime("%Y-%m-%d %H:%M"),
-                        "source": item.get("source", "CryptoCompare")
-                    })
-            return news
-        except Exception as e:
-            return []
+    def _merge(self, results: List[Tuple[NewsSource, Optional[List[Dict]], Optional[str]]]) -> Tuple[List[Dict], List[str]]:
+        """Dedupe items across sources (source order wins) and collect failures"""
+        seen = set()
+        merged = []
+        failed = []
+        for source, items, error in results:
+            if error:
+                failed.append(f"{source.name} ({error})")
+                continue
+            for item in items or []:
+                keys = {_normalize_title(item.get("title", ""))}
+                if item.get("url"):
+                    keys.add(_normalize_url(item["url"]))
+                keys.discard("")
+                if not keys or keys & seen:
+                    continue
+                seen |= keys
+                merged.append(item)
+        return merged, failed
+    
+    def _format_news(self, query: str, all_news: List[Dict], failed: Optional[List[str]] = None) -> str:
+        """Render collected news items for the agent"""
+        if not all_news:
+            return f"Nessuna news trovata per: {query}"
+        
+        # Format output
+        result = f"News trovate per '{query}':\n\n"
+        for i, item in enumerate(all_news[:10], 1):  # Limit to 10
+            result += f"{i}. {item.get('title', 'N/A')}\n"
+            result += f"   Fonte: {item.get('source', 'N/A')}\n"
+            result += f"   Data: {item.get('date', 'N/A')}\n"
+            if item.get('url'):
+                result += f"   URL: {item.get('url')}\n"
+            result += "\n"
+        
+        if failed:
+            result += f"Fonti non disponibili: {', '.join(failed)}\n"
+        
+        return result
+    
+    def _collect(self, query: str) -> Dict:
+        """Fetch every source in parallel; whatever arrives before the deadline is used"""
+        executor = ThreadPoolExecutor(max_workers=len(self.news_sources))
+        futures = {executor.submit(source.fetch, query): source for source in self.news_sources}
+        done, _ = wait(futures, timeout=self.deadline)
+        # Don't wait for stragglers: their HTTP timeouts release the threads
+        executor.shutdown(wait=False, cancel_futures=True)
+        
+        results = []
+        for future, source in futures.items():
+            if future not in done:
+                results.append((source, None, "timeout"))
+            elif future.exception() is not None:
+                results.append((source, None, type(future.exception()).__name__))
+            else:
+                results.append((source, future.result(), None))
+        
+        all_news, failed = self._merge(results)
+        return {"news": all_news, "failed": failed}
+    
+    async def _acollect(self, query: str) -> Dict:
+        """Async variant of _collect"""
+        tasks = {asyncio.ensure_future(source.afetch(query)): source for source in self.news_sources}
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        
+        results = []
+        for task, source in tasks.items():
+            if task not in done:
+                results.append((source, None, "timeout"))
+            elif task.exception() is not None:
+                results.append((source, None, type(task.exception()).__name__))
+            else:
+                results.append((source, task.result(), None))
+        
+        all_news, failed = self._merge(results)
+        return {"news": all_news, "failed": failed}
     
     def scrape_news(self, query: str) -> str:
         """
         Main method to scrape news
+        All sources run in parallel; whatever arrives before the deadline is used
         """
         try:
-            all_news = []
-            
-            # Try API first (more reliable)
-            api_news = self._get_crypto_news_api(query)
-            all_news.extend(api_news)
-            
-            # Try scraping CoinDesk
-            coindesk_news = self._scrape_coindesk(query)
-            all_news.extend(coindesk_news)
-            
-            if not all_news:
-                return f"Nessuna news trovata per: {query}"
-            
-            # Format output
-            result = f"News trovate per '{query}':\n\n"
-            for i, item in enumerate(all_news[:10], 1):  # Limit to 10
-                if "error" in item:
-                    continue
-                result += f"{i}. {item.get('title', 'N/A')}\n"
-                result += f"   Fonte: {item.get('source', 'N/A')}\n"
-                result += f"   Data: {item.get('date', 'N/A')}\n"
-                if item.get('url'):
-                    result += f"   URL: {item.get('url')}\n"
-                result += "\n"
-            
-            return result
+            result = news_cache.get_or_fetch(_cache_key(query), lambda: self._collect(query), cache_if=_has_news)
+            return self._format_news(query, result["news"], result["failed"])
+        except Exception as e:
+            return f"Errore nel raccogliere news: {str(e)}"
+    
+    async def ascrape_news(self, query: str) -> str:
+        """
+        Async variant of scrape_news, used by the agent event loop
+        """
+        try:
+            result = await news_cache.aget_or_fetch(_cache_key(query), lambda: self._acollect(query), cache_if=_has_news)
+            return self._format_news(query, result["news"], result["failed"])
         except Exception as e:
             return f"Errore nel raccogliere news: {str(e)}"
     
@@ -121,6 +274,7 @@ Esempio: news_scraper("bitcoin funding rate")
         return Tool(
             name=self.name,
             description=self.description,
-            func=self.scrape_news
+            func=self.scrape_news,
+            coroutine=self.ascrape_news
         )
-
+        
\ No newline at end of file
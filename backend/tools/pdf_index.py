@@ -0,0 +1,146 @@
+"""
+Passage index for PDF documents
+
+Extracted pages are split into overlapping chunks (never across a page
+boundary, so every passage keeps its page number) and indexed with SQLite
+FTS5; questions are answered with the top-k passages ranked by BM25.
+The index lives in the same file as the page-text cache and is keyed by
+document content hash, so a document is chunked and indexed only once.
+"""
+import re
+import unicodedata
+from typing import Iterable, List, Optional, Set, Tuple
+
+from tools.db_pool import get_pool
+
+INDEX_SCHEMA = [
+    # doc_hash is an indexed column so "doc_hash:<hash>" restricts a MATCH to one document
+    """CREATE VIRTUAL TABLE IF NOT EXISTS pdf_chunks USING fts5(
+        doc_hash, page UNINDEXED, text,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TABLE IF NOT EXISTS pdf_indexed_pages (
+        doc_hash TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        PRIMARY KEY (doc_hash, page)
+    ) WITHOUT ROWID""",
+]
+
+# Words that carry no retrieval signal in Italian/English questions
+STOPWORDS = {
+    "il", "lo", "la", "gli", "le", "di", "del", "della", "dei", "delle", "dello", "da", "dal", "dalla",
+    "in", "nel", "nella", "su", "sul", "sulla", "per", "con", "che", "cosa", "come", "qual", "quale",
+    "quali", "quanto", "quanta", "quanti", "un", "una", "uno", "sono", "essere", "stato", "cui", "questo",
+    "questa", "dice", "documento", "report", "pdf", "tra", "fra", "anche", "piu", "non",
+    "the", "an", "of", "on", "for", "to", "is", "are", "was", "were", "what", "which", "how", "does",
+    "do", "and", "or", "about", "at", "by", "this", "that", "with", "from", "document",
+}
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+SENTENCE_END_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def chunk_page(text: str, size: int, overlap: int) -> List[str]:
+    """Split one page into chunks of about `size` characters, cutting at sentence ends"""
+    text = re.sub(r"[ \t]+", " ", text).strip()
+    if len(text) <= size:
+        return [text] if text else []
+    sentences = SENTENCE_END_RE.split(text)
+    # An overlap as large as the chunk would never advance
+    step = max(1, size - overlap)
+    chunks, current = [], ""
+    for sentence in sentences:
+        # Hard-wrap sentences longer than a chunk (tables, lists without punctuation)
+        while len(sentence) > size:
+            head, sentence = sentence[:size], sentence[step:]
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(head)
+        if current and len(current) + len(sentence) + 1 > size:
+            chunks.append(current)
+            # Carry the tail of the previous chunk so passages keep some context
+            current = current[-overlap:].split(" ", 1)[-1] if overlap else ""
+        current = f"{current} {sentence}".strip() if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_match_query(question: str) -> str:
+    """Question -> FTS5 OR query of prefix terms ("tassi" also matches "tasso")"""
+    normalized = unicodedata.normalize("NFKD", question.lower())
+    normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+    terms = []
+    for word in WORD_RE.findall(normalized):
+        if word in STOPWORDS or (len(word) < 3 and not word.isdigit()):
+            continue
+        # Crude stemming: drop the inflected ending of longer words
+        stem = word[:-1] if len(word) >= 5 and not word.isdigit() else word
+        term = f'"{stem}"*'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms)
+
+
+class PassageIndex:
+    """
+    FTS5/BM25 index of PDF chunks keyed by document content hash
+    """
+
+    def __init__(self, db_path: str, chunk_chars: int = 1000, overlap: int = 150):
+        self.pool = get_pool(db_path)
+        self.chunk_chars = max(1, chunk_chars)
+        if not 0 <= overlap < self.chunk_chars:
+            print(f"Warning: PDF chunk overlap {overlap} not below chunk size {self.chunk_chars}, "
+                  f"using {self.chunk_chars // 2}")
+            overlap = self.chunk_chars // 2
+        self.overlap = overlap
+        with self.pool.transaction() as conn:
+            for statement in INDEX_SCHEMA:
+                conn.execute(statement)
+
+    def indexed_pages(self, doc_hash: str) -> Set[int]:
+        rows = self.pool.connection().execute(
+            "SELECT page FROM pdf_indexed_pages WHERE doc_hash = ?", (doc_hash,)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def add_pages(self, doc_hash: str, items: Iterable[Tuple[int, str]]) -> int:
+        """Chunk and index pages not indexed yet; returns the number of chunks added"""
+        done = self.indexed_pages(doc_hash)
+        chunked = {
+            page: chunk_page(text, self.chunk_chars, self.overlap)
+            for page, text in items if page not in done
+        }
+        added = 0
+        if chunked:
+            with self.pool.transaction() as conn:
+                for page, chunks in chunked.items():
+                    # Claim the page first: a concurrent call indexing the same
+                    # document inserts the chunks of each page only once
+                    claimed = conn.execute(
+                        "INSERT OR IGNORE INTO pdf_indexed_pages (doc_hash, page) VALUES (?, ?)", (doc_hash, page)
+                    ).rowcount
+                    if claimed:
+                        conn.executemany(
+                            "INSERT INTO pdf_chunks (doc_hash, page, text) VALUES (?, ?, ?)",
+                            [(doc_hash, page, chunk) for chunk in chunks]
+                        )
+                        added += len(chunks)
+        return added
+
+    def search(self, doc_hash: str, question: str, k: int = 5,
+               pages: Optional[List[int]] = None) -> List[Tuple[int, str, float]]:
+        """Top-k (page, passage, score) for a question, best first, optionally within pages"""
+        terms = build_match_query(question)
+        if not terms:
+            return []
+        sql = "SELECT page, text, bm25(pdf_chunks, 0.0, 0.0, 1.0) AS score FROM pdf_chunks WHERE pdf_chunks MATCH ?"
+        params = [f'doc_hash:"{doc_hash}" AND ({terms})']
+        if pages is not None:
+            sql += f" AND page IN ({','.join('?' * len(pages))})"
+            params.extend(pages)
+        rows = self.pool.connection().execute(sql + " ORDER BY score LIMIT ?", (*params, k)).fetchall()
+        # bm25() is lower-is-better; flip the sign for display
+        return [(page, text, -score) for page, text, score in rows]
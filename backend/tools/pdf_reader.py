@@ -1,17 +1,146 @@
 """
 PDF Reader Tool for LangChain
 Supports web URLs and local file uploads
+
+Downloads are streamed to a temporary file (never held in memory), pages
+are extracted lazily and only for the requested range, and extracted page
+text is cached by content hash, so the same ECB/Fed report is parsed once.
+Extraction runs in a bounded process pool (see tools/pdf_workers.py) under
+a per-document time budget; pages extracted before the budget runs out are
+still returned and cached.
+
+With "<source> :: <domanda>" the tool returns only the passages most
+relevant to the question (BM25 over an FTS5 chunk index, see
+tools/pdf_index.py) instead of the whole text; the index is built once per
+document and re-used by later questions.
+
+Configuration (environment variables):
+- PDF_CACHE_PATH: SQLite file for the page-text cache (default data/pdf_cache.db)
+- PDF_MAX_BYTES: largest PDF accepted for download (default 50 MB)
+- PDF_MAX_CHARS: characters returned to the agent per call (default 40000)
+- PDF_SOURCE_TTL: seconds a URL is assumed unchanged, skipping the download
+  when all requested pages are cached (default 86400)
+- PDF_TOP_K: passages returned in question mode (default 5)
+- PDF_CHUNK_CHARS / PDF_CHUNK_OVERLAP: chunk size and overlap in characters
+  (default 1000 / 150)
 """
 import os
-import httpx
-from typing import Optional
+import re
+import time
+import asyncio
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Generator, Iterable, Iterator, List, Optional, Tuple
 from langchain.tools import Tool
-try:
-    from pypdf import PdfReader
-except ImportError:
-    from PyPDF2 import PdfReader
-from io import BytesIO
-import pdfplumber
+
+from tools.db_pool import get_pool
+from tools.http_client import get_async_client, get_sync_client
+from tools.pdf_index import PassageIndex
+from tools.pdf_workers import ExtractionTimeout, load_pdf_libraries, pdf_pool
+
+PAGE_CACHE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS pdf_documents (
+        doc_hash TEXT PRIMARY KEY,
+        page_count INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS pdf_sources (
+        source TEXT PRIMARY KEY,
+        doc_hash TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS pdf_pages (
+        doc_hash TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        PRIMARY KEY (doc_hash, page)
+    ) WITHOUT ROWID""",
+]
+
+# "<source> :: <question>"
+QUESTION_SEPARATOR = "::"
+
+# "<source> pages=1-5,8" / "pagine 3-7" / "p:10"
+PAGE_SPEC_RE = re.compile(r"\s+(?:pages|pagine|page|pagina|p)\s*[=:]?\s*([\d][\d\s,\-]*)$", re.IGNORECASE)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_page_spec(spec: Optional[str], page_count: int) -> List[int]:
+    """"1-5,8" -> [1, 2, 3, 4, 5, 8] (1-based, clipped to the document)"""
+    if not spec:
+        return list(range(1, page_count + 1))
+    pages, seen = [], set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, _, end = part.partition("-")
+            first, last = int(start or 1), int(end or page_count)
+        else:
+            first = last = int(part)
+        for page in range(max(first, 1), min(last, page_count) + 1):
+            if page not in seen:
+                seen.add(page)
+                pages.append(page)
+    if not pages:
+        raise ValueError(f"Nessuna pagina valida in '{spec}' (il documento ha {page_count} pagine)")
+    return pages
+
+
+class PageTextCache:
+    """
+    Extracted page text keyed by document content hash (SQLite)
+    """
+    
+    def __init__(self, db_path: str):
+        self.pool = get_pool(db_path)
+        with self.pool.transaction() as conn:
+            for statement in PAGE_CACHE_SCHEMA:
+                conn.execute(statement)
+    
+    def page_count(self, doc_hash: str) -> Optional[int]:
+        row = self.pool.connection().execute(
+            "SELECT page_count FROM pdf_documents WHERE doc_hash = ?", (doc_hash,)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def lookup_source(self, source: str, max_age: float) -> Optional[str]:
+        """Content hash of a URL fetched less than max_age seconds ago"""
+        row = self.pool.connection().execute(
+            "SELECT doc_hash FROM pdf_sources WHERE source = ? AND fetched_at >= ?", (source, time.time() - max_age)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def remember(self, doc_hash: str, page_count: int, source: Optional[str] = None):
+        with self.pool.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO pdf_documents (doc_hash, page_count) VALUES (?, ?)", (doc_hash, page_count))
+            if source:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pdf_sources (source, doc_hash, fetched_at) VALUES (?, ?, ?)",
+                    (source, doc_hash, time.time())
+                )
+    
+    def get_pages(self, doc_hash: str, pages: List[int]) -> Dict[int, str]:
+        conn = self.pool.connection()
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(pages), 500):
+            batch = pages[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(conn.execute(
+                f"SELECT page, text FROM pdf_pages WHERE doc_hash = ? AND page IN ({placeholders})",
+                (doc_hash, *batch)
+            ).fetchall())
+        return found
+    
+    def put_pages(self, doc_hash: str, items: Iterable[Tuple[int, str]]):
+        with self.pool.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO pdf_pages (doc_hash, page, text) VALUES (?, ?, ?)",
+                [(doc_hash, page, text) for page, text in items]
+            )
+
 
 class PDFReaderTool:
     """
@@ -22,78 +151,302 @@ class PDFReaderTool:
         self.name = "pdf_reader"
         self.description = """Usa questo tool per leggere e analizzare PDF.
         
-Input: URL del PDF o path del file locale
-Output: Testo estratto dal PDF
-        
+Input: URL del PDF o path del file locale, con intervallo di pagine opzionale
+       e, dopo "::", una domanda per ricevere solo i passaggi rilevanti
+Output: Testo estratto dal PDF pagina per pagina, oppure i passaggi piu'
+        rilevanti per la domanda con il numero di pagina
+
+Preferisci la forma con domanda per documenti lunghi: costa molto meno.
+
 Esempio: pdf_reader("https://example.com/report.pdf")
+         pdf_reader("https://example.com/report.pdf pages=1-5,12")
+         pdf_reader("https://example.com/report.pdf :: cosa dice sui tassi di interesse?")
 """
+        self.cache = PageTextCache(os.getenv("PDF_CACHE_PATH", "data/pdf_cache.db"))
+        self.max_bytes = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.max_chars = int(os.getenv("PDF_MAX_CHARS", "40000"))
+        self.source_ttl = float(os.getenv("PDF_SOURCE_TTL", "86400"))
+        self.top_k = int(os.getenv("PDF_TOP_K", "5"))
+        self.index = PassageIndex(
+            os.getenv("PDF_CACHE_PATH", "data/pdf_cache.db"),
+            chunk_chars=int(os.getenv("PDF_CHUNK_CHARS", "1000")),
+            overlap=int(os.getenv("PDF_CHUNK_OVERLAP", "150"))
+        )
+    
+    def _parse_input(self, input_str: str) -> Tuple[str, Optional[str], Optional[str]]:
+        """Split "<source> [pages=...] [:: question]" into (source, page spec, question)"""
+        input_str, _, question = input_str.partition(QUESTION_SEPARATOR)
+        question = question.strip() or None
+        input_str = input_str.strip()
+        match = PAGE_SPEC_RE.search(input_str)
+        if match:
+            return input_str[:match.start()].strip(), match.group(1), question
+        return input_str, None, question
+    
+    def _open_temp(self):
+        return tempfile.NamedTemporaryFile(prefix="pdf_", suffix=".pdf", delete=False)
+    
+    def _download(self, url: str) -> Tuple[str, str]:
+        """Stream a PDF to a temp file; returns (path, sha256)"""
+        digest = hashlib.sha256()
+        size = 0
+        with self._open_temp() as tmp:
+            try:
+                with get_sync_client().stream("GET", url, timeout=30.0) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_bytes(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise ValueError(f"PDF troppo grande (oltre {self.max_bytes // (1024 * 1024)} MB)")
+                        digest.update(chunk)
+                        tmp.write(chunk)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+        return tmp.name, digest.hexdigest()
+    
+    async def _adownload(self, url: str) -> Tuple[str, str]:
+        """Async variant of _download"""
+        digest = hashlib.sha256()
+        size = 0
+        with self._open_temp() as tmp:
+            try:
+                async with get_async_client().stream("GET", url, timeout=30.0) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise ValueError(f"PDF troppo grande (oltre {self.max_bytes // (1024 * 1024)} MB)")
+                        digest.update(chunk)
+                        tmp.write(chunk)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+        return tmp.name, digest.hexdigest()
+    
+    def _hash_file(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _count_pages(self, path: str) -> int:
+        pdfplumber, PdfReader = load_pdf_libraries()
+        try:
+            with pdfplumber.open(path) as pdf:
+                return len(pdf.pages)
+        except Exception:
+            return len(PdfReader(path).pages)
+    
+    def _extract_pages(self, path: str, pages: List[int],
+                       cancel: Optional[threading.Event] = None) -> Iterator[Tuple[int, Optional[str]]]:
+        """Yield (page number, text) in order; text is None for unreadable pages"""
+        return pdf_pool.extract(path, pages, cancel=cancel)
+    
+    def _iter_document(self, path: Optional[str], doc_hash: str, pages: List[int],
+                       cancel: Optional[threading.Event] = None) -> Iterator[Tuple[int, str]]:
+        """Requested pages in order, from the cache when possible; new pages are cached"""
+        cached = self.cache.get_pages(doc_hash, pages)
+        missing = [page for page in pages if page not in cached]
+        extracted = iter(())
+        if missing:
+            if path is None:
+                raise ValueError("pagine non in cache")
+            extracted = self._extract_pages(path, missing, cancel)
+        
+        fresh = []
+        try:
+            for page in pages:
+                if page in cached:
+                    yield page, cached[page]
+                else:
+                    number, text = next(extracted)
+                    if text is None:
+                        # Not cached: a later pdfplumber/pypdf may read it
+                        yield number, "[pagina non leggibile]"
+                        continue
+                    fresh.append((number, text))
+                    yield number, text
+        finally:
+            if hasattr(extracted, "close"):
+                extracted.close()
+            if fresh:
+                self.cache.put_pages(doc_hash, fresh)
+                self.index.add_pages(doc_hash, fresh)
+    
+    def _render(self, source: str, page_count: int, pages: List[int], items: Generator[Tuple[int, str], None, None]) -> str:
+        """Assemble page texts once, stopping at the character budget"""
+        parts = []
+        size = 0
+        last_page = None
+        timed_out = False
+        try:
+            for number, text in items:
+                block = f"[Pagina {number}]\n{text.strip()}"
+                if parts and size + len(block) > self.max_chars:
+                    break
+                parts.append(block)
+                size += len(block) + 2
+                last_page = number
+        except ExtractionTimeout:
+            timed_out = True
+        finally:
+            # Pages past the budget are never extracted
+            items.close()
+        
+        header = f"PDF {source} ({page_count} pagine, estratte {len(parts)} di {len(pages)} richieste)\n\n"
+        output = header + "\n\n".join(parts)
+        if timed_out:
+            output += (f"\n\n[Tempo di estrazione esaurito dopo {len(parts)} pagine: "
+                       f"riprova per continuare, le pagine gia' estratte sono in cache]")
+        elif len(parts) < len(pages):
+            output += (f"\n\n[Testo troncato dopo pagina {last_page}: "
+                       f"usa pages=... per leggere le pagine successive]")
+        return output
+    
+    def _render_passages(self, source: str, page_count: int, pages: List[int], question: str,
+                         path: Optional[str], doc_hash: str, cancel: Optional[threading.Event] = None) -> str:
+        """Index the requested pages if needed, then return the top-k passages for the question"""
+        indexed = self.index.indexed_pages(doc_hash)
+        missing = [page for page in pages if page not in indexed]
+        timed_out = False
+        if missing:
+            # Pages already in the text cache are indexed without touching the PDF
+            self.index.add_pages(doc_hash, self.cache.get_pages(doc_hash, missing).items())
+            items = self._iter_document(path, doc_hash, missing, cancel)
+            try:
+                for _ in items:
+                    pass
+            except ExtractionTimeout:
+                timed_out = True
+            finally:
+                items.close()
+        
+        limit = None if len(pages) == page_count else pages
+        hits = self.index.search(doc_hash, question, self.top_k, pages=limit)
+        header = f"PDF {source} ({page_count} pagine) - passaggi piu' rilevanti per: \"{question}\"\n\n"
+        if not hits:
+            output = header + "Nessun passaggio rilevante trovato: prova altre parole chiave o leggi il documento con pages=..."
+        else:
+            output = header + "\n\n".join(
+                f"[Pagina {page} | rilevanza {score:.1f}]\n{text}" for page, text, score in hits
+            )
+        if timed_out:
+            output += ("\n\n[Tempo di estrazione esaurito: la ricerca copre solo le pagine gia' estratte, "
+                       "riprova per completare l'indice]")
+        return output
+    
+    def _read_document(self, path: Optional[str], doc_hash: str, source: str, spec: Optional[str],
+                       cancel: Optional[threading.Event] = None, question: Optional[str] = None) -> str:
+        page_count = self.cache.page_count(doc_hash)
+        if page_count is None:
+            page_count = self._count_pages(path)
+        self.cache.remember(doc_hash, page_count, source if source.startswith(("http://", "https://")) else None)
+        pages = parse_page_spec(spec, page_count)
+        if question:
+            return self._render_passages(source, page_count, pages, question, path, doc_hash, cancel)
+        return self._render(source, page_count, pages, self._iter_document(path, doc_hash, pages, cancel))
     
-    def _read_pdf_from_url(self, url: str) -> str:
+    def _cached_source(self, url: str, spec: Optional[str], question: Optional[str] = None) -> Optional[str]:
+        """Render a recently fetched URL entirely from the page cache/index, if possible"""
+        doc_hash = self.cache.lookup_source(url, self.source_ttl)
+        page_count = self.cache.page_count(doc_hash) if doc_hash else None
+        if page_count is None:
+            return None
+        pages = parse_page_spec(spec, page_count)
+        indexed = self.index.indexed_pages(doc_hash) if question else set()
+        unindexed = [page for page in pages if page not in indexed]
+        if len(self.cache.get_pages(doc_hash, unindexed)) < len(unindexed):
+            return None
+        return self._read_document(None, doc_hash, url, spec, question=question)
+    
+    def _read_pdf_from_url(self, url: str, spec: Optional[str] = None, question: Optional[str] = None) -> str:
         """Download and read PDF from URL"""
         try:
-            response = httpx.get(url, timeout=30.0)
-            response.raise_for_status()
-            pdf_bytes = BytesIO(response.content)
-            
-            # Try pdfplumber first (better for complex layouts)
+            cached = self._cached_source(url, spec, question)
+            if cached is not None:
+                return cached
+            path, doc_hash = self._download(url)
+            try:
+                return self._read_document(path, doc_hash, url, spec, question=question)
+            finally:
+                os.unlink(path)
+        except ValueError as e:
+            return str(e)
+        except Exception as e:
+            return f"Errore nel leggere PDF da URL: {str(e)}"
+    
+    async def _aread_pdf_from_url(self, url: str, spec: Optional[str] = None, question: Optional[str] = None) -> str:
+        """Async variant of _read_pdf_from_url; parsing runs in a worker thread"""
+        try:
+            cached = await asyncio.to_thread(self._cached_source, url, spec, question)
+            if cached is not None:
+                return cached
+            path, doc_hash = await self._adownload(url)
+            cancel = threading.Event()
             try:
-                with pdfplumber.open(pdf_bytes) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        text += page.extract_text() or ""
-                    return text
-            except:
-                # Fallback to pypdf
-                reader = PdfReader(pdf_bytes)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text()
-                return text
+                return await asyncio.to_thread(self._read_document, path, doc_hash, url, spec, cancel, question)
+            except asyncio.CancelledError:
+                # Stop the worker thread and drop queued page tasks
+                cancel.set()
+                raise
+            finally:
+                os.unlink(path)
+        except ValueError as e:
+            return str(e)
         except Exception as e:
             return f"Errore nel leggere PDF da URL: {str(e)}"
     
-    def _read_pdf_from_file(self, file_path: str) -> str:
+    def _read_pdf_from_file(self, file_path: str, spec: Optional[str] = None,
+                            cancel: Optional[threading.Event] = None, question: Optional[str] = None) -> str:
         """Read PDF from local file"""
         try:
             if not os.path.exists(file_path):
                 return f"File non trovato: {file_path}"
             
-            # Try pdfplumber first
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        text += page.extract_text() or ""
-                    return text
-            except:
-                # Fallback to pypdf
-                reader = PdfReader(file_path)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text()
-                return text
+            return self._read_document(file_path, self._hash_file(file_path), file_path, spec, cancel, question)
+        except ValueError as e:
+            return str(e)
         except Exception as e:
             return f"Errore nel leggere PDF locale: {str(e)}"
     
     def read_pdf(self, input_str: str) -> str:
         """
         Main method to read PDF
-        Supports both URLs and local file paths
+        Supports both URLs and local file paths, with optional "pages=1-5,8"
+        and an optional ":: question" for passage retrieval
         """
-        input_str = input_str.strip()
+        source, spec, question = self._parse_input(input_str)
         
         # Check if it's a URL
-        if input_str.startswith("http://") or input_str.startswith("https://"):
-            return self._read_pdf_from_url(input_str)
+        if source.startswith("http://") or source.startswith("https://"):
+            return self._read_pdf_from_url(source, spec, question)
         else:
             # Assume it's a local file path
-            return self._read_pdf_from_file(input_str)
+            return self._read_pdf_from_file(source, spec, question=question)
+    
+    async def aread_pdf(self, input_str: str) -> str:
+        """
+        Async variant of read_pdf, used by the agent event loop
+        """
+        source, spec, question = self._parse_input(input_str)
+        
+        if source.startswith("http://") or source.startswith("https://"):
+            return await self._aread_pdf_from_url(source, spec, question)
+        else:
+            cancel = threading.Event()
+            try:
+                return await asyncio.to_thread(self._read_pdf_from_file, source, spec, cancel, question)
+            except asyncio.CancelledError:
+                cancel.set()
+                raise
     
     def get_tool(self) -> Tool:
         """Return LangChain Tool instance"""
         return Tool(
             name=self.name,
             description=self.description,
-            func=self.read_pdf
+            func=self.read_pdf,
+            coroutine=self.aread_pdf
         )
-
@@ -0,0 +1,178 @@
+"""
+Process pool for CPU-bound PDF text extraction
+
+pdfplumber is pure Python and holds the GIL for seconds on large reports;
+running it in worker processes keeps the API workers responsive. A
+document's pages are split into small tasks that run in parallel and are
+submitted a few at a time, so a caller that stops reading early (output
+budget reached, request cancelled) never pays for the rest.
+
+Configuration (environment variables):
+- PDF_WORKERS: worker processes per API worker (default: the CPUs divided
+  among the WEB_CONCURRENCY API workers, at most 4; 0 = in-process)
+- PDF_PAGES_PER_TASK: pages per task (default 4)
+- PDF_TIME_BUDGET: seconds allowed per document (default 60)
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError
+from typing import Deque, Generator, List, Optional, Tuple
+
+
+class ExtractionTimeout(Exception):
+    """The per-document time budget ran out"""
+
+
+class ExtractionCancelled(Exception):
+    """The caller cancelled the extraction"""
+
+
+def load_pdf_libraries():
+    """(pdfplumber, PdfReader), imported on first use: together they take ~250 ms to import"""
+    import pdfplumber
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        from PyPDF2 import PdfReader
+    return pdfplumber, PdfReader
+
+
+def extract_page_range(path: str, pages: List[int]) -> List[Tuple[int, Optional[str]]]:
+    """
+    Worker entry point: (page, text) for each page, text None if unreadable
+
+    pdfplumber first (better for complex layouts); only the pages it fails
+    on are retried with PdfReader.
+    """
+    pdfplumber, PdfReader = load_pdf_libraries()
+    results = []
+    reader = None
+    try:
+        pdf = pdfplumber.open(path)
+    except Exception:
+        pdf = None
+    try:
+        for number in pages:
+            text = None
+            if pdf is not None:
+                try:
+                    text = pdf.pages[number - 1].extract_text() or ""
+                except Exception:
+                    text = None
+            if text is None:
+                try:
+                    reader = reader or PdfReader(path)
+                    text = reader.pages[number - 1].extract_text() or ""
+                except Exception:
+                    text = None
+            results.append((number, text))
+    finally:
+        if pdf is not None:
+            pdf.close()
+    return results
+
+
+def _warm_worker():
+    load_pdf_libraries()
+
+
+class PDFProcessPool:
+    """
+    Bounded process pool shared by every PDFReaderTool in the process
+    """
+
+    def __init__(self):
+        # Every API worker has its own pool: share the CPUs between them
+        api_workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+        default_workers = min(4, max(1, (os.cpu_count() or 1) // api_workers))
+        self.workers = int(os.getenv("PDF_WORKERS", str(default_workers)))
+        self.pages_per_task = max(1, int(os.getenv("PDF_PAGES_PER_TASK", "4")))
+        self.time_budget = float(os.getenv("PDF_TIME_BUDGET", "60"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs an event loop and HTTP clients is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _wait(self, future: Future, deadline: float, cancel: Optional[threading.Event]):
+        """Wait for a task, checking the deadline and the cancel flag"""
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise ExtractionCancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ExtractionTimeout()
+            try:
+                return future.result(timeout=min(remaining, 0.25))
+            except TimeoutError:
+                continue
+
+    def extract(self, path: str, pages: List[int], cancel: Optional[threading.Event] = None,
+                time_budget: Optional[float] = None) -> Generator[Tuple[int, Optional[str]], None, None]:
+        """
+        Yield (page, text) in the requested order
+
+        Raises ExtractionTimeout / ExtractionCancelled between pages; tasks
+        not yet started are cancelled when the generator is closed.
+        """
+        deadline = time.monotonic() + (time_budget or self.time_budget)
+        tasks = [pages[i:i + self.pages_per_task] for i in range(0, len(pages), self.pages_per_task)]
+
+        if self.workers <= 0:
+            for task in tasks:
+                if cancel is not None and cancel.is_set():
+                    raise ExtractionCancelled()
+                if time.monotonic() > deadline:
+                    raise ExtractionTimeout()
+                yield from extract_page_range(path, task)
+            return
+
+        executor = self._get_executor()
+        queued = iter(tasks)
+        pending: Deque[Future] = deque()
+
+        def submit_next():
+            task = next(queued, None)
+            if task is not None:
+                pending.append(executor.submit(extract_page_range, path, task))
+
+        # Keep every worker busy plus one task queued
+        for _ in range(self.workers + 1):
+            submit_next()
+        try:
+            while pending:
+                results = self._wait(pending[0], deadline, cancel)
+                pending.popleft()
+                submit_next()
+                yield from results
+        except CancelledError:
+            raise ExtractionCancelled()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def warm(self):
+        """Start the workers and import the PDF libraries in each (~1-3 s per worker)"""
+        if self.workers <= 0:
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(_warm_worker) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+pdf_pool = PDFProcessPool()
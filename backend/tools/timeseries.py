@@ -0,0 +1,319 @@
+"""
+Time-series store for funding, open interest and liquidation samples
+
+Samples are kept at one-minute resolution in a WITHOUT ROWID table
+clustered on (symbol, data_type, ts), so a window for one series is a
+single contiguous range scan. Timestamps are integer epoch seconds and
+values are REAL columns: liquidations keep the long/short split, other
+metrics only use value.
+
+Older data is downsampled into hourly and daily rollups (count, sum,
+min, max, first, last per bucket) and pruned by retention policy:
+- TS_RETENTION_RAW_DAYS: 1-minute samples (default 7)
+- TS_RETENTION_1H_DAYS: hourly rollups (default 180)
+- TS_RETENTION_BLOCK_DAYS: packed minute blocks (default 365)
+- daily rollups are kept forever
+
+Closed days are also packed into market_blocks, one row per series per
+day holding the minute offsets and values as binary arrays, so long
+minute-resolution histories load with a few hundred reads instead of one
+row per sample (see tools.indicators).
+"""
+import itertools
+import os
+import re
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tools.db_pool import SQLitePool
+
+MINUTE, HOUR, DAY = 60, 3600, 86400
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS market_samples (
+        symbol TEXT NOT NULL,
+        data_type TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        value REAL NOT NULL,
+        long_value REAL,
+        short_value REAL,
+        PRIMARY KEY (symbol, data_type, ts)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS market_rollup_1h (
+        symbol TEXT NOT NULL,
+        data_type TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        sum REAL NOT NULL,
+        min REAL NOT NULL,
+        max REAL NOT NULL,
+        first REAL NOT NULL,
+        last REAL NOT NULL,
+        PRIMARY KEY (symbol, data_type, bucket)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS market_rollup_1d (
+        symbol TEXT NOT NULL,
+        data_type TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        sum REAL NOT NULL,
+        min REAL NOT NULL,
+        max REAL NOT NULL,
+        first REAL NOT NULL,
+        last REAL NOT NULL,
+        PRIMARY KEY (symbol, data_type, bucket)
+    ) WITHOUT ROWID""",
+]
+
+BLOCK_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS market_blocks (
+        symbol TEXT NOT NULL,
+        data_type TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        minutes BLOB NOT NULL,
+        value BLOB NOT NULL,
+        long_value BLOB,
+        short_value BLOB,
+        PRIMARY KEY (symbol, data_type, day)
+    ) WITHOUT ROWID""",
+]
+
+# Samples within the same minute collapse to the latest one
+INSERT_SAMPLE_SQL = """
+    INSERT OR REPLACE INTO market_samples (symbol, data_type, ts, value, long_value, short_value)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+ROLLUP_1H_SQL = """
+    INSERT OR REPLACE INTO market_rollup_1h (symbol, data_type, bucket, count, sum, min, max, first, last)
+    SELECT symbol, data_type, bucket, COUNT(*), SUM(value), MIN(value), MAX(value),
+           MAX(CASE WHEN rn_first = 1 THEN value END), MAX(CASE WHEN rn_last = 1 THEN value END)
+    FROM (
+        SELECT symbol, data_type, value, ts / 3600 * 3600 AS bucket,
+               ROW_NUMBER() OVER (PARTITION BY symbol, data_type, ts / 3600 ORDER BY ts) AS rn_first,
+               ROW_NUMBER() OVER (PARTITION BY symbol, data_type, ts / 3600 ORDER BY ts DESC) AS rn_last
+        FROM market_samples WHERE ts >= ? AND ts < ?
+    )
+    GROUP BY symbol, data_type, bucket
+"""
+
+ROLLUP_1D_SQL = """
+    INSERT OR REPLACE INTO market_rollup_1d (symbol, data_type, bucket, count, sum, min, max, first, last)
+    SELECT symbol, data_type, day, SUM(count), SUM(sum), MIN(min), MAX(max),
+           MAX(CASE WHEN rn_first = 1 THEN first END), MAX(CASE WHEN rn_last = 1 THEN last END)
+    FROM (
+        SELECT symbol, data_type, count, sum, min, max, first, last, bucket / 86400 * 86400 AS day,
+               ROW_NUMBER() OVER (PARTITION BY symbol, data_type, bucket / 86400 ORDER BY bucket) AS rn_first,
+               ROW_NUMBER() OVER (PARTITION BY symbol, data_type, bucket / 86400 ORDER BY bucket DESC) AS rn_last
+        FROM market_rollup_1h WHERE bucket >= ? AND bucket < ?
+    )
+    GROUP BY symbol, data_type, day
+"""
+
+RAW_AGGREGATE_SQL = """
+    SELECT COUNT(*), AVG(value), MIN(value), MAX(value), MIN(ts), MAX(ts)
+    FROM market_samples WHERE symbol = ? AND data_type = ? AND ts >= ? AND ts < ?
+"""
+
+RAW_VALUE_AT_SQL = """
+    SELECT value FROM market_samples WHERE symbol = ? AND data_type = ? AND ts = ?
+"""
+
+ROLLUP_AGGREGATE_SQL = """
+    SELECT SUM(count), SUM(sum) / SUM(count), MIN(min), MAX(max), MIN(bucket), MAX(bucket)
+    FROM {table} WHERE symbol = ? AND data_type = ? AND bucket >= ? AND bucket < ?
+"""
+
+ROLLUP_EDGE_SQL = """
+    SELECT first, last FROM {table} WHERE symbol = ? AND data_type = ? AND bucket = ?
+"""
+
+PACK_SOURCE_SQL = """
+    SELECT symbol, data_type, ts, value, long_value, short_value FROM market_samples
+    WHERE ts >= ? AND ts < ? ORDER BY symbol, data_type, ts
+"""
+
+INSERT_BLOCK_SQL = """
+    INSERT OR REPLACE INTO market_blocks (symbol, data_type, day, count, minutes, value, long_value, short_value)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+LOAD_BLOCKS_SQL = """
+    SELECT data_type, day, minutes, value, long_value, short_value FROM market_blocks
+    WHERE symbol = ? AND day >= ? ORDER BY data_type, day
+"""
+
+WINDOW_UNITS = {"m": MINUTE, "h": HOUR, "d": DAY, "w": 7 * DAY}
+
+
+def parse_window(window: str) -> int:
+    """"90m", "24h", "7d", "2w" -> seconds"""
+    match = re.fullmatch(r"(\d+)\s*([mhdw])", window.strip().lower())
+    if not match:
+        raise ValueError(f"Finestra non valida: {window} (es. 90m, 24h, 7d, 2w)")
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+
+def sample_values(data_type: str, payload: Optional[Dict]) -> Optional[Tuple[float, Optional[float], Optional[float]]]:
+    """(value, long, short) from a CoinGlass payload, None if not numeric"""
+    if not payload or not payload.get("data"):
+        return None
+    item = payload["data"][0] or {}
+    try:
+        if data_type == "funding":
+            return float(item.get("uMarginList", [{}])[0]["rate"]), None, None
+        if data_type == "open_interest":
+            return float(item["openInterest"]), None, None
+        if data_type == "liquidation":
+            return (float(item["liquidation24h"]),
+                    float(item.get("longLiquidation") or 0), float(item.get("shortLiquidation") or 0))
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    return None
+
+
+def _ceil(ts: int, step: int) -> int:
+    """First multiple of step at or after ts"""
+    return -(-ts // step) * step
+
+
+class TimeSeriesStore:
+    """
+    Typed market samples with rollups, retention and window aggregates
+    """
+
+    def __init__(self, pool: SQLitePool):
+        self.pool = pool
+        self.raw_retention = int(float(os.getenv("TS_RETENTION_RAW_DAYS", "7")) * DAY)
+        self.hourly_retention = int(float(os.getenv("TS_RETENTION_1H_DAYS", "180")) * DAY)
+        self.block_retention = int(float(os.getenv("TS_RETENTION_BLOCK_DAYS", "365")) * DAY)
+        # Rollups are recomputed from here on; buckets before it are final
+        self._rolled_until: Optional[int] = None
+        # First day not yet packed into market_blocks
+        self._packed_until: Optional[int] = None
+
+    def record_many(self, rows: Iterable[Tuple[str, str, int, float, Optional[float], Optional[float]]]) -> int:
+        """Insert (symbol, data_type, ts, value, long, short) rows at minute resolution"""
+        batch = [(s, t, int(ts) // MINUTE * MINUTE, v, lv, sv) for s, t, ts, v, lv, sv in rows]
+        with self.pool.transaction() as conn:
+            conn.executemany(INSERT_SAMPLE_SQL, batch)
+        return len(batch)
+
+    def rollup(self, now: Optional[int] = None):
+        """Refresh hourly and daily rollups for every bucket touched since the last run"""
+        now = int(now or time.time())
+        if self._rolled_until is None:
+            # Fresh process: raw samples before the retention cutoff may already be
+            # pruned, so the buckets holding it are final and must not be rebuilt
+            cutoff = now - self.raw_retention
+            hour_start, day_start = _ceil(cutoff, HOUR), _ceil(cutoff, DAY)
+        else:
+            hour_start = self._rolled_until // HOUR * HOUR
+            day_start = self._rolled_until // DAY * DAY
+        with self.pool.transaction() as conn:
+            conn.execute(ROLLUP_1H_SQL, (hour_start, now + 1))
+            conn.execute(ROLLUP_1D_SQL, (day_start, now + 1))
+        # The current hour/day is still open: include it again next time
+        self._rolled_until = now // HOUR * HOUR
+
+    def pack_blocks(self, now: Optional[int] = None) -> int:
+        """Pack every closed day since the last run into market_blocks; returns blocks written"""
+        now = int(now or time.time())
+        start = self._packed_until
+        if start is None:
+            # Same as rollup: the day holding the retention cutoff is already packed
+            start = _ceil(now - self.raw_retention, DAY)
+        end = now // DAY * DAY  # today is still open
+
+        blocks = []
+        rows = self.pool.connection().execute(PACK_SOURCE_SQL, (start, end))
+        for (symbol, data_type, day), group in itertools.groupby(rows, key=lambda r: (r[0], r[1], r[2] // DAY * DAY)):
+            group = list(group)
+            longs = [r[4] for r in group]
+            shorts = [r[5] for r in group]
+            blocks.append((
+                symbol, data_type, day, len(group),
+                array("H", [(r[2] - day) // MINUTE for r in group]).tobytes(),
+                array("d", [r[3] for r in group]).tobytes(),
+                array("d", [float("nan") if v is None else v for v in longs]).tobytes() if any(v is not None for v in longs) else None,
+                array("d", [float("nan") if v is None else v for v in shorts]).tobytes() if any(v is not None for v in shorts) else None,
+            ))
+        if blocks:
+            with self.pool.transaction() as conn:
+                conn.executemany(INSERT_BLOCK_SQL, blocks)
+        self._packed_until = max(start, end)
+        return len(blocks)
+
+    def load_blocks(self, symbol: str, start_day: int) -> List[Tuple]:
+        """(data_type, day, minutes, value, long, short) blocks from start_day on"""
+        return self.pool.connection().execute(LOAD_BLOCKS_SQL, (symbol, start_day)).fetchall()
+
+    def apply_retention(self, now: Optional[int] = None):
+        """Drop raw samples, hourly rollups and packed blocks past their retention"""
+        now = int(now or time.time())
+        with self.pool.transaction() as conn:
+            conn.execute("DELETE FROM market_samples WHERE ts < ?", (now - self.raw_retention,))
+            conn.execute("DELETE FROM market_rollup_1h WHERE bucket < ?", (now - self.hourly_retention,))
+            conn.execute("DELETE FROM market_blocks WHERE day < ?", (now - self.block_retention,))
+
+    def maintain(self, now: Optional[int] = None):
+        """Rollup and pack, then retention (so nothing is pruned before it is aggregated)"""
+        self.rollup(now)
+        self.pack_blocks(now)
+        self.apply_retention(now)
+
+    def resolution_for(self, start: int, now: int) -> str:
+        """Finest stored resolution covering [start, now]: 1m, 1h or 1d"""
+        if start >= now - self.raw_retention:
+            return "1m"
+        if start >= now - self.hourly_retention:
+            return "1h"
+        return "1d"
+
+    def aggregate(self, symbol: str, data_type: str, window: int, now: Optional[int] = None) -> Optional[Dict]:
+        """
+        Mean, min/max and change over the last `window` seconds, from the
+        finest resolution that still covers the whole window
+        """
+        now = int(now or time.time())
+        start = now - window
+        resolution = self.resolution_for(start, now)
+        conn = self.pool.connection()
+
+        if resolution == "1m":
+            count, mean, low, high, first_ts, last_ts = conn.execute(
+                RAW_AGGREGATE_SQL, (symbol, data_type, start, now + 1)
+            ).fetchone()
+            if not count:
+                return None
+            first = conn.execute(RAW_VALUE_AT_SQL, (symbol, data_type, first_ts)).fetchone()[0]
+            last = conn.execute(RAW_VALUE_AT_SQL, (symbol, data_type, last_ts)).fetchone()[0]
+        else:
+            table = "market_rollup_1h" if resolution == "1h" else "market_rollup_1d"
+            bucket = HOUR if resolution == "1h" else DAY
+            count, mean, low, high, first_ts, last_ts = conn.execute(
+                ROLLUP_AGGREGATE_SQL.format(table=table), (symbol, data_type, start // bucket * bucket, now + 1)
+            ).fetchone()
+            if not count:
+                return None
+            edge = ROLLUP_EDGE_SQL.format(table=table)
+            first = conn.execute(edge, (symbol, data_type, first_ts)).fetchone()[0]
+            last = conn.execute(edge, (symbol, data_type, last_ts)).fetchone()[1]
+
+        return {
+            "symbol": symbol,
+            "data_type": data_type,
+            "resolution": resolution,
+            "count": count,
+            "mean": mean,
+            "min": low,
+            "max": high,
+            "first": first,
+            "last": last,
+            "change": last - first,
+            "change_pct": (last - first) / abs(first) * 100 if first else None,
+            "from": first_ts,
+            "to": last_ts,
+        }